@@ -0,0 +1,23 @@
+from django.contrib import admin
+from .models import BookStat, Event, RollupCursor
+
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'book_id', 'user_id', 'created_at')
+    list_filter = ('kind',)
+    readonly_fields = ('kind', 'book', 'user', 'created_at')
+    raw_id_fields = ('book', 'user')
+
+
+@admin.register(BookStat)
+class BookStatAdmin(admin.ModelAdmin):
+    list_display = ('book', 'period', 'bucket', 'views', 'reads', 'favourites', 'reviews', 'purchases')
+    list_filter = ('period',)
+    raw_id_fields = ('book',)
+    date_hierarchy = 'bucket'
+
+
+@admin.register(RollupCursor)
+class RollupCursorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'position', 'updated_at')
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished
+
+
+class AnalyticsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'analytics'
+
+    def ready(self):
+        from . import events
+        # Idle workers still write their buffered events once the interval passes
+        request_finished.connect(events.flush_if_due, dispatch_uid='analytics_flush_events')
@@ -0,0 +1,90 @@
+"""
+Batched writes to the append-only event log.
+
+record() appends to an in-process buffer once the surrounding transaction
+commits, so events for rolled-back favourites or reviews are never logged.
+The buffer is written with one bulk_create() once it holds
+ANALYTICS_EVENT_BUFFER_SIZE events or ANALYTICS_EVENT_FLUSH_INTERVAL seconds
+have passed since the last write, checked on each record() and at the end of
+every request, and again when the process exits. A hard-killed worker loses
+at most one interval of events, which is acceptable for statistics.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from config.routers import unpinned_writes
+from config.sqlite.retry import call_with_retry
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _due():
+    size = getattr(settings, 'ANALYTICS_EVENT_BUFFER_SIZE', 500)
+    interval = getattr(settings, 'ANALYTICS_EVENT_FLUSH_INTERVAL', 10)
+    return len(_buffer) >= size or (_buffer and time.monotonic() - _last_flush >= interval)
+
+
+def _append(kind, book_id, user_id, created_at):
+    with _lock:
+        _buffer.append(Event(kind=kind, book_id=book_id, user_id=user_id, created_at=created_at))
+        due = _due()
+    if due:
+        flush()
+
+
+def record(kind, book_id, user=None):
+    """Log one event; `user` is a User, a user ID or None for anonymous visitors"""
+    user_id = getattr(user, 'pk', user) if getattr(user, 'is_authenticated', True) else None
+    created_at = timezone.now()
+    transaction.on_commit(lambda: _append(kind, book_id, user_id, created_at))
+
+
+def pending():
+    """Number of events buffered in this process"""
+    return len(_buffer)
+
+
+def flush():
+    """Write this process's buffered events. Returns the number written."""
+    global _last_flush
+    with _lock:
+        batch = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+    try:
+        with unpinned_writes():
+            call_with_retry(Event.objects.bulk_create, batch)
+    except DatabaseError:
+        # Statistics are best-effort; never fail the request that triggered the flush
+        logger.exception(f"Dropped {len(batch)} analytics events")
+        return 0
+    logger.info(f"Wrote {len(batch)} analytics events")
+    return len(batch)
+
+
+def flush_if_due(**kwargs):
+    if _due():
+        flush()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write analytics events at exit")
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from analytics import rollup
+
+
+class Command(BaseCommand):
+    help = 'Fold new analytics events into the hourly and daily per-book stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Event IDs per transaction')
+        parser.add_argument(
+            '--lag', type=int, default=None,
+            help='Only roll up event IDs seen this many seconds ago (default: ANALYTICS_ROLLUP_LAG)',
+        )
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='Also delete rolled-up events older than ANALYTICS_EVENT_RETENTION_DAYS',
+        )
+        parser.add_argument('--days', type=int, default=None, help='Retention for --purge, in days')
+
+    def handle(self, *args, **options):
+        processed = rollup.rollup(batch_size=options['batch_size'], lag=options['lag'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} events.'))
+        if options['purge']:
+            deleted = rollup.purge(days=options['days'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} old events.'))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupcursor',
+            name='horizon',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rollupcursor',
+            name='horizon_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from books.models import Book
+
+
+class Event(models.Model):
+    """
+    Append-only log of user activity on books.
+
+    Rows are only ever inserted (in batches, see analytics/events.py) and read
+    in primary-key order by the rollup, so there are no secondary indexes and
+    no foreign-key constraints: events outlive deleted books and users.
+    """
+    VIEW = 'view'
+    READ = 'read'
+    FAVOURITE = 'favourite'
+    REVIEW = 'review'
+    PURCHASE = 'purchase'
+    KIND_CHOICES = [
+        (VIEW, 'View'),
+        (READ, 'Read'),
+        (FAVOURITE, 'Favourite'),
+        (REVIEW, 'Review'),
+        (PURCHASE, 'Purchase'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+',
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.kind} book={self.book_id} at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class BookStat(models.Model):
+    """Per-book event counts for one hour or one day, maintained by analytics.rollup"""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='stats')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text='Start of the hour or day (UTC)')
+    views = models.PositiveIntegerField(default=0)
+    reads = models.PositiveIntegerField(default=0)
+    favourites = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    purchases = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['period', 'bucket']
+        constraints = [
+            # Also serves per-book charts: book_id, period, bucket range
+            models.UniqueConstraint(fields=['book', 'period', 'bucket'], name='bookstat_book_period_bucket_uniq'),
+        ]
+        indexes = [
+            # Trending and site-wide charts: every book in a bucket range
+            models.Index(fields=['period', 'bucket'], name='bookstat_period_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class RollupCursor(models.Model):
+    """Highest Event id already folded into BookStat"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    # Highest Event id seen at horizon_at; rolled up once ANALYTICS_ROLLUP_LAG has passed
+    horizon = models.BigIntegerField(default=0)
+    horizon_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
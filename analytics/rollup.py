@@ -0,0 +1,213 @@
+"""
+Hourly and daily per-book aggregates of the event log.
+
+rollup() folds events past the stored cursor into BookStat rows, one GROUP BY
+per batch of event IDs, and upserts the totals with
+bulk_create(update_conflicts=True). Events are never scanned twice, so
+`manage.py rollup_events` can run every few minutes from cron. The read
+helpers below only touch BookStat through its (period, bucket) index.
+
+Event IDs are taken when a row is inserted but become visible when its
+transaction commits, so on PostgreSQL a lower ID can appear after a higher
+one and a cursor at the highest visible ID would skip it for good. Each run
+therefore records the highest ID it sees and only rolls up to an ID recorded
+at least ANALYTICS_ROLLUP_LAG seconds earlier, by which time every lower ID
+has committed. SQLite commits one writer at a time, in ID order, so a lag of
+0 is safe there and rolls up to the current highest ID.
+
+Buckets are UTC hours and days.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from books import page_cache
+from books.models import Book
+from config.sqlite.retry import retry_on_locked
+from .models import BookStat, Event, RollupCursor
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = 'book_stats'
+KIND_FIELDS = {
+    Event.VIEW: 'views',
+    Event.READ: 'reads',
+    Event.FAVOURITE: 'favourites',
+    Event.REVIEW: 'reviews',
+    Event.PURCHASE: 'purchases',
+}
+STAT_FIELDS = tuple(KIND_FIELDS.values())
+# How much one event of each kind counts towards "trending"
+TRENDING_WEIGHTS = {'views': 1, 'reads': 3, 'favourites': 5, 'reviews': 5, 'purchases': 10}
+
+
+def _day(bucket):
+    return bucket.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _upsert(deltas):
+    """Add {(book_id, period, bucket): {field: n}} to the stored counts"""
+    by_period = defaultdict(lambda: (set(), set()))
+    for book_id, period, bucket in deltas:
+        book_ids, buckets = by_period[period]
+        book_ids.add(book_id)
+        buckets.add(bucket)
+    match = Q()
+    for period, (book_ids, buckets) in by_period.items():
+        match |= Q(period=period, book_id__in=book_ids, bucket__in=buckets)
+
+    # bulk_create(update_conflicts) can only set columns, not add to them,
+    # so read the current counts in the same transaction
+    existing = {
+        (stat['book_id'], stat['period'], stat['bucket']): stat
+        for stat in BookStat.objects.filter(match).order_by().values('book_id', 'period', 'bucket', *STAT_FIELDS)
+    }
+    rows = []
+    for key, counts in deltas.items():
+        stored = existing.get(key, {})
+        book_id, period, bucket = key
+        rows.append(BookStat(
+            book_id=book_id, period=period, bucket=bucket,
+            **{field: stored.get(field, 0) + counts.get(field, 0) for field in STAT_FIELDS},
+        ))
+    BookStat.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['book', 'period', 'bucket'],
+        update_fields=list(STAT_FIELDS),
+    )
+
+
+@retry_on_locked
+def _horizon(lag):
+    """Highest event ID that is safe to roll up (see the module docstring)"""
+    latest = Event.objects.aggregate(end=Max('id'))['end'] or 0
+    if lag <= 0:
+        return latest
+    now = timezone.now()
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+        if cursor.horizon_at is not None and cursor.horizon_at > now - timedelta(seconds=lag):
+            # The recorded ID isn't old enough yet; nothing to do this run
+            return cursor.position
+        end = cursor.horizon
+        cursor.horizon, cursor.horizon_at = latest, now
+        cursor.save(update_fields=['horizon', 'horizon_at', 'updated_at'])
+    return end
+
+
+@retry_on_locked
+def _rollup_batch(end, batch_size):
+    """Fold the next batch of events up to ID `end`; returns the count, or None when caught up"""
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+        start = cursor.position
+        if start >= end:
+            return None
+        stop = min(start + batch_size, end)
+        grouped = (
+            Event.objects.filter(id__gt=start, id__lte=stop)
+            .annotate(hour=TruncHour('created_at'))
+            .values('book_id', 'kind', 'hour')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        processed = 0
+        deltas = defaultdict(lambda: defaultdict(int))
+        for row in grouped:
+            field = KIND_FIELDS.get(row['kind'])
+            if field is None:
+                continue
+            deltas[(row['book_id'], BookStat.HOUR, row['hour'])][field] += row['n']
+            deltas[(row['book_id'], BookStat.DAY, _day(row['hour']))][field] += row['n']
+            processed += row['n']
+
+        # Events of books deleted since they were logged are dropped
+        live_books = set(
+            Book.objects.filter(pk__in={key[0] for key in deltas}).order_by().values_list('pk', flat=True)
+        )
+        deltas = {key: counts for key, counts in deltas.items() if key[0] in live_books}
+        if deltas:
+            _upsert(deltas)
+        cursor.position = stop
+        cursor.save(update_fields=['position', 'updated_at'])
+    return processed
+
+
+def rollup(batch_size=None, lag=None):
+    """
+    Fold events logged since the last run into BookStat, up to the highest
+    ID seen at least `lag` seconds ago. Returns the number of events processed.
+    """
+    batch_size = batch_size or getattr(settings, 'ANALYTICS_ROLLUP_BATCH_SIZE', 50000)
+    lag = lag if lag is not None else getattr(settings, 'ANALYTICS_ROLLUP_LAG', 60)
+    # Events past this point are left for a later run
+    end = _horizon(lag)
+    processed = 0
+    while (batch := _rollup_batch(end, batch_size)) is not None:
+        processed += batch
+
+    if processed:
+        page_cache.bump('trending')
+    logger.info(f"Rolled up {processed} events")
+    return processed
+
+
+def purge(days=None):
+    """Delete rolled-up events older than ANALYTICS_EVENT_RETENTION_DAYS"""
+    days = days if days is not None else getattr(settings, 'ANALYTICS_EVENT_RETENTION_DAYS', 90)
+    position = RollupCursor.objects.filter(name=CURSOR_NAME).values_list('position', flat=True).first() or 0
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Event.objects.filter(id__lte=position, created_at__lt=cutoff).delete()
+    return deleted
+
+
+def trending(days=None, limit=6):
+    """Approved books with the highest weighted activity over the last `days` days, best first"""
+    days = days or getattr(settings, 'ANALYTICS_TRENDING_DAYS', 7)
+    since = _day(timezone.now()) - timedelta(days=days - 1)
+    score = sum(F(field) * weight for field, weight in TRENDING_WEIGHTS.items())
+    ranked = list(
+        BookStat.objects.filter(period=BookStat.DAY, bucket__gte=since, book__is_approved=True)
+        .values('book_id')
+        .annotate(score=Sum(score))
+        .filter(score__gt=0)
+        .order_by('-score', 'book_id')
+        .values_list('book_id', flat=True)[:limit]
+    )
+    books = Book.objects.in_bulk(ranked)
+    return [books[book_id] for book_id in ranked if book_id in books]
+
+
+def totals(period=BookStat.DAY, since=None, book=None):
+    """
+    Site-wide (or one book's) counts per bucket since `since`, oldest first:
+    [{'bucket': datetime, 'views': n, ...}, ...]
+    """
+    stats = BookStat.objects.filter(period=period)
+    if since is not None:
+        stats = stats.filter(bucket__gte=since)
+    if book is not None:
+        stats = stats.filter(book=book)
+    return list(
+        stats.values('bucket')
+        .annotate(**{field: Sum(field) for field in STAT_FIELDS})
+        .order_by('bucket')
+    )
+
+
+def daily_activity(days=14, book=None):
+    """totals() for the last `days` UTC days, with empty days filled in as zeros"""
+    first = _day(timezone.now()) - timedelta(days=days - 1)
+    found = {row['bucket']: row for row in totals(BookStat.DAY, since=first, book=book)}
+    series = []
+    for offset in range(days):
+        bucket = first + timedelta(days=offset)
+        series.append(found.get(bucket) or {'bucket': bucket, **dict.fromkeys(STAT_FIELDS, 0)})
+    return series
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from books.models import Book
+from users.models import User
+from .models import BookStat, Event, RollupCursor
+from . import events, rollup
+
+
+def make_book(title, **kwargs):
+    kwargs.setdefault('is_approved', True)
+    return Book.objects.create(
+        title=title, author='Author', description='d', category='History',
+        pdf_file=f'pdfs/{title}.pdf', **kwargs,
+    )
+
+
+@override_settings(ANALYTICS_EVENT_BUFFER_SIZE=1000, ANALYTICS_EVENT_FLUSH_INTERVAL=3600, ANALYTICS_ROLLUP_LAG=0)
+class EventLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'password123')
+        cls.book = make_book('Popular')
+        cls.other = make_book('Quiet')
+
+    def setUp(self):
+        # The buffer is per process: drop anything left over by other tests
+        events._buffer.clear()
+        self.addCleanup(events._buffer.clear)
+
+    def log(self, kind, book, user=None, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                events.record(kind, book.pk, user)
+
+    def test_events_are_buffered_until_commit_and_written_in_one_insert(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            events.record(Event.VIEW, self.book.pk)
+        self.assertEqual(events.pending(), 0)
+        for callback in callbacks:
+            callback()
+        self.log(Event.READ, self.book, self.user, count=3)
+        self.assertEqual(events.pending(), 4)
+        self.assertFalse(Event.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(events.flush(), 4)
+        self.assertEqual(events.pending(), 0)
+        self.assertEqual(Event.objects.filter(kind=Event.READ, user=self.user).count(), 3)
+        self.assertEqual(Event.objects.get(kind=Event.VIEW).user_id, None)
+
+    @override_settings(ANALYTICS_EVENT_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        self.log(Event.VIEW, self.book, count=3)
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(events.pending(), 1)
+
+    def test_rollup_builds_hourly_and_daily_counts_incrementally(self):
+        hour = datetime(2026, 3, 10, 14, tzinfo=dt_timezone.utc)
+        at = [hour + timedelta(minutes=5 * i) for i in range(3)]
+        Event.objects.bulk_create(
+            [Event(kind=Event.VIEW, book=self.book, created_at=when) for when in at]
+            + [
+                Event(kind=Event.FAVOURITE, book=self.book, user=self.user, created_at=at[0]),
+                Event(kind=Event.VIEW, book=self.other, created_at=at[1]),
+                # Same day, earlier hour
+                Event(kind=Event.VIEW, book=self.book, created_at=hour - timedelta(hours=3)),
+            ]
+        )
+
+        self.assertEqual(rollup.rollup(batch_size=2), 6)
+        self.assertEqual(RollupCursor.objects.get().position, Event.objects.latest('id').pk)
+        day = BookStat.objects.get(book=self.book, period=BookStat.DAY)
+        self.assertEqual(day.bucket, datetime(2026, 3, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual((day.views, day.favourites), (4, 1))
+        hourly = BookStat.objects.get(book=self.book, period=BookStat.HOUR, bucket=hour)
+        self.assertEqual((hourly.views, hourly.favourites), (3, 1))
+        self.assertEqual(BookStat.objects.filter(period=BookStat.HOUR).count(), 3)
+
+        # Nothing new: the event log is not scanned again
+        self.assertEqual(rollup.rollup(), 0)
+        Event.objects.create(kind=Event.VIEW, book=self.book, created_at=at[2])
+        self.assertEqual(rollup.rollup(), 1)
+        hourly.refresh_from_db()
+        day.refresh_from_db()
+        self.assertEqual((hourly.views, day.views), (4, 5))
+
+    def test_rollup_waits_out_the_lag_before_passing_an_id(self):
+        first = Event.objects.create(kind=Event.VIEW, book=self.book)
+        now = timezone.now()
+        # The first run only records the highest ID it sees
+        self.assertEqual(rollup.rollup(lag=60), 0)
+        # Logged after the highest ID was recorded: left for a later run
+        Event.objects.create(kind=Event.VIEW, book=self.book)
+        self.assertEqual(rollup.rollup(lag=60), 0)
+
+        with mock.patch.object(rollup.timezone, 'now', return_value=now + timedelta(seconds=61)):
+            self.assertEqual(rollup.rollup(lag=60), 1)
+        self.assertEqual(RollupCursor.objects.get().position, first.pk)
+        with mock.patch.object(rollup.timezone, 'now', return_value=now + timedelta(seconds=122)):
+            self.assertEqual(rollup.rollup(lag=60), 1)
+        self.assertEqual(BookStat.objects.get(book=self.book, period=BookStat.DAY).views, 2)
+
+    def test_rollup_skips_events_of_deleted_books(self):
+        gone = make_book('Gone')
+        self.log(Event.VIEW, gone)
+        self.log(Event.VIEW, self.book)
+        events.flush()
+        gone_id = gone.pk
+        gone.delete()
+        self.assertTrue(Event.objects.filter(book_id=gone_id).exists())
+        rollup.rollup()
+        self.assertEqual(set(BookStat.objects.values_list('book_id', flat=True)), {self.book.pk})
+
+    def test_trending_ranks_by_weighted_activity(self):
+        hidden = make_book('Hidden', is_approved=False)
+        self.log(Event.VIEW, self.book, count=4)
+        self.log(Event.PURCHASE, self.other, self.user)
+        self.log(Event.PURCHASE, hidden, self.user, count=3)
+        # Outside the window
+        Event.objects.create(kind=Event.PURCHASE, book=self.book, created_at=timezone.now() - timedelta(days=10))
+        events.flush()
+        rollup.rollup()
+
+        self.assertEqual(rollup.trending(days=7), [self.other, self.book])
+        with self.assertNumQueries(2):
+            rollup.trending(days=7, limit=1)
+
+        activity = rollup.daily_activity(days=14)
+        self.assertEqual(len(activity), 14)
+        self.assertEqual(activity[-1]['views'], 4)
+        self.assertEqual(activity[0]['views'], 0)
+
+    def test_purge_keeps_events_not_rolled_up(self):
+        old = timezone.now() - timedelta(days=100)
+        Event.objects.create(kind=Event.VIEW, book=self.book, created_at=old)
+        rollup.rollup()
+        Event.objects.create(kind=Event.VIEW, book=self.book, created_at=old)
+        self.assertEqual(rollup.purge(days=90), 1)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_views_log_events(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('toggle_favourite', args=[self.book.pk]))
+            self.client.post(reverse('toggle_favourite', args=[self.book.pk]))
+            self.client.post(reverse('add_review', args=[self.book.pk]), {'rating': 4, 'comment': 'Good'})
+            self.client.get(reverse('book_detail', args=[self.book.pk]))
+        events.flush()
+        # Un-favouriting is not an event
+        self.assertEqual(
+            sorted(Event.objects.values_list('kind', flat=True)),
+            [Event.FAVOURITE, Event.REVIEW, Event.VIEW],
+        )
+        self.assertEqual(set(Event.objects.values_list('user_id', flat=True)), {self.user.pk})
@@ -8,7 +8,7 @@ class BookAdmin(admin.ModelAdmin):
     list_filter = ('category', 'type', 'is_approved', 'created_at')
     search_fields = ('title', 'author', 'description')
     list_editable = ('is_approved',)
-    readonly_fields = ('view_count', 'created_at', 'updated_at')
+    readonly_fields = ('view_count', 'rating_sum', 'rating_count', 'favourite_count', 'read_count', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Basic Information', {
@@ -20,6 +20,9 @@ class BookAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('is_approved', 'view_count')
         }),
+        ('Statistics', {
+            'fields': ('rating_sum', 'rating_count', 'favourite_count', 'read_count')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
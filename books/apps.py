@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        from . import checks, signals, view_counter  # noqa: F401
+        # Idle workers still write their buffered views once the interval passes
+        request_finished.connect(view_counter.flush_if_due, dispatch_uid='books_flush_view_counts')
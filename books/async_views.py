@@ -0,0 +1,95 @@
+"""
+Async versions of the protected PDF views, for ASGI deployments.
+
+With PDF_ASYNC_DELIVERY enabled, books/urls.py routes the PDF and page URLs
+here. The access checks use the async ORM and cache APIs, and the file is
+streamed by an async iterator (pdf_delivery.abuild_file_response), so a slow
+reader costs an open file descriptor and a few buffered chunks rather than a
+thread. Under WSGI keep the sync views: Django would buffer the whole async
+body in memory to serve it.
+"""
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+
+from payments import entitlements
+from . import page_slices
+from .models import Book
+from .pdf_delivery import (
+    DELIVERY_DJANGO, abuild_file_response, build_offload_response, get_delivery_mode, run_io,
+)
+from .views import protect_pdf_page_response, protect_pdf_response
+
+logger = logging.getLogger(__name__)
+
+
+def _load_user(request):
+    # request.user is a lazy object backed by the session; resolve it once, off the event loop
+    user = request.user
+    user.is_authenticated
+    return user
+
+
+async def _readable_book(user, book_id):
+    """The book if `user` may read it, else raise Http404"""
+    try:
+        book = await Book.objects.aget(id=book_id, is_approved=True)
+    except Book.DoesNotExist:
+        raise Http404("No Book matches the given query.")
+    if not await entitlements.acan_read(user, book):
+        logger.warning(f"User {user.userId} attempted to access unpaid book {book_id}")
+        raise Http404("This is a paid book. Purchase required to access.")
+    if not book.pdf_file:
+        logger.error(f"Book {book_id} has no PDF file attached")
+        raise Http404("PDF file not found.")
+    return book
+
+
+async def _file_response(request, path):
+    delivery_mode = get_delivery_mode()
+    if delivery_mode != DELIVERY_DJANGO:
+        # The front server streams the file; nothing to gain from async I/O here
+        if not await run_io(os.path.exists, path):
+            raise FileNotFoundError(path)
+        return build_offload_response(path, delivery_mode, content_type='application/pdf')
+    return await abuild_file_response(request, path, content_type='application/pdf')
+
+
+async def serve_pdf(request, book_id):
+    """Async counterpart of views.serve_pdf"""
+    user = await sync_to_async(_load_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        book = await _readable_book(user, book_id)
+        try:
+            response = await _file_response(request, book.pdf_file.path)
+        except FileNotFoundError:
+            logger.error(f"PDF file not found at path: {book.pdf_file.path}")
+            raise Http404("PDF file not found.")
+        protect_pdf_response(response, book)
+        logger.info(f"PDF served ({response.status_code}) for book {book_id} to user {user.userId}")
+        return response
+    except Http404:
+        raise
+    except Exception as e:
+        logger.exception(f"Error serving PDF for book {book_id}: {str(e)}")
+        raise Http404("An error occurred while loading the PDF.")
+
+
+async def serve_pdf_page(request, book_id, number):
+    """Async counterpart of views.serve_pdf_page"""
+    user = await sync_to_async(_load_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    book = await _readable_book(user, book_id)
+    storage = book.pdf_file.storage
+    path = storage.path(page_slices.slice_name(book.pdf_file.name, number))
+    try:
+        response = await _file_response(request, path)
+    except FileNotFoundError:
+        raise Http404("Page not found.")
+    return protect_pdf_page_response(response)
@@ -0,0 +1,26 @@
+"""
+System checks for the books app, run by `manage.py check` and before
+runserver/migrate. Commands that skip checks, such as createcachetable,
+still work with a misconfigured cache.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+from config.cache_backends import has_atomic_incr
+
+
+@checks.register(checks.Tags.caches)
+def check_view_count_cache(app_configs=None, **kwargs):
+    """VIEW_COUNT_CACHE needs atomic incr()/decr() or concurrent views overwrite each other"""
+    name = getattr(settings, 'VIEW_COUNT_CACHE', 'counters')
+    if name not in settings.CACHES:
+        return [checks.Error(f"VIEW_COUNT_CACHE ({name!r}) is not in CACHES", id='books.E001')]
+    cache = caches[name]
+    if has_atomic_incr(cache):
+        return []
+    return [checks.Error(
+        f"VIEW_COUNT_CACHE ({name!r}) uses {cache.__class__.__name__}, whose incr() is not atomic",
+        hint=f"Unset CACHE_{name.upper()}_BACKEND to keep it on locmem, or set it to redis",
+        id='books.E001',
+    )]
@@ -0,0 +1,57 @@
+"""
+Denormalized aggregate counters on Book.
+
+Views adjust the counters with F() expressions inside the same transaction
+as the row they create or delete, so concurrent requests never lose updates.
+rebuild_counters() recomputes them from the source tables when they drift
+(e.g. after bulk deletes that bypass the views).
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Book
+
+COUNTER_FIELDS = ('rating_sum', 'rating_count', 'favourite_count', 'read_count')
+
+
+def adjust_counters(book_id, **deltas):
+    """Atomically add deltas to counter fields, e.g. adjust_counters(1, rating_count=1)"""
+    updates = {}
+    for field, delta in deltas.items():
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter field: {field}")
+        if delta:
+            updates[field] = F(field) + delta
+    if updates:
+        Book.objects.filter(pk=book_id).update(**updates)
+
+
+def _aggregate(model, expression):
+    """Correlated subquery returning one aggregate of `model` rows for the outer book"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(book=OuterRef('pk'))
+            .order_by()
+            .values('book')
+            .annotate(value=expression)
+            .values('value'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def rebuild_counters(queryset=None):
+    """Recompute all counters from reviews, favourites and reading history. Returns rows updated."""
+    from reviews.models import Review
+    from favourites.models import Favourite
+    from history.models import ReadingHistory
+
+    if queryset is None:
+        queryset = Book.objects.all()
+    return queryset.update(
+        rating_sum=_aggregate(Review, Sum('rating')),
+        rating_count=_aggregate(Review, Count('id')),
+        favourite_count=_aggregate(Favourite, Count('id')),
+        read_count=_aggregate(ReadingHistory, Count('id')),
+    )
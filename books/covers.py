@@ -0,0 +1,106 @@
+"""
+Resized WebP/JPEG renditions of book cover images.
+
+Each cover gets one rendition per width in COVER_WIDTHS and format in
+COVER_FORMATS, stored next to the original as
+covers/<name>-<width>w.<ext>. Renditions are never upscaled past the original.
+The {% cover_img %} template tag (books/templatetags/covers.py) turns them
+into a <picture> element with srcset.
+"""
+import logging
+import os
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .storage import derived_storage
+
+logger = logging.getLogger(__name__)
+
+COVER_WIDTHS = (160, 320, 640)
+# Preferred format first; the last one is the <img> fallback
+COVER_FORMATS = ('webp', 'jpeg')
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+QUALITY = {'webp': 80, 'jpeg': 82}
+
+_RENDITION_RE = re.compile(r'-\d+w\.(?:%s)$' % '|'.join(EXTENSIONS.values()))
+
+
+def rendition_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}-{width}w.{EXTENSIONS[fmt]}'
+
+
+def is_rendition(name):
+    return bool(_RENDITION_RE.search(name))
+
+
+def _to_rgb(image):
+    """Flatten transparency onto white; JPEG has no alpha channel"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def has_renditions(name, storage=default_storage):
+    return storage.exists(rendition_name(name, COVER_WIDTHS[0], COVER_FORMATS[0]))
+
+
+def generate_renditions(name, storage=default_storage, force=False):
+    """
+    Create all renditions for the cover stored at `name`.
+    Returns the list of rendition names written.
+    """
+    if not name:
+        return []
+    if not force and has_renditions(name, storage):
+        return []
+
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = _to_rgb(image)
+
+    # Renditions are named after the original, not by their own content
+    target_storage = derived_storage(storage)
+    written = []
+    for width in COVER_WIDTHS:
+        # Small originals are never upscaled; the file keeps its nominal width name
+        pixel_width = min(width, image.width)
+        height = max(1, round(image.height * pixel_width / image.width))
+        resized = image.resize((pixel_width, height), Image.Resampling.LANCZOS)
+        for fmt in COVER_FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=QUALITY[fmt], optimize=True)
+            target = rendition_name(name, width, fmt)
+            if target_storage.exists(target):
+                target_storage.delete(target)
+            target_storage.save(target, ContentFile(buffer.getvalue()))
+            written.append(target)
+    logger.info(f"Generated {len(written)} cover renditions for {name}")
+    return written
+
+
+def delete_renditions(name, storage=default_storage):
+    for width in COVER_WIDTHS:
+        for fmt in COVER_FORMATS:
+            target = rendition_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def renditions(name, storage=default_storage):
+    """{format: [(url, width), ...]} for the renditions that exist on disk"""
+    found = {}
+    for fmt in COVER_FORMATS:
+        for width in COVER_WIDTHS:
+            target = rendition_name(name, width, fmt)
+            if storage.exists(target):
+                found.setdefault(fmt, []).append((storage.url(target), width))
+    return found
@@ -0,0 +1,87 @@
+"""
+Precomputed author/category/type facets for the catalogue filter sidebar.
+
+The approved catalogue is summarised once into a small "cube" of
+(author, category, type, count) rows and cached in FACET_CACHE. Facet counts
+for the current filters are then derived from the cube in Python, without a
+DISTINCT over the books table on every request. Each facet ignores its own
+filter, so the category counts show what picking another category would give.
+
+Book signals call invalidate() whenever a book is saved or deleted.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from .models import Book
+
+CACHE_KEY = 'book_facets:cube'
+# Only the most common authors are offered as suggestions
+AUTHOR_LIMIT = 50
+
+
+def _cache():
+    return caches[getattr(settings, 'FACET_CACHE', 'default')]
+
+
+def _build_cube(queryset):
+    return list(
+        queryset.order_by()
+        .values_list('author', 'category', 'type')
+        .annotate(count=Count('id'))
+    )
+
+
+def get_cube():
+    """Cached (author, category, type, count) rows for the approved catalogue"""
+    cache = _cache()
+    cube = cache.get(CACHE_KEY)
+    if cube is None:
+        cube = _build_cube(Book.objects.filter(is_approved=True))
+        cache.set(CACHE_KEY, cube, getattr(settings, 'FACET_CACHE_TIMEOUT', 3600))
+    return cube
+
+
+def invalidate():
+    _cache().delete(CACHE_KEY)
+
+
+def _matches(author, category, book_type, filters, skip):
+    if skip != 'author' and filters.get('author') and filters['author'].lower() not in author.lower():
+        return False
+    if skip != 'category' and filters.get('category') and filters['category'] != category:
+        return False
+    if skip != 'type' and filters.get('type') and filters['type'] != book_type:
+        return False
+    return True
+
+
+def facet_counts(filters, search_queryset=None):
+    """
+    Facet counts for the given filters ({'author': ..., 'category': ..., 'type': ...}).
+
+    When a text search is active, pass the search-filtered queryset (before
+    facet filters); its cube is built with one GROUP BY over the matching rows
+    instead of using the cached catalogue cube.
+    """
+    if search_queryset is not None:
+        cube = _build_cube(Book.objects.filter(pk__in=search_queryset.order_by().values('pk')))
+    else:
+        cube = get_cube()
+
+    counts = {'author': Counter(), 'category': Counter(), 'type': Counter()}
+    for author, category, book_type, count in cube:
+        if _matches(author, category, book_type, filters, 'author'):
+            counts['author'][author] += count
+        if _matches(author, category, book_type, filters, 'category'):
+            counts['category'][category] += count
+        if _matches(author, category, book_type, filters, 'type'):
+            counts['type'][book_type] += count
+
+    return {
+        'author': counts['author'].most_common(AUTHOR_LIMIT),
+        'category': dict(counts['category']),
+        'type': dict(counts['type']),
+    }
@@ -1,16 +1,14 @@
 from django import forms
-from .models import Book
+from .models import Book, ChunkedUpload
 
 
 class BookForm(forms.ModelForm):
+    # Set by the chunked uploader on the form page instead of posting the PDF itself
+    pdf_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    
     class Meta:
         model = Book
         fields = ['title', 'author', 'description', 'category', 'type', 'cover_image', 'pdf_file', 'is_approved']
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Make cover_image optional
-        self.fields['cover_image'].required = False
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent'
@@ -39,4 +37,38 @@ class BookForm(forms.ModelForm):
                 'class': 'w-5 h-5 text-blue-600 border-gray-300 rounded focus:ring-blue-500'
             }),
         }
-
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Make cover_image optional
+        self.fields['cover_image'].required = False
+        # The PDF may arrive through a chunked upload instead; clean() checks one is present
+        self.fields['pdf_file'].required = False
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('pdf_upload')
+        self.completed_upload = None
+        if upload_id:
+            try:
+                self.completed_upload = ChunkedUpload.objects.get(pk=upload_id, status=ChunkedUpload.STATUS_COMPLETE)
+            except ChunkedUpload.DoesNotExist:
+                self.add_error('pdf_file', 'The uploaded PDF could not be found; please upload it again.')
+        elif not cleaned_data.get('pdf_file') and not self.instance.pdf_file:
+            self.add_error('pdf_file', 'This field is required.')
+        return cleaned_data
+    
+    def save(self, commit=True):
+        book = super().save(commit=False)
+        if self.completed_upload is not None:
+            # Already in the blob store; just point the book at it
+            book.pdf_file.name = self.completed_upload.file_name
+        if commit:
+            if book._state.adding:
+                book.save()
+            else:
+                # Leave the counters, which change under us through F() updates, as they are in the database
+                book.save(update_fields=[*self._meta.fields, 'updated_at'])
+            if self.completed_upload is not None:
+                self.completed_upload.delete()
+        return book
@@ -0,0 +1,205 @@
+"""
+Bulk catalogue import from a manifest plus a directory of PDFs and covers.
+
+The manifest is CSV with a header row or JSON Lines, one book per row with
+`title`, `author`, `description`, `category`, `pdf` and optionally `type`,
+`cover` and `is_approved`; file paths are relative to the files directory.
+A thread pool hashes each file and copies it into the content-addressed blob
+store (skipping the copy when the blob already exists), and each batch of
+books is inserted with one bulk_create(). A row whose PDF is already in the
+catalogue, by SHA-256, is skipped, so an interrupted import can simply be run
+again.
+
+bulk_create() doesn't send the Book save signals, so each batch does their
+work itself: it indexes the new books for search and queues
+process_book_upload for them, and the catalogue caches are invalidated once
+at the end.
+"""
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from config.sqlite.retry import retry_on_locked
+from . import facets, page_cache, search, tasks
+from .models import Book
+from .page_text import file_sha256
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('title', 'author', 'description', 'category', 'type')
+# Manifest column: (Book field, blob directory)
+FILE_COLUMNS = {'pdf': ('pdf_file', 'pdfs'), 'cover': ('cover_image', 'covers')}
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+class ManifestError(Exception):
+    """A manifest row that can't be imported"""
+
+
+def read_manifest(path):
+    """
+    Yield (line number, row) for each book in a .csv or .jsonl manifest; a
+    JSON line that doesn't parse is yielded as a ManifestError instead of a dict
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.csv', '.jsonl', '.ndjson'):
+        raise ManifestError(f'Unsupported manifest {path}; use .csv or .jsonl')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if ext == '.csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = ManifestError(f'Invalid JSON: {e}')
+            yield number, row
+
+
+def build_book(row, files_dir, approve=False):
+    """An unsaved Book and {column: source path} for one manifest row; raises ManifestError"""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ManifestError('Expected an object')
+    values = {field: str(row.get(field) or '').strip() for field in TEXT_FIELDS}
+    values['type'] = values['type'] or 'free'
+    approved = row.get('is_approved')
+    if approved in (None, ''):
+        approved = approve
+    elif isinstance(approved, str):
+        approved = approved.strip().lower() in TRUE_VALUES
+    book = Book(**values, is_approved=bool(approved))
+    try:
+        book.clean_fields(exclude=[field for field, _ in FILE_COLUMNS.values()])
+    except ValidationError as e:
+        raise ManifestError('; '.join(f'{field}: {" ".join(errors)}' for field, errors in e.message_dict.items()))
+
+    paths = {}
+    for column in FILE_COLUMNS:
+        name = str(row.get(column) or '').strip()
+        if not name:
+            if column == 'pdf':
+                raise ManifestError('pdf: This field is required.')
+            continue
+        path = os.path.join(files_dir, name)
+        if not os.path.isfile(path):
+            raise ManifestError(f'{column}: {name} not found')
+        paths[column] = path
+    return book, paths
+
+
+def ingest_file(path, directory, storage, dry_run=False):
+    """
+    Hash a file and copy it into the blob store unless a blob with that
+    content is already there. Returns the blob name (the name it would get, with dry_run).
+    """
+    with open(path, 'rb') as f:
+        sha256 = file_sha256(f)
+    ext = os.path.splitext(path)[1].lower()
+    name = f'{directory}/{sha256[:2]}/{sha256}{ext}'
+    if dry_run or storage.touch(name):
+        return name
+    # Copy next to the store so adopt() is a rename
+    temp_dir = storage.path(getattr(settings, 'CHUNKED_UPLOAD_DIR', 'uploads'))
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.import')
+    os.close(fd)
+    try:
+        shutil.copyfile(path, temp_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return storage.adopt(temp_path, directory, sha256, ext)
+
+
+def _ingest_files(paths, storage, dry_run):
+    # Runs in a pool thread; only touches files
+    try:
+        return {column: ingest_file(path, FILE_COLUMNS[column][1], storage, dry_run) for column, path in paths.items()}
+    except OSError as e:
+        return ManifestError(f'Could not copy files: {e}')
+
+
+@retry_on_locked
+def _save_batch(books):
+    with transaction.atomic():
+        Book.objects.bulk_create(books)
+        search.index_books(books)
+        tasks.process_book_upload.enqueue_many({'book_id': book.pk} for book in books)
+
+
+def import_books(rows, files_dir, batch_size=500, workers=None, approve=False, dry_run=False, progress=None):
+    """
+    Import (line number, row) pairs from read_manifest(). `progress` is called
+    with the running stats after each batch. Returns the stats: counts of
+    rows, imported, existing (PDF already in the catalogue or earlier in the
+    manifest) and invalid rows, plus a list of (line number, message) errors.
+    """
+    storage = blob_storage()
+    stats = {'rows': 0, 'imported': 0, 'existing': 0, 'invalid': 0, 'errors': [], 'seconds': 0}
+    started = time.monotonic()
+    seen = set()
+
+    def fail(number, error):
+        stats['invalid'] += 1
+        stats['errors'].append((number, str(error)))
+
+    def process(batch):
+        results = list(executor.map(lambda entry: _ingest_files(entry[2], storage, dry_run), batch))
+        pdf_names = [names['pdf'] for names in results if not isinstance(names, Exception)]
+        existing = set(Book.objects.filter(pdf_file__in=pdf_names).values_list('pdf_file', flat=True))
+        books = []
+        for (number, book, _), names in zip(batch, results):
+            if isinstance(names, Exception):
+                fail(number, names)
+                continue
+            if names['pdf'] in existing or names['pdf'] in seen:
+                stats['existing'] += 1
+                continue
+            seen.add(names['pdf'])
+            for column, name in names.items():
+                getattr(book, FILE_COLUMNS[column][0]).name = name
+            books.append(book)
+        if books and not dry_run:
+            _save_batch(books)
+        stats['imported'] += len(books)
+        stats['seconds'] = time.monotonic() - started
+        if progress:
+            progress(stats)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for number, row in rows:
+            stats['rows'] += 1
+            try:
+                book, paths = build_book(row, files_dir, approve)
+            except ManifestError as e:
+                fail(number, e)
+                continue
+            batch.append((number, book, paths))
+            if len(batch) >= batch_size:
+                process(batch)
+                batch = []
+        if batch:
+            process(batch)
+
+    if stats['imported'] and not dry_run:
+        facets.invalidate()
+        page_cache.bump('catalogue')
+        logger.info(f"Imported {stats['imported']} books")
+    return stats
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from config.cache_backends import STATS_FIELDS, publish_stats, read_all_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hits, misses and evictions for each named cache, summed over all processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-process', action='store_true', help='Show one table per process')
+        parser.add_argument('--reset', action='store_true', help='Delete collected stats')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Cache stats reset.'))
+            return
+
+        publish_stats()
+        processes = read_all_stats()
+        if not processes:
+            self.stdout.write('No cache stats collected yet.')
+            return
+
+        if options['per_process']:
+            for process in processes:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"Process {process['pid']}"))
+                self._write_table(process['caches'])
+            return
+
+        totals = {}
+        for process in processes:
+            for name, counts in process['caches'].items():
+                total = totals.setdefault(name, dict(dict.fromkeys(STATS_FIELDS, 0), backend=counts.get('backend', '?')))
+                for field in STATS_FIELDS:
+                    total[field] += counts.get(field, 0)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{len(processes)} process(es)'))
+        self._write_table(totals)
+
+    def _write_table(self, caches):
+        self.stdout.write(f"{'cache':<20} {'backend':<22} {'hits':>10} {'misses':>10} {'hit %':>7} {'evictions':>10}")
+        for name in sorted(caches):
+            counts = caches[name]
+            lookups = counts['hits'] + counts['misses']
+            ratio = f"{100 * counts['hits'] / lookups:.1f}" if lookups else '-'
+            backend = counts.get('backend', '?')
+            self.stdout.write(
+                f"{name:<20} {backend:<22} {counts['hits']:>10} {counts['misses']:>10} {ratio:>7} {counts['evictions']:>10}"
+            )
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from books.models import Book
+from favourites.models import Favourite
+from history.models import ReadingHistory
+from payments.models import Purchase
+from reviews.models import Review
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Show query plans (EXPLAIN) and timings for the hot query shapes of each view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Executions per query for timing')
+        parser.add_argument('--user', help='userId to use for per-user queries (default: first user)')
+        parser.add_argument('--category', default='Science', help='Category for the catalogue filter query')
+        parser.add_argument('--no-plan', action='store_true', help='Only report timings')
+        parser.add_argument('--analyze', action='store_true', help='Refresh planner statistics (ANALYZE) first')
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        if options['user']:
+            try:
+                user = User.objects.get(userId=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+        else:
+            user = User.objects.order_by('id').first()
+        book = Book.objects.filter(is_approved=True).order_by('-view_count').first()
+
+        approved = Book.objects.filter(is_approved=True)
+        queries = [
+            ('home_view: featured', approved.order_by('-view_count')[:6]),
+            ('home_view: recent', approved.order_by('-created_at')[:6]),
+            ('book_list_view: page', approved.order_by('-created_at', '-id')[:12]),
+            ('book_list_view: category', approved.filter(category=options['category']).order_by('-created_at', '-id')[:12]),
+            ('book_list_view: type', approved.filter(type='paid').order_by('-created_at', '-id')[:12]),
+            ('admin_review_list', Review.objects.select_related('book', 'user').order_by('-created_at')[:20]),
+        ]
+        if book is not None:
+            queries.append(
+                ('book_detail_view: reviews', Review.objects.filter(book=book).select_related('user').order_by('-created_at'))
+            )
+        if user is not None:
+            queries += [
+                ('favourites_list', Favourite.objects.filter(user=user).select_related('book').order_by('-created_at', '-id')[:12]),
+                ('reading_history', ReadingHistory.objects.filter(user=user).select_related('book').order_by('-last_read_at', '-id')[:12]),
+                ('entitlements', Purchase.objects.filter(user=user, is_paid=True).order_by().values_list('book_id', flat=True)),
+            ]
+        else:
+            self.stdout.write(self.style.WARNING('No users found; skipping per-user queries.'))
+
+        self.stdout.write(f'Database: {connection.vendor}, {options["iterations"]} iterations per query\n')
+        for label, queryset in queries:
+            timings = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            median = timings[len(timings) // 2] * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{label}  (median {median:.2f} ms)'))
+            if not options['no_plan']:
+                self.stdout.write(queryset.explain())
+                self.stdout.write('')
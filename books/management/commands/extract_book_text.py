@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books import page_text
+from books.models import Book
+from books.storage import blob_storage
+
+
+def _read(name, known_sha256, force):
+    # Runs in a worker process; only hashes and parses the file
+    return page_text.read_pdf(name, blob_storage(), known_sha256, force)
+
+
+class Command(BaseCommand):
+    help = 'Extract per-page text from book PDFs for search inside books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Re-extract PDFs whose content hash is unchanged')
+        parser.add_argument('--book', type=int, action='append', dest='book_ids', help='Only process these book IDs')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(pdf_file='').order_by('id')
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+        rows = list(books.values_list('id', 'pdf_file', 'page_text_sha256'))
+
+        # Workers only parse PDFs; this process does all database writes, which
+        # keeps SQLite free of write contention.
+        connections.close_all()
+        extracted = skipped = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(_read, name, known_sha256, options['force']): book_id
+                for book_id, name, known_sha256 in rows
+            }
+            for future in as_completed(futures):
+                book_id = futures[future]
+                try:
+                    sha256, pages = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Book {book_id}: {e}')
+                    continue
+                if pages is None:
+                    skipped += 1
+                    continue
+                page_text.store_pages(book_id, sha256, pages)
+                extracted += 1
+                self.stdout.write(f'Book {book_id}: {len(pages)} pages')
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted {extracted} books, {skipped} unchanged, {failed} failed.'
+        ))
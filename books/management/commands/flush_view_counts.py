@@ -0,0 +1,17 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from books import view_counter
+
+
+class Command(BaseCommand):
+    help = 'Write buffered book view counts to the database'
+
+    def handle(self, *args, **options):
+        if isinstance(view_counter._cache(), LocMemCache):
+            # This process's buffer is empty; each worker flushes its own after requests and at exit
+            raise CommandError('VIEW_COUNT_CACHE is local to each worker process; only a shared (redis) buffer can be flushed from here')
+        # Wait for a flush already running in a worker rather than skip
+        flushed = view_counter.flush(wait=30)
+        self.stdout.write(self.style.SUCCESS(
+            f'Flushed {sum(flushed.values())} views for {len(flushed)} books.'
+        ))
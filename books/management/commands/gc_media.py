@@ -0,0 +1,58 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from books import covers, page_cache, uploads
+from books.models import Book
+from books.storage import all_blob_names, blob_sha256, blob_storage, collect_garbage
+
+FILE_FIELDS = ('pdf_file', 'cover_image')
+
+
+class Command(BaseCommand):
+    help = 'Delete stored PDFs and covers that no book references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehash', action='store_true',
+                            help='First move files saved before content addressing to SHA-256 names, merging duplicates')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        if options['rehash']:
+            self.rehash(storage, options['dry_run'])
+        if not options['dry_run']:
+            expired = uploads.expire()
+            self.stdout.write(f'Expired {expired} abandoned chunked uploads.')
+
+        orphans = collect_garbage(all_blob_names(storage), storage, dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for name in orphans:
+            self.stdout.write(f'{verb} {name}')
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(orphans)} unreferenced files.'))
+
+    def rehash(self, storage, dry_run):
+        moved = {}
+        for book in Book.objects.order_by('id'):
+            updates = {}
+            for field in FILE_FIELDS:
+                name = getattr(book, field).name
+                if not name or blob_sha256(name) or not storage.exists(name):
+                    continue
+                if name not in moved:
+                    if dry_run:
+                        moved[name] = name
+                    else:
+                        with storage.open(name, 'rb') as f:
+                            moved[name] = storage.save(f'{os.path.dirname(name)}/{os.path.basename(name)}', f)
+                updates[field] = moved[name]
+            if updates and not dry_run:
+                # update() skips the save signals, which would queue reprocessing
+                # and collect the old names before every book has moved
+                Book.objects.filter(pk=book.pk).update(updated_at=timezone.now(), **updates)
+                page_cache.bump('catalogue', f'book:{book.pk}')
+                if 'cover_image' in updates:
+                    covers.generate_renditions(updates['cover_image'], storage)
+            if updates:
+                self.stdout.write(f'Book {book.pk}: {", ".join(updates)} rehashed')
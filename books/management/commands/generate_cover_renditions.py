@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from books import covers
+from books.models import Book
+from books.storage import blob_storage
+
+
+def _render(name, force):
+    # Runs in a worker process; Django is already set up by the fork
+    return covers.generate_renditions(name, blob_storage(), force=force)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG renditions for existing cover images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        names = list(
+            Book.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+            .values_list('cover_image', flat=True).distinct()
+        )
+        if not options['force']:
+            names = [name for name in names if not covers.has_renditions(name, blob_storage())]
+        if not names:
+            self.stdout.write('All covers already have renditions.')
+            return
+
+        rendered = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(_render, name, options['force']): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    rendered += 1
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} covers ({failed} failed).'))
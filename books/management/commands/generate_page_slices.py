@@ -0,0 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books import page_cache, page_slices
+from books.models import Book
+from books.storage import blob_storage
+
+
+def _slice(name, force):
+    # Runs in a worker process; only reads and writes files
+    return page_slices.generate_slices(name, blob_storage(), force=force)
+
+
+class Command(BaseCommand):
+    help = 'Split book PDFs into single-page PDFs for the page-by-page reader'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Regenerate slices that already exist')
+        parser.add_argument('--book', type=int, action='append', dest='book_ids', help='Only process these book IDs')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(pdf_file='').order_by('id')
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+        rows = list(books.values_list('id', 'pdf_file'))
+
+        connections.close_all()
+        sliced = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(_slice, name, options['force']): book_id for book_id, name in rows}
+            for future in as_completed(futures):
+                book_id = futures[future]
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Book {book_id}: {e}')
+                    continue
+                Book.objects.filter(pk=book_id).update(page_count=pages)
+                page_cache.bump(f'book:{book_id}')
+                sliced += 1
+        self.stdout.write(self.style.SUCCESS(f'Sliced {sliced} books ({failed} failed).'))
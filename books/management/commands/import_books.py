@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importer import ManifestError, import_books, read_manifest
+
+
+class Command(BaseCommand):
+    help = 'Import books from a CSV or JSONL manifest plus a directory of PDFs and covers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='.csv (with a header row) or .jsonl file, one book per row')
+        parser.add_argument('--files', help='Directory the pdf/cover paths are relative to (default: the manifest\'s)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Books inserted per bulk_create()')
+        parser.add_argument('--workers', type=int, default=None, help='Threads hashing and copying files')
+        parser.add_argument('--approve', action='store_true', help='Approve rows without an is_approved column')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and hash only; write nothing')
+
+    def handle(self, *args, **options):
+        files_dir = options['files'] or os.path.dirname(os.path.abspath(options['manifest']))
+        if not os.path.isdir(files_dir):
+            raise CommandError(f'{files_dir} is not a directory')
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+
+        def progress(stats):
+            self.stdout.write(
+                f"{stats['rows']} rows: {stats['imported']} new, {stats['existing']} already present, "
+                f"{stats['invalid']} invalid ({stats['rows'] / max(stats['seconds'], 0.001):.0f} rows/s)"
+            )
+
+        try:
+            stats = import_books(
+                read_manifest(options['manifest']), files_dir,
+                batch_size=options['batch_size'], workers=options['workers'],
+                approve=options['approve'], dry_run=options['dry_run'], progress=progress,
+            )
+        except (ManifestError, OSError) as e:
+            raise CommandError(e)
+
+        for number, message in stats['errors']:
+            self.stderr.write(f'Line {number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {stats['imported']} books; {stats['existing']} already present, "
+            f"{stats['invalid']} invalid, in {stats['seconds']:.1f}s."
+        ))
@@ -0,0 +1,156 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from users.models import User
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _proc_stats(pid):
+    """(threads, rss_kb) of a process and its direct children, from /proc"""
+    threads = rss = 0
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for each in pids:
+        try:
+            with open(f'/proc/{each}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        threads += int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss += int(line.split()[1])
+        except OSError:
+            continue
+    return threads, rss
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many slow concurrent downloads of a protected PDF against a running server '
+        'and report time to first byte and server threads/memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='PDF URL on the running server, e.g. http://127.0.0.1:8000/books/1/pdf/')
+        parser.add_argument('--user', required=True, help='userId to log in as (must be allowed to read the book)')
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent downloads')
+        parser.add_argument('--read-size', type=int, default=16 * 1024, help='Bytes read per step by each client')
+        parser.add_argument('--read-delay', type=float, default=0.05, help='Seconds each client waits between reads')
+        parser.add_argument('--timeout', type=float, default=120, help='Seconds before a download is abandoned')
+        parser.add_argument('--server-pid', type=int, help='Sample threads and RSS of this server process (Linux)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(userId=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+        # The server must share this database so it can load the session
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// URLs are supported')
+        results, samples, wall = asyncio.run(self.run(url, cookie, options))
+        self.report(results, samples, wall, options)
+
+    async def run(self, url, cookie, options):
+        samples = []
+        stop = asyncio.Event()
+
+        async def sample():
+            while not stop.is_set():
+                samples.append(_proc_stats(options['server_pid']))
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample()) if options['server_pid'] else None
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            self.download(url, cookie, options) for _ in range(options['clients'])
+        ])
+        wall = time.monotonic() - started
+        stop.set()
+        if sampler is not None:
+            await sampler
+        return results, samples, wall
+
+    async def download(self, url, cookie, options):
+        """(status, time to first byte, total time, bytes) for one slow reader"""
+        started = time.monotonic()
+        request = (
+            f'GET {url.path or "/"}{"?" + url.query if url.query else ""} HTTP/1.1\r\n'
+            f'Host: {url.netloc}\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n'
+        ).encode()
+        writer = None
+        try:
+            async with asyncio.timeout(options['timeout']):
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                writer.write(request)
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                first_byte = time.monotonic() - started
+                status_line, *header_lines = head.decode('latin1').split('\r\n')
+                status = int(status_line.split()[1])
+                headers = dict(
+                    (name.strip().lower(), value.strip())
+                    for name, _, value in (line.partition(':') for line in header_lines if line)
+                )
+                remaining = int(headers.get('content-length', -1))
+                received = 0
+                while remaining != 0:
+                    chunk = await reader.read(options['read_size'] if remaining < 0 else min(options['read_size'], remaining))
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    remaining -= len(chunk) if remaining > 0 else 0
+                    await asyncio.sleep(options['read_delay'])
+                return status, first_byte, time.monotonic() - started, received
+        except (OSError, TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            return None, None, time.monotonic() - started, 0
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def report(self, results, samples, wall, options):
+        ok = [result for result in results if result[0] == 200]
+        failed = len(results) - len(ok)
+        first_bytes = [result[1] for result in ok]
+        durations = [result[2] for result in ok]
+        total_bytes = sum(result[3] for result in ok)
+
+        self.stdout.write(f"{options['clients']} clients, {options['read_size']} bytes every {options['read_delay']}s")
+        self.stdout.write(f'  completed: {len(ok)}, failed or non-200: {failed}')
+        if ok:
+            self.stdout.write(
+                f'  time to first byte: p50 {_percentile(first_bytes, 0.5):.3f}s, '
+                f'p95 {_percentile(first_bytes, 0.95):.3f}s, max {max(first_bytes):.3f}s'
+            )
+            self.stdout.write(
+                f'  download time: mean {statistics.mean(durations):.2f}s, max {max(durations):.2f}s'
+            )
+        self.stdout.write(f'  wall time: {wall:.2f}s, {total_bytes / wall / 1024 / 1024:.1f} MB/s')
+        if samples:
+            threads = [sample[0] for sample in samples]
+            rss = [sample[1] / 1024 for sample in samples]
+            self.stdout.write(
+                f'  server threads: median {statistics.median(threads):.0f}, peak {max(threads)}; '
+                f'RSS: median {statistics.median(rss):.0f} MB, peak {max(rss):.0f} MB'
+            )
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style('Done.'))
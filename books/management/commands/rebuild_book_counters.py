@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books.counters import rebuild_counters
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating, favourite and read counters on every book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', dest='book_ids', help='Only rebuild these book IDs')
+
+    def handle(self, *args, **options):
+        queryset = Book.objects.all()
+        if options['book_ids']:
+            queryset = queryset.filter(pk__in=options['book_ids'])
+        with transaction.atomic():
+            updated = rebuild_counters(queryset)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} books.'))
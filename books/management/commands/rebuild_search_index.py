@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from books import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for the book catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per batch (SQLite only)')
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if backend == 'basic':
+            self.stdout.write(self.style.WARNING('Database engine has no full-text support; nothing to rebuild.'))
+            return
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {backend} search index for {total} books.'))
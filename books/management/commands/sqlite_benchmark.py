@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from config.sqlite.base import DEFAULT_PRAGMAS, apply_pragmas
+
+# Django's stock sqlite3 backend: rollback journal, synchronous=FULL,
+# sqlite3.connect()'s 5 second busy timeout and deferred transactions
+PROFILES = {
+    'default': {'pragmas': {}, 'begin': 'BEGIN'},
+    'tuned': {'pragmas': DEFAULT_PRAGMAS, 'begin': 'BEGIN IMMEDIATE'},
+}
+
+SCHEMA = """
+CREATE TABLE book (id INTEGER PRIMARY KEY, title TEXT, view_count INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX book_views ON book (view_count);
+CREATE TABLE history (
+    user_id INTEGER, book_id INTEGER, last_page INTEGER, seconds_read INTEGER,
+    UNIQUE (user_id, book_id)
+);
+"""
+
+
+def _connect(path, profile):
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    apply_pragmas(connection, PROFILES[profile]['pragmas'])
+    return connection
+
+
+def _setup(path, profile, books):
+    connection = _connect(path, profile)
+    connection.executescript(SCHEMA)
+    connection.execute('BEGIN')
+    connection.executemany(
+        'INSERT INTO book (id, title) VALUES (?, ?)', [(i, f'Book {i}') for i in range(1, books + 1)]
+    )
+    connection.execute('COMMIT')
+    connection.close()
+
+
+def _reader(path, profile, books, deadline):
+    """Book detail and home page style reads"""
+    connection = _connect(path, profile)
+    ops = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            connection.execute('SELECT id, title, view_count FROM book WHERE id = ?', (random.randint(1, books),)).fetchall()
+            connection.execute('SELECT id, title FROM book ORDER BY view_count DESC LIMIT 6').fetchall()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    return 'read', ops, errors
+
+
+def _writer(path, profile, books, deadline):
+    """A view-count increment plus a read-then-write history upsert transaction"""
+    connection = _connect(path, profile)
+    begin = PROFILES[profile]['begin']
+    ops = errors = 0
+    while time.monotonic() < deadline:
+        book_id, user_id = random.randint(1, books), random.randint(1, 1000)
+        try:
+            connection.execute('UPDATE book SET view_count = view_count + 1 WHERE id = ?', (book_id,))
+            connection.execute(begin)
+            try:
+                row = connection.execute(
+                    'SELECT seconds_read FROM history WHERE user_id = ? AND book_id = ?', (user_id, book_id)
+                ).fetchone()
+                connection.execute(
+                    'INSERT INTO history (user_id, book_id, last_page, seconds_read) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (user_id, book_id) DO UPDATE SET last_page = excluded.last_page, '
+                    'seconds_read = excluded.seconds_read',
+                    (user_id, book_id, random.randint(1, 300), (row[0] if row else 0) + 30),
+                )
+                connection.execute('COMMIT')
+            except sqlite3.OperationalError:
+                connection.execute('ROLLBACK')
+                raise
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    return 'write', ops, errors
+
+
+def _run_worker(args):
+    role, *rest = args
+    return (_reader if role == 'read' else _writer)(*rest)
+
+
+class Command(BaseCommand):
+    help = 'Concurrent read/write throughput of SQLite with Django\'s default settings and with config.sqlite tuning'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader processes')
+        parser.add_argument('--writers', type=int, default=4, help='Writer processes')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+        parser.add_argument('--books', type=int, default=5000, help='Rows in the book table')
+        parser.add_argument('--profile', choices=list(PROFILES), action='append', help='Run only these profiles')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, {options['seconds']}s per profile\n"
+        )
+        for profile in options['profile'] or list(PROFILES):
+            directory = tempfile.mkdtemp()
+            try:
+                path = os.path.join(directory, 'bench.sqlite3')
+                _setup(path, profile, options['books'])
+                deadline = time.monotonic() + options['seconds']
+                jobs = (
+                    [('read', path, profile, options['books'], deadline)] * options['readers']
+                    + [('write', path, profile, options['books'], deadline)] * options['writers']
+                )
+                with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+                    results = pool.map(_run_worker, jobs)
+            finally:
+                shutil.rmtree(directory)
+
+            totals = {'read': [0, 0], 'write': [0, 0]}
+            for role, ops, errors in results:
+                totals[role][0] += ops
+                totals[role][1] += errors
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{profile:>8}: {totals["read"][0] / seconds:10.0f} reads/s '
+                f'({totals["read"][1]} errors), {totals["write"][0] / seconds:8.0f} writes/s '
+                f'({totals["write"][1]} "database is locked")'
+            )
@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def copy_database(source_path, target_path):
+    """Online copy of one SQLite file into another with the backup API; the target keeps the source's WAL mode"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the DATABASE_REPLICAS files (local stand-in for replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds, simulating replication lag')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_PATHS')
+        source = settings.DATABASES['default']['NAME']
+        while True:
+            started = time.monotonic()
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, settings.DATABASES[alias]['NAME'])
+            self.stdout.write(
+                f'Copied {source} to {len(settings.DATABASE_REPLICAS)} replica(s) '
+                f'in {time.monotonic() - started:.2f}s'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
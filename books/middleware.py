@@ -0,0 +1,29 @@
+from .pdf_delivery import build_file_response, resolve_offload_path
+
+# Headers the front server generates itself when it serves the file
+FRONT_SERVER_HEADERS = ('x-accel-redirect', 'x-sendfile', 'content-length', 'content-type')
+
+
+class SendfileEmulationMiddleware:
+    """
+    Stand-in for nginx/Apache in development and tests.
+    Serves the file named by an X-Accel-Redirect or X-Sendfile header the way
+    the front server would, keeping the view's other headers.
+    Never enable this in production: it defeats the point of offloading.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        path = resolve_offload_path(response)
+        if path is None:
+            return response
+
+        file_response = build_file_response(request, path, content_type=response['Content-Type'])
+        for header, value in response.items():
+            if header.lower() not in FRONT_SERVER_HEADERS and not file_response.has_header(header):
+                file_response[header] = value
+        file_response.cookies = response.cookies
+        return file_response
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Review = apps.get_model('reviews', 'Review')
+    Favourite = apps.get_model('favourites', 'Favourite')
+    ReadingHistory = apps.get_model('history', 'ReadingHistory')
+
+    def aggregate(model, expression):
+        rows = model.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        return Coalesce(
+            Subquery(rows.annotate(value=expression).values('value'), output_field=IntegerField()),
+            Value(0),
+        )
+
+    Book.objects.update(
+        rating_sum=aggregate(Review, Sum('rating')),
+        rating_count=aggregate(Review, Count('id')),
+        favourite_count=aggregate(Favourite, Count('id')),
+        read_count=aggregate(ReadingHistory, Count('id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_search_index'),
+        ('reviews', '0001_initial'),
+        ('favourites', '0001_initial'),
+        ('history', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='favourite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='read_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_approved', '-view_count'], name='book_approved_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_approved', '-created_at'], name='book_approved_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_approved', 'category', '-created_at'], name='book_approved_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_approved', 'type', '-created_at'], name='book_approved_type_idx'),
+        ),
+    ]
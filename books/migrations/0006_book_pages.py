@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_page_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        # External-content table: the text lives only in books_bookpage
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS books_bookpage_fts "
+            "USING fts5(text, content='books_bookpage', content_rowid='id', tokenize='porter unicode61')"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS books_bookpage_text_gin ON books_bookpage "
+            "USING GIN (to_tsvector('english', text))"
+        )
+
+
+def drop_page_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS books_bookpage_fts")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS books_bookpage_text_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='page_text_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text='1-based page number')),
+                ('text', models.TextField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='books.book')),
+            ],
+            options={
+                'ordering': ['book', 'number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookpage',
+            constraint=models.UniqueConstraint(fields=('book', 'number'), name='bookpage_book_number_uniq'),
+        ),
+        migrations.RunPython(create_page_index, drop_page_index),
+    ]
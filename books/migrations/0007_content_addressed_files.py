@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:13
+
+import books.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_book_pages'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover_image',
+            field=models.ImageField(blank=True, help_text='Optional cover image for the book', null=True, storage=books.storage.blob_storage, upload_to='covers/'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='pdf_file',
+            field=models.FileField(storage=books.storage.blob_storage, upload_to='pdfs/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
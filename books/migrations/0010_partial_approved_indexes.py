@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_page_count'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_approved_views_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_approved_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_approved_cat_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_approved_type_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-view_count'], name='book_approved_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-created_at', '-id'], name='book_approved_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['category', '-created_at', '-id'], name='book_approved_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['type', '-created_at', '-id'], name='book_approved_type_idx'),
+        ),
+    ]
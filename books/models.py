@@ -1,6 +1,10 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 
+from .storage import blob_storage
+
 
 class Book(models.Model):
     CATEGORY_CHOICES = [
@@ -24,30 +28,94 @@ class Book(models.Model):
     description = models.TextField()
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='free')
-    cover_image = models.ImageField(upload_to='covers/', blank=True, null=True, help_text='Optional cover image for the book')
-    pdf_file = models.FileField(upload_to='pdfs/')
+    # Both are stored by content hash; identical uploads share one file
+    cover_image = models.ImageField(upload_to='covers/', storage=blob_storage, blank=True, null=True, help_text='Optional cover image for the book')
+    pdf_file = models.FileField(upload_to='pdfs/', storage=blob_storage)
     is_approved = models.BooleanField(default=False)
     view_count = models.IntegerField(default=0)
+    # Denormalized aggregates, maintained by books.counters
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    favourite_count = models.PositiveIntegerField(default=0)
+    read_count = models.PositiveIntegerField(default=0)
+    # SHA-256 of the PDF whose text is in BookPage, maintained by books.page_text
+    page_text_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    # Set once books.page_slices has split the PDF for the page-by-page reader
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        # Partial indexes over approved books: SQLite renders is_approved=True as a
+        # bare `WHERE "is_approved"`, which can't seek a key column but does match
+        # an index with the same condition
+        indexes = [
+            # home_view "featured" and "recent" lists
+            models.Index(fields=['-view_count'], condition=models.Q(is_approved=True), name='book_approved_views_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_approved=True), name='book_approved_created_idx'),
+            # book_list_view category/type filters
+            models.Index(
+                fields=['category', '-created_at', '-id'], condition=models.Q(is_approved=True), name='book_approved_cat_idx',
+            ),
+            models.Index(
+                fields=['type', '-created_at', '-id'], condition=models.Q(is_approved=True), name='book_approved_type_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
     def get_total_reads(self):
         """Get total number of times this book has been read"""
-        return self.readinghistory_set.count()
+        return self.read_count
     
     def get_total_favorites(self):
         """Get total number of users who favorited this book"""
-        return self.favourite_set.count()
+        return self.favourite_count
     
     def get_average_rating(self):
         """Get average rating for this book"""
-        reviews = self.review_set.all()
-        if reviews.exists():
-            return sum(review.rating for review in reviews) / reviews.count()
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
+
+
+class BookPage(models.Model):
+    """Extracted text of one PDF page, indexed for search inside books"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField(help_text='1-based page number')
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['book', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'number'], name='bookpage_book_number_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} p.{self.number}"
+
+
+class ChunkedUpload(models.Model):
+    """A resumable upload assembled chunk by chunk (see books/uploads.py)"""
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text='Total size in bytes')
+    offset = models.PositiveBigIntegerField(default=0, help_text='Bytes received so far')
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Expected checksum, if the client sent one')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    file_name = models.CharField(max_length=255, blank=True, help_text='Stored blob once complete')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
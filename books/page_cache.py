@@ -0,0 +1,103 @@
+"""
+Whole-page caching for anonymous visitors, with version-key invalidation.
+
+Pages are cached under a key that includes the current value of one or more
+version counters ("catalogue", "book:<id>", ...). Signals in books/signals.py
+bump the relevant versions when books, reviews, favourites or reading history
+change, which orphans every page built from the old data at once instead of
+deleting keys one by one.
+
+Logged-in users, non-GET requests and requests with pending flash messages
+always get a freshly rendered page.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+VERSION_PREFIX = 'page_version'
+PAGE_PREFIX = 'page'
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGE_CACHE', 'default')]
+
+
+def get_versions(*names):
+    """Current version number for each name, creating missing ones"""
+    cache = _cache()
+    keys = [f'{VERSION_PREFIX}:{name}' for name in names]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            # Seed with a timestamp so an evicted counter never reuses an old version
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump(*names):
+    """Invalidate every page and fragment keyed on these versions"""
+    cache = _cache()
+    for name in names:
+        key = f'{VERSION_PREFIX}:{name}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+def cache_anonymous_page(versions, timeout=None, on_hit=None):
+    """
+    Cache a view's response for anonymous visitors.
+
+    `versions` is a list of version names, or a callable taking the view's
+    URL kwargs and returning one. `on_hit(request, *args, **kwargs)` runs
+    when a cached page is served, for side effects such as view counting.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method != 'GET'
+                or request.user.is_authenticated
+                or len(messages.get_messages(request))
+            ):
+                return view_func(request, *args, **kwargs)
+
+            names = versions(**kwargs) if callable(versions) else versions
+            fingerprint = f'{request.get_full_path()}|{get_versions(*names)}'
+            key = f'{PAGE_PREFIX}:{hashlib.md5(fingerprint.encode()).hexdigest()}'
+            cache = _cache()
+
+            cached = cache.get(key)
+            if cached is not None:
+                if on_hit is not None:
+                    on_hit(request, *args, **kwargs)
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_func(request, *args, **kwargs)
+            # Pages that set cookies or embed a CSRF token are per-visitor
+            cacheable = (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            )
+            if cacheable:
+                page_timeout = timeout if timeout is not None else getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+                cache.set(key, (response.content, response['Content-Type']), page_timeout)
+            return response
+        return wrapper
+    return decorator
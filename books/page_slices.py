@@ -0,0 +1,89 @@
+"""
+Single-page PDF slices for the page-by-page reader.
+
+Each page of a book's PDF is written as its own small PDF under
+<blob>-pages/<number>.pdf, next to the original, so the reader can show the
+first page without downloading the whole book. A manifest.json with the page
+count is written last and marks a complete set. Slices are generated by the
+background worker (books/tasks.py) or `manage.py generate_page_slices`.
+"""
+import json
+import logging
+import os
+from io import BytesIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+
+from .storage import derived_storage
+
+logger = logging.getLogger(__name__)
+
+DIR_SUFFIX = '-pages'
+MANIFEST = 'manifest.json'
+
+
+def slice_dir(name):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}{DIR_SUFFIX}'
+
+
+def slice_name(name, number):
+    return f'{slice_dir(name)}/{number:05d}.pdf'
+
+
+def is_slice_dir(directory):
+    return directory.endswith(DIR_SUFFIX)
+
+
+def page_count(name, storage):
+    """Number of pages sliced for this PDF, or None if slicing hasn't finished"""
+    manifest = f'{slice_dir(name)}/{MANIFEST}'
+    if not storage.exists(manifest):
+        return None
+    with storage.open(manifest, 'rb') as f:
+        return json.load(f)['pages']
+
+
+def generate_slices(name, storage, force=False):
+    """Write one PDF per page of the stored PDF `name`. Returns the page count."""
+    if not force:
+        existing = page_count(name, storage)
+        if existing is not None:
+            return existing
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        raise ImproperlyConfigured('Slicing PDFs requires the pypdf package')
+
+    target_storage = derived_storage(storage)
+    with storage.open(name, 'rb') as f:
+        reader = PdfReader(f)
+        for number, page in enumerate(reader.pages, start=1):
+            writer = PdfWriter()
+            writer.add_page(page)
+            buffer = BytesIO()
+            writer.write(buffer)
+            target = slice_name(name, number)
+            if target_storage.exists(target):
+                target_storage.delete(target)
+            target_storage.save(target, ContentFile(buffer.getvalue()))
+        pages = len(reader.pages)
+
+    manifest = f'{slice_dir(name)}/{MANIFEST}'
+    if target_storage.exists(manifest):
+        target_storage.delete(manifest)
+    target_storage.save(manifest, ContentFile(json.dumps({'pages': pages}).encode()))
+    logger.info(f"Sliced {pages} pages of {name}")
+    return pages
+
+
+def delete_slices(name, storage):
+    target_storage = derived_storage(storage)
+    directory = slice_dir(name)
+    if not target_storage.exists(directory):
+        return
+    _, files = target_storage.listdir(directory)
+    for filename in files:
+        target_storage.delete(f'{directory}/{filename}')
+    os.rmdir(target_storage.path(directory))
@@ -0,0 +1,98 @@
+"""
+Per-page text extraction from book PDFs, for search inside books.
+
+Each page's text is stored as a BookPage row and added to the page search
+index (books/search.py). Book.page_text_sha256 records the SHA-256 of the
+file the pages came from, so re-ingesting an unchanged PDF is a hash check.
+Extraction needs the optional `pypdf` package.
+"""
+import hashlib
+import logging
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .models import Book, BookPage
+from . import search
+from .storage import blob_sha256
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_obj):
+    """SHA-256 of a file, read in chunks so large PDFs aren't loaded into memory"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_pages(file_obj):
+    """List of page texts, in page order"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImproperlyConfigured('Extracting PDF text requires the pypdf package')
+    reader = PdfReader(file_obj)
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text() or ''
+        except Exception as e:
+            # One malformed page shouldn't lose the rest of the book
+            logger.warning(f"Could not extract text from a page: {e}")
+            text = ''
+        # Collapse layout whitespace; it only bloats the index
+        pages.append(' '.join(text.split()))
+    return pages
+
+
+def read_pdf(name, storage, known_sha256='', force=False):
+    """
+    Hash and extract a stored PDF. Returns (sha256, pages), with pages None
+    when the file is unchanged since the last extraction.
+    Safe to run in a worker process: it doesn't touch the database.
+    """
+    # Content-addressed names already carry the hash
+    sha256 = blob_sha256(name)
+    if sha256 and sha256 == known_sha256 and not force:
+        return sha256, None
+    with storage.open(name, 'rb') as f:
+        if sha256 is None:
+            sha256 = file_sha256(f)
+            if sha256 == known_sha256 and not force:
+                return sha256, None
+            f.seek(0)
+        return sha256, extract_pages(f)
+
+
+def store_pages(book_id, sha256, pages):
+    """Replace a book's stored pages and their index entries"""
+    with transaction.atomic():
+        search.remove_book_pages(book_id)
+        BookPage.objects.filter(book_id=book_id).delete()
+        BookPage.objects.bulk_create(
+            [BookPage(book_id=book_id, number=number, text=text) for number, text in enumerate(pages, start=1) if text],
+            batch_size=500,
+        )
+        search.index_book_pages(book_id)
+        # update() rather than save(): nothing else about the book changed
+        Book.objects.filter(pk=book_id).update(page_text_sha256=sha256)
+
+
+def ingest_book(book, force=False):
+    """
+    Extract and index a book's PDF text unless it is already up to date.
+    Returns the number of pages extracted, or None if skipped.
+    """
+    if not book.pdf_file:
+        return None
+    sha256, pages = read_pdf(book.pdf_file.name, book.pdf_file.storage, book.page_text_sha256, force)
+    if pages is None:
+        return None
+    store_pages(book.pk, sha256, pages)
+    book.page_text_sha256 = sha256
+    logger.info(f"Extracted text from {len(pages)} pages of book {book.pk}")
+    return len(pages)
@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination for list pages.
+
+Django's Paginator runs COUNT(*) on every page and then an OFFSET query that
+gets slower the deeper a user pages. KeysetPaginator instead seeks from the
+last row seen using a (timestamp, id) key, so every page costs the same.
+
+The page object mimics django.core.paginator.Page closely enough for the
+existing templates: previous_page_number()/next_page_number() return opaque
+cursor tokens that the views read back from the same `page` query parameter.
+
+Set PAGINATION_MODE = 'keyset' to switch all list views over; 'offset' keeps
+the classic numbered Paginator.
+"""
+import base64
+import collections.abc
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Upper bound for the capped COUNT used by approximate counting on engines
+# without planner estimates
+APPROXIMATE_COUNT_CAP = 1000
+
+
+def encode_cursor(values, direction, number):
+    payload = {
+        'k': [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        'd': direction,
+        'n': number,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key_count):
+    """Return (values, direction, number) or None for a missing or invalid token"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload['k']
+        direction = payload['d']
+        number = int(payload['n'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if len(values) != key_count or direction not in ('next', 'prev') or number < 1:
+        return None
+    return values, direction, number
+
+
+class KeysetPage(collections.abc.Sequence):
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f'<Keyset page {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        """Cursor token for the page after this one"""
+        if not self.object_list:
+            return None
+        return encode_cursor(self.paginator.key_values(self.object_list[-1]), 'next', self.number + 1)
+
+    def previous_page_number(self):
+        """Cursor token for the page before this one"""
+        if not self.object_list:
+            return None
+        return encode_cursor(self.paginator.key_values(self.object_list[0]), 'prev', self.number - 1)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset in descending order of `keys`, e.g. ('created_at', 'id').
+    The last key must be unique so the ordering is total.
+    """
+
+    def __init__(self, object_list, per_page, keys=('created_at', 'id'), approximate_count=False):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.approximate_count = approximate_count
+        self._capped = True
+
+    def key_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _seek(self, values, direction):
+        """Q object selecting rows strictly after (next) or before (prev) the key values"""
+        lookup = 'lt' if direction == 'next' else 'gt'
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            equal = {k: v for k, v in zip(self.keys[:index], values[:index])}
+            condition |= Q(**equal, **{f'{key}__{lookup}': values[index]})
+        return condition
+
+    def _first_page(self):
+        rows = list(self.object_list.order_by(*(f'-{key}' for key in self.keys))[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], 1, self, False, len(rows) > self.per_page)
+
+    def _last_page(self, number):
+        rows = list(self.object_list.order_by(*self.keys)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        return KeysetPage(rows[:self.per_page][::-1], max(number, 2) if has_previous else 1, self, has_previous, False)
+
+    def get_page(self, token):
+        cursor = decode_cursor(token, len(self.keys))
+        if cursor is None:
+            return self._first_page()
+
+        values, direction, number = cursor
+        queryset = self.object_list.filter(self._seek(values, direction))
+        if direction == 'next':
+            rows = list(queryset.order_by(*(f'-{key}' for key in self.keys))[:self.per_page + 1])
+            if not rows:
+                # Stale cursor: the rows after it were deleted
+                return self._last_page(number - 1)
+            return KeysetPage(rows[:self.per_page], number, self, True, len(rows) > self.per_page)
+
+        rows = list(queryset.order_by(*self.keys)[:self.per_page + 1])
+        if not rows:
+            # Stale cursor: the rows before it were deleted
+            return self._first_page()
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, number if has_previous else 1, self, has_previous, True)
+
+    @cached_property
+    def count(self):
+        """Estimated row count, or None when approximate counting is off"""
+        if not self.approximate_count:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql':
+            sql, params = self.object_list.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        # Bounded COUNT over a LIMIT subquery: cheap, exact below the cap
+        count = self.object_list.order_by()[:APPROXIMATE_COUNT_CAP].count()
+        self._capped = count >= APPROXIMATE_COUNT_CAP
+        return count
+
+    @property
+    def count_is_estimate(self):
+        return self.count is not None and self._capped
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+
+def paginate(request, queryset, per_page, keys=None):
+    """
+    Return a page object for a list view, honouring PAGINATION_MODE.
+    Pass keys=None for lists that cannot be keyset-paginated (e.g. relevance-ranked search).
+    """
+    page_token = request.GET.get('page')
+    if keys and getattr(settings, 'PAGINATION_MODE', 'offset') == 'keyset':
+        paginator = KeysetPaginator(
+            queryset, per_page, keys,
+            approximate_count=getattr(settings, 'PAGINATION_APPROXIMATE_COUNT', False),
+        )
+        return paginator.get_page(page_token)
+    return Paginator(queryset, per_page).get_page(page_token)
@@ -0,0 +1,372 @@
+"""
+Byte-range and conditional-request support for protected PDF delivery.
+
+serve_pdf() does the access checks and then hands the file to
+build_file_response(), which honours Range (single and multi-range),
+If-Range, If-None-Match and If-Modified-Since so PDF viewers can fetch only
+the pages they need.
+
+When PDF_DELIVERY_MODE is 'x-accel-redirect' (nginx) or 'x-sendfile'
+(Apache/lighttpd), build_offload_response() returns only an internal-redirect
+header and the front server streams the file (ranges included).
+
+abuild_file_response() is the ASGI counterpart used by books/async_views.py:
+the body is an async iterator that reads the file with os.pread() on a small
+dedicated thread pool, at most PDF_ASYNC_READ_AHEAD chunks ahead of the
+client, so a slow reader holds neither a request thread nor the whole file.
+"""
+import asyncio
+import os
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+DELIVERY_DJANGO = 'django'
+DELIVERY_X_ACCEL_REDIRECT = 'x-accel-redirect'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+DELIVERY_MODES = (DELIVERY_DJANGO, DELIVERY_X_ACCEL_REDIRECT, DELIVERY_X_SENDFILE)
+
+CHUNK_SIZE = 64 * 1024
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+
+def file_etag(stat):
+    """Strong ETag derived from size and modification time"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range_header(header, size):
+    """
+    Parse a `Range: bytes=...` header against a file of `size` bytes.
+
+    Returns None if the header is absent, malformed or asks for too many
+    ranges (the caller should send the full file), an empty list if no range
+    is satisfiable (416), otherwise a sorted list of merged (start, end)
+    tuples with inclusive ends.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+    parts = spec.split(',')
+    if len(parts) > MAX_RANGES:
+        return None
+    for part in parts:
+        first, dash, last = part.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+            else:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length == 0:
+                    continue
+                start = max(size - length, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_parts(ranges, size, content_type, boundary):
+    """Per-range part headers, the closing delimiter and the total body length"""
+    headers = [
+        (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode()
+    length = sum(len(h) for h in headers) + sum(end - start + 1 for start, end in ranges)
+    length += 2 * (len(ranges) - 1) + len(closing)
+    return headers, closing, length
+
+
+def _multipart_ranges(path, ranges, size, content_type, boundary):
+    headers, closing, length = _multipart_parts(ranges, size, content_type, boundary)
+
+    def body():
+        for index, (start, end) in enumerate(ranges):
+            if index:
+                yield b'\r\n'
+            yield headers[index]
+            yield from _read_range(path, start, end)
+        yield closing
+
+    return body(), length
+
+
+def _opaque_tag(tag):
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def _is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        # Weak comparison: ignore W/ prefixes
+        return '*' in tags or etag in [_opaque_tag(tag) for tag in tags]
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Strong comparison only; weak validators never match If-Range
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _plan_response(request, stat):
+    """
+    (status, ranges) for a file with this stat: 304, 416, 200 (whole file)
+    or 206 with the list of (start, end) ranges to send.
+    """
+    etag = file_etag(stat)
+    if _is_not_modified(request, etag, stat.st_mtime):
+        return 304, None
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, stat.st_mtime):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), stat.st_size)
+    if ranges is None:
+        return 200, None
+    if not ranges:
+        return 416, None
+    return 206, ranges
+
+
+def _add_validators(response, stat):
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = file_etag(stat)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def build_file_response(request, path, content_type='application/pdf'):
+    """
+    Build a 200, 206, 304 or 416 response for `path` according to the
+    request's Range and conditional headers. The caller is responsible for
+    access control and for any extra headers.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    status, ranges = _plan_response(request, stat)
+
+    if status == 304:
+        response = HttpResponse(status=304)
+    elif status == 200:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    elif status == 416:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            _read_range(path, start, end), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        body, length = _multipart_ranges(path, ranges, size, content_type, boundary)
+        response = StreamingHttpResponse(
+            body, status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(length)
+    return _add_validators(response, stat)
+
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+
+def _get_io_executor():
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PDF_ASYNC_IO_THREADS', 8), thread_name_prefix='pdf-io',
+            )
+        return _io_executor
+
+
+async def run_io(func, *args):
+    """Run a blocking file-system call on the PDF I/O pool"""
+    return await asyncio.get_running_loop().run_in_executor(_get_io_executor(), func, *args)
+
+
+def _close_when_done(fd, reads):
+    """Close `fd` once in-flight reads on it have finished; queued ones are cancelled"""
+    running = [read for read in reads if not read.cancel() and not read.done()]
+    if not running:
+        os.close(fd)
+        return
+    left = [len(running)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            left[0] -= 1
+            last = not left[0]
+        if last:
+            os.close(fd)
+
+    for read in running:
+        read.add_done_callback(done)
+
+
+async def _aread_range(path, start, end):
+    """Yield bytes start..end (inclusive), reading ahead up to PDF_ASYNC_READ_AHEAD chunks"""
+    executor = _get_io_executor()
+    read_ahead = max(1, getattr(settings, 'PDF_ASYNC_READ_AHEAD', 4))
+    fd = await run_io(os.open, path, os.O_RDONLY)
+    # concurrent.futures rather than asyncio futures: cancelling one never
+    # pretends a read that is already running has stopped
+    reads = deque()
+    offset = start
+    try:
+        while reads or offset <= end:
+            # Positional reads don't share a file offset, so they can overlap
+            while offset <= end and len(reads) < read_ahead:
+                length = min(CHUNK_SIZE, end - offset + 1)
+                reads.append(executor.submit(os.pread, fd, length, offset))
+                offset += length
+            chunk = await asyncio.wrap_future(reads[0])
+            reads.popleft()
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        # Also runs when the client goes away mid-download
+        _close_when_done(fd, reads)
+
+
+async def _amultipart_body(path, ranges, headers, closing):
+    for index, (start, end) in enumerate(ranges):
+        if index:
+            yield b'\r\n'
+        yield headers[index]
+        async for chunk in _aread_range(path, start, end):
+            yield chunk
+    yield closing
+
+
+async def abuild_file_response(request, path, content_type='application/pdf'):
+    """
+    build_file_response() for async views: same statuses and headers, but the
+    body is streamed by an async iterator without blocking the event loop.
+    Raises FileNotFoundError if `path` doesn't exist.
+    """
+    stat = await run_io(os.stat, path)
+    size = stat.st_size
+    status, ranges = _plan_response(request, stat)
+
+    if status == 304:
+        response = HttpResponse(status=304)
+    elif status == 200:
+        response = StreamingHttpResponse(_aread_range(path, 0, size - 1), content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif status == 416:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            _aread_range(path, start, end), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        headers, closing, length = _multipart_parts(ranges, size, content_type, boundary)
+        response = StreamingHttpResponse(
+            _amultipart_body(path, ranges, headers, closing), status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(length)
+    return _add_validators(response, stat)
+
+
+def get_delivery_mode():
+    mode = getattr(settings, 'PDF_DELIVERY_MODE', DELIVERY_DJANGO)
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(f"PDF_DELIVERY_MODE must be one of {', '.join(DELIVERY_MODES)}")
+    return mode
+
+
+def build_offload_response(path, mode, content_type='application/pdf'):
+    """
+    Empty response carrying an internal-redirect header for the front server.
+    X-Accel-Redirect takes a URI under PDF_ACCEL_REDIRECT_PREFIX (an nginx
+    `internal` location aliased to MEDIA_ROOT); X-Sendfile takes the absolute path.
+    """
+    response = HttpResponse(content_type=content_type)
+    if mode == DELIVERY_X_ACCEL_REDIRECT:
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        if relative.startswith('../'):
+            raise ValueError(f"{path} is outside MEDIA_ROOT")
+        prefix = getattr(settings, 'PDF_ACCEL_REDIRECT_PREFIX', '/protected/').rstrip('/')
+        response['X-Accel-Redirect'] = quote(f'{prefix}/{relative}')
+    else:
+        response['X-Sendfile'] = os.path.abspath(path)
+    return response
+
+
+def resolve_offload_path(response):
+    """Map an internal-redirect header back to a file path (used by the emulation middleware)"""
+    if response.has_header('X-Sendfile'):
+        return response['X-Sendfile']
+    if response.has_header('X-Accel-Redirect'):
+        prefix = getattr(settings, 'PDF_ACCEL_REDIRECT_PREFIX', '/protected/').rstrip('/') + '/'
+        uri = unquote(response['X-Accel-Redirect'])
+        if not uri.startswith(prefix):
+            return None
+        path = os.path.normpath(os.path.join(settings.MEDIA_ROOT, uri[len(prefix):]))
+        if not path.startswith(os.path.normpath(str(settings.MEDIA_ROOT)) + os.sep):
+            return None
+        return path
+    return None
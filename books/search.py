@@ -0,0 +1,288 @@
+"""
+Full-text search service for the book catalogue.
+
+SQLite keeps an FTS5 virtual table (books_book_fts) in sync with Book rows
+through the signals in books/signals.py. PostgreSQL searches a weighted
+tsvector expression that is covered by a GIN index, so no extra sync is needed.
+Any other database engine falls back to icontains filtering.
+
+Text extracted from PDFs (BookPage, see books/page_text.py) is searchable per
+page: SQLite through the external-content FTS5 table books_bookpage_fts,
+PostgreSQL through a GIN index on the page tsvector.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Book, BookPage
+
+FTS_TABLE = 'books_book_fts'
+POSTGRES_INDEX = 'books_book_search_gin'
+POSTGRES_CONFIG = 'english'
+
+PAGE_FTS_TABLE = 'books_bookpage_fts'
+POSTGRES_PAGE_INDEX = 'books_bookpage_text_gin'
+# Control characters mark matched terms in snippets; snippet_html() turns them into <mark>
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_WORDS = 24
+
+# bm25() column weights for title, author and description
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _table():
+    return connections['default'].ops.quote_name(Book._meta.db_table)
+
+
+def _postgres_vector(table=None):
+    """Weighted tsvector expression; must match the GIN index definition exactly"""
+    prefix = f'{table}.' if table else ''
+    return (
+        f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({prefix}title, '')), 'A') || "
+        f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({prefix}author, '')), 'B') || "
+        f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({prefix}description, '')), 'D')"
+    )
+
+
+def get_backend(using='default'):
+    """Return the search backend name for a database alias"""
+    vendor = connections[using].vendor
+    if vendor in ('sqlite', 'postgresql'):
+        return vendor
+    return 'basic'
+
+
+def _fts5_query(text):
+    """Turn free text into a safe FTS5 query: every term quoted and prefix-matched"""
+    terms = _TERM_RE.findall(text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_books(queryset, text):
+    """
+    Filter a Book queryset by a free-text query and order it by relevance.
+    The best match comes first; the rank is available as `search_rank`.
+    """
+    text = text.strip()
+    if not text:
+        return queryset
+
+    backend = get_backend(queryset.db)
+    table = _table()
+
+    if backend == 'sqlite':
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        matched_ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        # bm25() is negative and lower is better, so negate it for a "higher is better" rank
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [match],
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matched_ids).annotate(search_rank=rank).order_by('-search_rank', '-id')
+
+    if backend == 'postgresql':
+        vector = _postgres_vector(table)
+        tsquery = f"websearch_to_tsquery('{POSTGRES_CONFIG}', %s)"
+        return queryset.alias(
+            search_match=RawSQL(f'({vector}) @@ {tsquery}', [text], output_field=BooleanField()),
+        ).filter(search_match=True).annotate(
+            search_rank=RawSQL(f'ts_rank({vector}, {tsquery})', [text], output_field=FloatField()),
+        ).order_by('-search_rank', '-id')
+
+    return queryset.filter(
+        Q(title__icontains=text) |
+        Q(author__icontains=text) |
+        Q(description__icontains=text)
+    )
+
+
+def index_book(book):
+    """Add or refresh one book in the FTS5 table (no-op on other engines)"""
+    index_books([book])
+
+
+def index_books(books):
+    """index_book() for many books, e.g. after a bulk_create() that skipped the save signals"""
+    if get_backend() != 'sqlite':
+        return
+    with connections['default'].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[book.pk] for book in books])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, author, description) VALUES (%s, %s, %s, %s)',
+            [[book.pk, book.title, book.author, book.description] for book in books],
+        )
+
+
+def remove_book(book_id):
+    """Drop one book from the FTS5 table (no-op on other engines)"""
+    if get_backend() != 'sqlite':
+        return
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [book_id])
+
+
+def index_book_pages(book_id):
+    """Add the stored BookPage rows of one book to the page index"""
+    if get_backend() != 'sqlite':
+        return
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {PAGE_FTS_TABLE} (rowid, text) '
+            f'SELECT id, text FROM {BookPage._meta.db_table} WHERE book_id = %s',
+            [book_id],
+        )
+
+
+def remove_book_pages(book_id):
+    """
+    Drop one book's pages from the page index. Must run while the BookPage
+    rows still exist: an external-content table needs the old text to delete.
+    """
+    if get_backend() != 'sqlite':
+        return
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {PAGE_FTS_TABLE} ({PAGE_FTS_TABLE}, rowid, text) "
+            f"SELECT 'delete', id, text FROM {BookPage._meta.db_table} WHERE book_id = %s",
+            [book_id],
+        )
+
+
+def _basic_snippet(text, terms):
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    start = max(0, min(positions) - 80) if positions else 0
+    snippet = text[start:start + 200]
+    for term in terms:
+        snippet = re.sub(f'({re.escape(term)})', f'{MARK_START}\\1{MARK_END}', snippet, flags=re.IGNORECASE)
+    return ('…' if start else '') + snippet + ('…' if start + 200 < len(text) else '')
+
+
+def search_pages(text, books=None, limit=50):
+    """
+    Full-text search over extracted PDF pages, best match first.
+    `books` restricts the search to a Book queryset (e.g. approved books).
+    Returns dicts with book_id, page, snippet (with MARK_START/MARK_END
+    around matched terms) and rank.
+    """
+    text = text.strip()
+    terms = _TERM_RE.findall(text)
+    if not terms:
+        return []
+    books = Book.objects.all() if books is None else books
+    book_sql, book_params = books.values('id').query.sql_with_params()
+    pages_table = BookPage._meta.db_table
+    backend = get_backend(books.db)
+
+    if backend == 'sqlite':
+        sql = (
+            f"SELECT p.book_id, p.number, "
+            f"snippet({PAGE_FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_WORDS}), -bm25({PAGE_FTS_TABLE}) AS rank "
+            f"FROM {PAGE_FTS_TABLE} JOIN {pages_table} p ON p.id = {PAGE_FTS_TABLE}.rowid "
+            f"WHERE {PAGE_FTS_TABLE} MATCH %s AND p.book_id IN ({book_sql}) "
+            f"ORDER BY rank DESC LIMIT %s"
+        )
+        params = [MARK_START, MARK_END, _fts5_query(text), *book_params, limit]
+    elif backend == 'postgresql':
+        vector = f"to_tsvector('{POSTGRES_CONFIG}', p.text)"
+        options = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=8'
+        sql = (
+            f"SELECT p.book_id, p.number, ts_headline('{POSTGRES_CONFIG}', p.text, q, %s), ts_rank({vector}, q) AS rank "
+            f"FROM {pages_table} p, websearch_to_tsquery('{POSTGRES_CONFIG}', %s) q "
+            f"WHERE {vector} @@ q AND p.book_id IN ({book_sql}) "
+            f"ORDER BY rank DESC LIMIT %s"
+        )
+        params = [options, text, *book_params, limit]
+    else:
+        pages = BookPage.objects.filter(book__in=books, text__icontains=text).order_by('book_id', 'number')[:limit]
+        return [
+            {'book_id': page.book_id, 'page': page.number, 'snippet': _basic_snippet(page.text, [text]), 'rank': 0.0}
+            for page in pages
+        ]
+
+    with connections[books.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {'book_id': book_id, 'page': number, 'snippet': snippet, 'rank': rank}
+            for book_id, number, snippet, rank in cursor.fetchall()
+        ]
+
+
+def snippet_html(snippet):
+    """Escape a search snippet and highlight its matched terms with <mark>"""
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def ensure_index():
+    """Create the search tables or indexes if they are missing"""
+    backend = get_backend()
+    with connections['default'].cursor() as cursor:
+        if backend == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f"USING fts5(title, author, description, tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {PAGE_FTS_TABLE} '
+                f"USING fts5(text, content='{BookPage._meta.db_table}', content_rowid='id', tokenize='porter unicode61')"
+            )
+        elif backend == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON {_table()} USING GIN (({_postgres_vector()}))'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_PAGE_INDEX} ON {BookPage._meta.db_table} '
+                f"USING GIN (to_tsvector('{POSTGRES_CONFIG}', text))"
+            )
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the search index from scratch.
+    Returns the number of books indexed.
+    """
+    backend = get_backend()
+    ensure_index()
+    total = Book.objects.count()
+
+    if backend == 'postgresql':
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {POSTGRES_INDEX}')
+            cursor.execute(f'REINDEX INDEX {POSTGRES_PAGE_INDEX}')
+        return total
+
+    if backend != 'sqlite':
+        return 0
+
+    rows = Book.objects.order_by('id').values_list('id', 'title', 'author', 'description')
+    with connections['default'].cursor() as cursor:
+        # The page index reads its text from books_bookpage, so it can rebuild itself
+        cursor.execute(f"INSERT INTO {PAGE_FTS_TABLE} ({PAGE_FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, author, description) VALUES (%s, %s, %s, %s)',
+                    batch,
+                )
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, author, description) VALUES (%s, %s, %s, %s)',
+                batch,
+            )
+    return total
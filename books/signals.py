@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Book
+from . import facets, page_cache, search, storage, tasks
+
+FILE_FIELDS = ('cover_image', 'pdf_file')
+
+
+def _file_names(instance):
+    return tuple(getattr(instance, field).name for field in FILE_FIELDS)
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, raw=False, **kwargs):
+    """Keep the full-text search index and facet counts in sync with saved books"""
+    if raw:
+        return
+    search.index_book(instance)
+    facets.invalidate()
+    page_cache.bump('catalogue', f'book:{instance.pk}')
+
+
+@receiver(post_init, sender=Book)
+def remember_files(sender, instance, **kwargs):
+    """Note the stored file names so saves can tell when a file was replaced"""
+    if not instance.pk:
+        instance._saved_files = (None, None)
+    elif instance.get_deferred_fields().intersection(FILE_FIELDS):
+        # Reading a deferred field would cost a query per instance
+        instance._saved_files = None
+    else:
+        instance._saved_files = _file_names(instance)
+
+
+@receiver(post_save, sender=Book)
+def queue_upload_processing(sender, instance, raw=False, **kwargs):
+    """Hand new or replaced covers and PDFs to the background worker"""
+    if raw or instance._saved_files is None:
+        return
+    files = _file_names(instance)
+    if files != instance._saved_files and any(files):
+        tasks.process_book_upload.enqueue(book_id=instance.pk)
+        replaced = [old for old, new in zip(instance._saved_files, files) if old and old != new]
+        if replaced:
+            transaction.on_commit(lambda: storage.collect_garbage(replaced))
+    instance._saved_files = files
+
+
+@receiver(pre_delete, sender=Book)
+def unindex_deleted_book_pages(sender, instance, **kwargs):
+    """The page index needs the page text, which the delete cascade removes"""
+    search.remove_book_pages(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    """Remove deleted books from the full-text search index and facet counts"""
+    search.remove_book(instance.pk)
+    facets.invalidate()
+    page_cache.bump('catalogue', f'book:{instance.pk}')
+    # Files may be shared with other books; only unreferenced ones are removed
+    files = _file_names(instance)
+    transaction.on_commit(lambda: storage.collect_garbage(files))
+
+
+@receiver(post_save, sender='reviews.Review')
+@receiver(post_delete, sender='reviews.Review')
+@receiver(post_delete, sender='favourites.Favourite')
+def invalidate_book_page(sender, instance, **kwargs):
+    """Reviews and favourite counts are shown on the book detail page"""
+    page_cache.bump(f'book:{instance.book_id}')
+
+
+@receiver(post_save, sender='favourites.Favourite')
+@receiver(post_save, sender='history.ReadingHistory')
+def invalidate_book_page_on_create(sender, instance, created=False, **kwargs):
+    """Only new favourites and first reads change the counters on the detail page"""
+    if created:
+        page_cache.bump(f'book:{instance.book_id}')
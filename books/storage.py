@@ -0,0 +1,193 @@
+"""
+Content-addressed file storage for book PDFs and cover images.
+
+Uploads are stored under their SHA-256 digest, e.g.
+pdfs/3f/3fa4...e1.pdf, so saving identical content twice reuses the existing
+blob instead of writing a copy with a random suffix. Several books can
+reference the same blob; `collect_garbage()` removes blobs (and their derived
+files such as cover renditions) once no book references them.
+
+A new blob is written to a temporary file and linked into place, so it never
+appears half-written and two identical uploads racing each other both end up
+with the one blob. Saving content that is already stored touches the blob;
+`collect_garbage()` leaves blobs touched within BLOB_GC_GRACE_SECONDS alone,
+since the book about to reference them may not have been committed yet.
+
+Files derived from a blob (cover renditions, page slices) are named after the blob
+and must be written through `derived_storage()`, which doesn't rename them.
+"""
+import hashlib
+import logging
+import os
+import re
+import secrets
+import time
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIRS = ('pdfs', 'covers')
+# Temporary files of blobs being written; outside BLOB_DIRS so collect_garbage never sees them
+INCOMING_DIR = 'incoming'
+_BLOB_RE = re.compile(r'^(?P<dir>[\w-]+)/(?P<fan>[0-9a-f]{2})/(?P<sha>[0-9a-f]{64})(?P<ext>\.\w+)?$')
+
+
+def blob_storage():
+    """Storage for Book.pdf_file and Book.cover_image (STORAGES['blobs'])"""
+    return storages['blobs']
+
+
+def blob_sha256(name):
+    """The SHA-256 encoded in a content-addressed name, or None for other names"""
+    match = _BLOB_RE.match(name or '')
+    return match.group('sha') if match else None
+
+
+def derived_storage(storage):
+    """Storage to write files derived from a blob under names of our choosing"""
+    return getattr(storage, 'derived', storage)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by the SHA-256 of their content"""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content in _save(); never add suffixes
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        # chunks() streams uploaded files; large uploads are already temp files on disk
+        for chunk in content.chunks():
+            digest.update(chunk)
+        sha256 = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        blob_name = os.path.join(directory, sha256[:2], f'{sha256}{ext}').replace('\\', '/')
+
+        if self.touch(blob_name):
+            return blob_name
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        temp_path = os.path.join(incoming, secrets.token_hex(16))
+        # Same mode as FileSystemStorage gives new files before file_permissions_mode
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), temp_path, allow_overwrite=True)
+            else:
+                content.seek(0)
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+            self._link(temp_path, blob_name)
+        finally:
+            os.remove(temp_path)
+        return blob_name
+
+    def touch(self, blob_name):
+        """Mark an existing blob as in use so collect_garbage() leaves it alone; False if there is none"""
+        try:
+            os.utime(self.path(blob_name))
+        except FileNotFoundError:
+            return False
+        logger.info(f"Reusing existing blob {blob_name}")
+        return True
+
+    def _link(self, path, blob_name):
+        """Give the complete file at `path` its blob name, unless an identical upload got there first"""
+        target = self.path(blob_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            self.touch(blob_name)
+
+    def adopt(self, path, directory, sha256, ext):
+        """
+        Move an already-written local file into the store without copying it.
+        `sha256` must be the file's digest. Returns the blob name.
+        """
+        blob_name = f'{directory}/{sha256[:2]}/{sha256}{ext.lower()}'
+        if not self.touch(blob_name):
+            self._link(path, blob_name)
+        os.remove(path)
+        return blob_name
+
+    @cached_property
+    def derived(self):
+        return FileSystemStorage(
+            location=self._location,
+            base_url=self._base_url,
+            file_permissions_mode=self._file_permissions_mode,
+            directory_permissions_mode=self._directory_permissions_mode,
+        )
+
+
+def referenced_names(names):
+    """The subset of `names` still used by some book or by a finished upload not yet attached"""
+    from .models import Book, ChunkedUpload
+    names = set(names)
+    used = Book.objects.filter(Q(pdf_file__in=names) | Q(cover_image__in=names)).values_list('pdf_file', 'cover_image')
+    referenced = {name for row in used for name in row if name in names}
+    referenced.update(ChunkedUpload.objects.filter(file_name__in=names).values_list('file_name', flat=True))
+    return referenced
+
+
+def delete_blob(name, storage):
+    """Delete a blob and every file derived from it"""
+    from . import covers, page_slices
+    covers.delete_renditions(name, derived_storage(storage))
+    page_slices.delete_slices(name, storage)
+    if storage.exists(name):
+        storage.delete(name)
+
+
+def collect_garbage(names, storage=None, dry_run=False, grace_seconds=None):
+    """
+    Delete the given blobs that no book references any more, except those
+    written or reused within the last `grace_seconds` (BLOB_GC_GRACE_SECONDS).
+    Returns the list of names deleted (or that would be, with dry_run).
+    """
+    storage = storage or blob_storage()
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, 'BLOB_GC_GRACE_SECONDS', 3600)
+    names = {name for name in names if name}
+    orphans = []
+    for name in sorted(names - referenced_names(names)):
+        try:
+            # Checked per blob, just before deleting it
+            if time.time() - os.path.getmtime(storage.path(name)) < grace_seconds:
+                continue
+        except FileNotFoundError:
+            pass
+        orphans.append(name)
+        if not dry_run:
+            delete_blob(name, storage)
+            logger.info(f"Deleted orphaned blob {name}")
+    return orphans
+
+
+def all_blob_names(storage=None):
+    """Every stored original under BLOB_DIRS, skipping derived files"""
+    from . import covers, page_slices
+    storage = storage or blob_storage()
+    for top in BLOB_DIRS:
+        pending = [top]
+        while pending:
+            directory = pending.pop()
+            if not storage.exists(directory):
+                continue
+            subdirs, files = storage.listdir(directory)
+            pending.extend(f'{directory}/{subdir}' for subdir in subdirs if not page_slices.is_slice_dir(subdir))
+            for filename in files:
+                if not covers.is_rendition(filename):
+                    yield f'{directory}/{filename}'
@@ -0,0 +1,21 @@
+"""Background processing for uploaded books (run by `manage.py run_worker`)"""
+from taskqueue.queue import task
+
+from . import covers, page_cache, page_slices, page_text
+from .models import Book
+
+
+@task
+def process_book_upload(book_id):
+    """Post-upload work for a new or replaced cover/PDF"""
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+    if book.cover_image:
+        covers.generate_renditions(book.cover_image.name, book.cover_image.storage)
+    # Skips the extraction when the PDF content hasn't changed
+    page_text.ingest_book(book)
+    if book.pdf_file:
+        pages = page_slices.generate_slices(book.pdf_file.name, book.pdf_file.storage)
+        Book.objects.filter(pk=book.pk).update(page_count=pages)
+        page_cache.bump(f'book:{book.pk}')
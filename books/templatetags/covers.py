@@ -0,0 +1,40 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from books import covers
+
+register = template.Library()
+
+MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+@register.simple_tag
+def cover_img(book, css_class='', sizes='100vw'):
+    """
+    Responsive <picture> for a book cover using its resized renditions.
+    Falls back to the original upload when no renditions exist yet.
+    """
+    if not book.cover_image:
+        return ''
+    found = covers.renditions(book.cover_image.name, storage=book.cover_image.storage)
+    if not found:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', book.cover_image.url, book.title, css_class)
+
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[fmt], ', '.join(f'{url} {width}w' for url, width in found[fmt]), sizes)
+            for fmt in covers.COVER_FORMATS[:-1] if fmt in found
+        ),
+    )
+    fallback = found.get(covers.COVER_FORMATS[-1])
+    if fallback:
+        src = fallback[-1][0]
+        srcset = ', '.join(f'{url} {width}w' for url, width in fallback)
+    else:
+        src, srcset = book.cover_image.url, ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        sources, src, srcset, sizes, book.title, css_class,
+    )
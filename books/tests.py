@@ -1,3 +1,1127 @@
-from django.test import TestCase
+import asyncio
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from favourites.models import Favourite
+from taskqueue.models import Task
+from history.models import ReadingHistory
+from payments import entitlements
+from payments.models import Purchase
+from reviews.models import Review
+from users.models import User
+from .models import Book, BookPage, ChunkedUpload
+from .pagination import KeysetPaginator, encode_cursor
+from . import async_views, checks, covers, exports, facets, forms, page_slices, page_text, pdf_delivery, search, storage, tasks, uploads, view_counter, views
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Render each list page with a full page of data and assert a fixed upper
+    bound on the number of queries, so N+1 regressions fail loudly.
+    """
+    ROWS = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'password123')
+        cls.admin = User.objects.create_user('librarian', 'password123', role='admin')
+        reviewers = [User.objects.create_user(f'reviewer{i}', 'password123') for i in range(cls.ROWS)]
+        cls.books = [
+            Book.objects.create(
+                title=f'Book {i}',
+                author=f'Author {i % 5}',
+                description='A book used for query budget tests',
+                category='Science',
+                type='paid' if i % 2 else 'free',
+                pdf_file=f'pdfs/book{i}.pdf',
+                is_approved=True,
+            )
+            for i in range(cls.ROWS)
+        ]
+        for i, book in enumerate(cls.books):
+            Favourite.objects.create(user=cls.user, book=book)
+            ReadingHistory.objects.create(user=cls.user, book=book)
+            Purchase.objects.create(user=cls.user, book=book, stripe_payment_id=f'pi_{i}')
+            Review.objects.create(user=reviewers[i], book=cls.books[0], rating=4, comment='Good')
+            Review.objects.create(user=cls.user, book=book, rating=5, comment='Great')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def assertMaxViewQueries(self, budget, view, user):
+        # The custom admin pages live under /admin/, which the Django admin URLconf
+        # matches first, so call the views directly
+        request = RequestFactory().get('/')
+        request.user = user
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{view.__name__} ran {len(queries)} queries (budget {budget}):\n' +
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+
+    def assertMaxQueries(self, budget, url, user=None):
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} ran {len(queries)} queries (budget {budget}):\n' +
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+
+    def test_home(self):
+        # Featured, recent, and the trending ranking from analytics.BookStat
+        self.assertMaxQueries(3, reverse('home'))
+
+    def test_book_list(self):
+        self.assertMaxQueries(3, reverse('book_list'))
+
+    def test_book_detail(self):
+        self.assertMaxQueries(7, reverse('book_detail', args=[self.books[0].id]), user=self.user)
+
+    def test_favourites_list(self):
+        self.assertMaxQueries(4, reverse('favourites_list'), user=self.user)
+
+    def test_reading_history(self):
+        self.assertMaxQueries(4, reverse('reading_history'), user=self.user)
+
+    def test_purchased_books(self):
+        self.assertMaxQueries(3, reverse('purchased_books'), user=self.user)
+
+    def test_admin_book_list(self):
+        self.assertMaxViewQueries(2, views.admin_book_list, self.admin)
+
+    def test_admin_review_list(self):
+        self.assertMaxViewQueries(2, views.admin_review_list, self.admin)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(
+            title='Cached Book',
+            author='Author',
+            description='A book used for page cache tests',
+            category='History',
+            pdf_file='pdfs/cached.pdf',
+            is_approved=True,
+        )
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_warm_home_page_runs_no_queries(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Cached Book')
+
+    def test_cached_detail_page_still_counts_views(self):
+        url = reverse('book_detail', args=[self.book.id])
+        self.client.get(url)
+        self.client.get(url)
+        view_counter.flush()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).view_count, 2)
+
+    def test_book_save_invalidates_cached_pages(self):
+        self.client.get(reverse('home'))
+        self.book.title = 'Renamed Book'
+        self.book.save()
+        self.assertContains(self.client.get(reverse('home')), 'Renamed Book')
+
+
+class AdminBookSaveTests(TestCase):
+    COUNTERS = ('rating_sum', 'rating_count', 'favourite_count', 'read_count', 'view_count')
+
+    def setUp(self):
+        self.admin = User.objects.create_user('librarian', 'password123', role='admin')
+        self.book = Book.objects.create(
+            title='Pending', author='Author', description='d', category='Science', pdf_file='pdfs/pending.pdf',
+        )
+        # Readers keep counting while the admin has the book open
+        Book.objects.filter(pk=self.book.pk).update(**{counter: 3 for counter in self.COUNTERS})
+
+    def counters(self):
+        return tuple(Book.objects.filter(pk=self.book.pk).values_list(*self.COUNTERS).get())
+
+    def test_approving_keeps_the_counters(self):
+        request = RequestFactory().post(reverse('admin_approve_book', args=[self.book.pk]))
+        request.user = self.admin
+        request._messages = CookieStorage(request)
+        with mock.patch.object(views, 'get_object_or_404', return_value=self.book):
+            views.admin_approve_book(request, self.book.pk)
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_approved)
+        self.assertEqual(self.counters(), (3,) * 5)
+
+    def test_editing_keeps_the_counters(self):
+        form = forms.BookForm(data={
+            'title': 'Renamed', 'author': 'Author', 'description': 'd', 'category': 'Science', 'type': 'free',
+        }, instance=self.book)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'Renamed')
+        self.assertEqual(self.counters(), (3,) * 5)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600, VIEW_COUNT_FLUSH_THRESHOLD=100)
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Counted Book', author='A', description='d', category='History', is_approved=True)
+
+    def setUp(self):
+        self.cache = view_counter._cache()
+        self.cache.clear()
+        # The first view would otherwise start the interval with a flush
+        self.cache.add(view_counter.INTERVAL_KEY, True)
+
+    def view_count(self):
+        return Book.objects.get(pk=self.book.pk).view_count
+
+    def test_flush_is_skipped_while_another_holds_the_lock(self):
+        view_counter.record_view(self.book.pk)
+        self.cache.add(view_counter.FLUSH_LOCK_KEY, True)
+        self.assertEqual(view_counter.flush(), {})
+        self.assertEqual(self.view_count(), 0)
+
+        self.cache.delete(view_counter.FLUSH_LOCK_KEY)
+        self.assertEqual(view_counter.flush(), {self.book.pk: 1})
+        self.assertEqual(view_counter.flush(), {})
+        self.assertEqual((self.view_count(), view_counter.pending_views(self.book.pk)), (1, 0))
+
+    def test_views_added_to_the_old_pending_set_during_a_flush_are_kept(self):
+        old_key = view_counter._pending_key(self.cache.get(view_counter.GENERATION_KEY, 0))
+        view_counter.record_view(self.book.pk)
+        view_counter.flush()
+        # A writer that read the generation just before the flush switched it
+        self.cache.incr(view_counter._count_key(self.book.pk))
+        self.cache.set(old_key, {self.book.pk}, timeout=None)
+        self.assertEqual(view_counter.flush(), {self.book.pk: 1})
+        self.assertEqual(self.view_count(), 2)
+
+    def test_flush_never_writes_more_than_it_took(self):
+        view_counter.record_view(self.book.pk)
+        view_counter.record_view(self.book.pk)
+        decr = self.cache.decr
+
+        def racing_decr(key, delta=1, version=None):
+            # Another flusher took one view between get_many() and decr()
+            decr(key, 1)
+            return decr(key, delta)
+
+        with mock.patch.object(self.cache, 'decr', side_effect=racing_decr):
+            self.assertEqual(view_counter.flush(), {self.book.pk: 1})
+        self.assertEqual(view_counter.pending_views(self.book.pk), 0)
+
+    def test_failed_flush_puts_the_views_back(self):
+        view_counter.record_view(self.book.pk)
+        with mock.patch.object(view_counter, 'call_with_retry', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                view_counter.flush()
+        self.assertEqual(view_counter.pending_views(self.book.pk), 1)
+        self.assertEqual(view_counter.flush(), {self.book.pk: 1})
+        self.assertEqual(self.view_count(), 1)
+
+    def test_database_error_does_not_fail_the_detail_page(self):
+        self.cache.delete(view_counter.INTERVAL_KEY)
+        with mock.patch.object(view_counter, 'call_with_retry', side_effect=OperationalError('disk I/O error')):
+            with self.assertLogs('books.view_counter', 'ERROR'):
+                response = self.client.get(reverse('book_detail', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(view_counter.pending_views(self.book.pk), 1)
+
+    def test_idle_worker_flushes_at_the_end_of_a_request(self):
+        view_counter.record_view(self.book.pk)
+        self.cache.delete(view_counter.INTERVAL_KEY)
+        view_counter.flush_if_due()
+        self.assertEqual(self.view_count(), 1)
+
+    def test_command_refuses_a_per_process_buffer(self):
+        with self.assertRaisesMessage(CommandError, 'local to each worker process'):
+            call_command('flush_view_counts')
+
+    def test_cache_without_atomic_incr_is_reported(self):
+        self.assertEqual(checks.check_view_count_cache(), [])
+        for backend in ('django.core.cache.backends.db.DatabaseCache', 'django.core.cache.backends.filebased.FileBasedCache'):
+            counters = {'BACKEND': backend, 'LOCATION': tempfile.gettempdir()}
+            with override_settings(CACHES={**settings.CACHES, 'counters': counters}):
+                errors = checks.check_view_count_cache()
+            self.assertEqual([error.id for error in errors], ['books.E001'])
+            self.assertIn('is not atomic', errors[0].msg)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now()
+        cls.books = []
+        for number in range(5):
+            book = Book.objects.create(title=f'Book {number}', author='A', description='d', category='History')
+            # Same timestamp for two books exercises the id tie-breaker
+            Book.objects.filter(pk=book.pk).update(created_at=start - timedelta(minutes=number // 2 * 2))
+            cls.books.append(book)
+        # Newest first: created_at desc, then id desc
+        cls.order = [book.pk for book in sorted(
+            Book.objects.all(), key=lambda book: (book.created_at, book.pk), reverse=True,
+        )]
+
+    def paginator(self):
+        return KeysetPaginator(Book.objects.all(), 2, keys=('created_at', 'id'))
+
+    def ids(self, page):
+        return [book.pk for book in page]
+
+    def test_forward_and_backward(self):
+        first = self.paginator().get_page(None)
+        self.assertEqual((self.ids(first), first.number, first.has_previous(), first.has_next()), (self.order[:2], 1, False, True))
+        second = self.paginator().get_page(first.next_page_number())
+        third = self.paginator().get_page(second.next_page_number())
+        self.assertEqual((self.ids(second), self.ids(third)), (self.order[2:4], self.order[4:]))
+        self.assertEqual((third.number, third.has_next()), (3, False))
+
+        back = self.paginator().get_page(third.previous_page_number())
+        self.assertEqual((self.ids(back), back.number, back.has_previous()), (self.order[2:4], 2, True))
+        back = self.paginator().get_page(back.previous_page_number())
+        self.assertEqual((self.ids(back), back.number, back.has_previous()), (self.order[:2], 1, False))
+
+    def test_stale_cursors_fall_back_to_a_real_page(self):
+        second = self.paginator().get_page(self.paginator().get_page(None).next_page_number())
+        next_token, previous_token = second.next_page_number(), second.previous_page_number()
+        Book.objects.filter(pk__in=self.order[4:]).delete()
+        last = self.paginator().get_page(next_token)
+        self.assertEqual((self.ids(last), last.has_previous(), last.has_next()), (self.order[2:4], True, False))
+        self.assertTrue(last.previous_page_number())
+
+        Book.objects.filter(pk__in=self.order[:2]).delete()
+        first = self.paginator().get_page(previous_token)
+        self.assertEqual((self.ids(first), first.number, first.has_previous()), (self.order[2:4], 1, False))
+
+    def test_invalid_cursor_gives_the_first_page(self):
+        for token in ('garbage', encode_cursor([1], 'next', 2), encode_cursor(['x', 1], 'sideways', 2)):
+            page = self.paginator().get_page(token)
+            self.assertEqual((self.ids(page), page.number), (self.order[:2], 1))
+
+    def test_empty_list_renders(self):
+        page = KeysetPaginator(Book.objects.none(), 2).get_page(encode_cursor([timezone.now().isoformat(), 1], 'next', 3))
+        self.assertEqual((len(page), page.has_previous(), page.has_next()), (0, False, False))
+        self.assertIsNone(page.next_page_number())
+
+    @override_settings(PAGINATION_MODE='keyset')
+    def test_list_view_with_a_stale_cursor(self):
+        # Older than every book: nothing after it
+        token = encode_cursor(['2000-01-01T00:00:00+00:00', 0], 'next', 9)
+        Book.objects.update(is_approved=True)
+        response = self.client.get(reverse('book_list'), {'page': token})
+        self.assertContains(response, 'Book 4')
+
+
+class CoverRenditionTests(TestCase):
+    def setUp(self):
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.storage.location)
+        buffer = BytesIO()
+        Image.new('RGBA', (400, 600), (200, 30, 30, 128)).save(buffer, format='PNG')
+        self.name = self.storage.save('covers/sample.png', ContentFile(buffer.getvalue()))
+
+    def test_renditions_are_never_upscaled(self):
+        written = covers.generate_renditions(self.name, self.storage)
+        self.assertEqual(len(written), len(covers.COVER_WIDTHS) * len(covers.COVER_FORMATS))
+        with self.storage.open(covers.rendition_name(self.name, 160, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (160, 240))
+        with self.storage.open(covers.rendition_name(self.name, 640, 'jpeg')) as f:
+            self.assertEqual(Image.open(f).size, (400, 600))
+        self.assertEqual(covers.generate_renditions(self.name, self.storage), [])
+
+    def test_renditions_lists_urls_by_format(self):
+        covers.generate_renditions(self.name, self.storage)
+        found = covers.renditions(self.name, self.storage)
+        self.assertEqual([width for _, width in found['webp']], list(covers.COVER_WIDTHS))
+        self.assertTrue(found['jpeg'][0][0].endswith('sample-160w.jpg'))
+
+
+def make_pdf(page_texts):
+    """Minimal PDF with one line of Helvetica text per page"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'
+        )
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+
+    out = BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f'{number} 0 obj\n{obj}\nendobj\n'.encode())
+    xref = out.tell()
+    out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+    for offset in offsets:
+        out.write(f'{offset:010d} 00000 n \n'.encode())
+    out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+    return out.getvalue()
+
+
+class PageTextTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(
+            title='Cell Biology',
+            author='Author',
+            description='A book used for page text tests',
+            category='Science',
+            is_approved=True,
+        )
+        self.book.pdf_file.save('cells.pdf', ContentFile(make_pdf([
+            'An introduction to cells',
+            'The mitochondria is the powerhouse of the cell',
+            '',
+        ])))
+
+    def test_ingest_stores_pages_and_skips_unchanged_files(self):
+        self.assertEqual(page_text.ingest_book(self.book), 3)
+        # Blank pages aren't stored
+        self.assertEqual(list(BookPage.objects.filter(book=self.book).values_list('number', flat=True)), [1, 2])
+        self.assertEqual(len(Book.objects.get(pk=self.book.pk).page_text_sha256), 64)
+        self.assertIsNone(page_text.ingest_book(Book.objects.get(pk=self.book.pk)))
+        self.assertEqual(page_text.ingest_book(self.book, force=True), 3)
+
+    def test_search_pages_returns_highlighted_snippets(self):
+        page_text.ingest_book(self.book)
+        [hit] = search.search_pages('mitochondria')
+        self.assertEqual((hit['book_id'], hit['page']), (self.book.pk, 2))
+        self.assertIn('<mark>mitochondria</mark>', search.snippet_html(hit['snippet']))
+
+        self.book.delete()
+        self.assertEqual(search.search_pages('mitochondria'), [])
+
+    def test_search_inside_links_to_the_matching_page(self):
+        page_text.ingest_book(self.book)
+        response = self.client.get(reverse('search_inside'), {'q': 'powerhouse'})
+        self.assertContains(response, f'{reverse("read_book", args=[self.book.pk])}?page=2')
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book_page_search', args=[self.book.pk]), {'q': 'cells'})
+        self.assertEqual([hit['page'] for hit in response.json()['results']], [1, 2])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, BLOB_GC_GRACE_SECONDS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_user('librarian', 'password123', role='admin')
+
+    def make_book(self, title):
+        book = Book(title=title, author='Author', description='d', category='Science', is_approved=True)
+        book.pdf_file.save('upload.pdf', ContentFile(b'%PDF-1.4 same bytes'), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        return book
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.make_book('First')
+        second = self.make_book('Second')
+        self.assertEqual(first.pdf_file.name, second.pdf_file.name)
+        self.assertRegex(first.pdf_file.name, r'^pdfs/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        _, files = storage.blob_storage().listdir(first.pdf_file.name.rsplit('/', 1)[0])
+        self.assertEqual(len(files), 1)
+
+    def test_blob_is_deleted_with_its_last_book(self):
+        first = self.make_book('First')
+        second = self.make_book('Second')
+        name = first.pdf_file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.blob_storage().exists(name))
+
+        request = RequestFactory().post(reverse('admin_delete_book', args=[second.pk]))
+        request.user = self.admin
+        request._messages = CookieStorage(request)
+        with self.captureOnCommitCallbacks(execute=True):
+            views.admin_delete_book(request, second.pk)
+        self.assertFalse(storage.blob_storage().exists(name))
+
+    def test_identical_upload_racing_another_reuses_its_blob(self):
+        blobs = storage.blob_storage()
+        name = blobs.save('pdfs/upload.pdf', ContentFile(b'%PDF-1.4 raced'))
+        # The other upload links the blob after this one found none
+        with mock.patch.object(type(blobs), 'touch', side_effect=[False, True]):
+            self.assertEqual(blobs.save('pdfs/again.pdf', ContentFile(b'%PDF-1.4 raced')), name)
+        self.assertEqual(os.listdir(blobs.path(storage.INCOMING_DIR)), [])
+        with blobs.open(name) as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 raced')
+
+    def test_recently_used_blobs_are_not_collected(self):
+        blobs = storage.blob_storage()
+        name = blobs.save('pdfs/upload.pdf', ContentFile(b'%PDF-1.4 orphan'))
+        old = time.time() - 7200
+        os.utime(blobs.path(name), (old, old))
+        # An identical upload whose book isn't committed yet
+        self.assertEqual(blobs.save('pdfs/again.pdf', ContentFile(b'%PDF-1.4 orphan')), name)
+        self.assertEqual(storage.collect_garbage([name], grace_seconds=3600), [])
+        self.assertTrue(blobs.exists(name))
+        self.assertEqual(storage.collect_garbage([name], grace_seconds=0), [name])
+        self.assertFalse(blobs.exists(name))
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_user('librarian', 'password123', role='admin')
+        self.client.force_login(self.admin)
+        self.data = b'%PDF-1.4 ' + bytes(range(256)) * 40
+
+    def start(self, **extra):
+        response = self.client.post(reverse('chunked_upload_start'), dict(filename='big.pdf', size=len(self.data), **extra))
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, state, start, end, **headers):
+        return self.client.put(
+            state['url'], self.data[start:end], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}', **headers,
+        )
+
+    def test_resumed_upload_is_attached_to_a_book(self):
+        state = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(self.put(state, 0, 4000).json()['offset'], 4000)
+
+        # A retried or out-of-order chunk is refused with the offset to resume from
+        response = self.put(state, 6000, 8000)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4000))
+        response = self.put(state, 4000, len(self.data), HTTP_X_CHUNK_SHA256=hashlib.sha256(self.data[4000:]).hexdigest())
+        self.assertEqual(response.json()['offset'], len(self.data))
+
+        result = self.client.post(reverse('chunked_upload_complete', args=[state['id']])).json()
+        form = forms.BookForm(data={
+            'title': 'Scanned Textbook', 'author': 'Author', 'description': 'd',
+            'category': 'Science', 'type': 'free', 'pdf_upload': result['id'],
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        book = form.save()
+        with book.pdf_file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(storage.blob_sha256(book.pdf_file.name), hashlib.sha256(self.data).hexdigest())
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        state = self.start(sha256='0' * 64)
+        response = self.put(state, 0, 100, HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 0))
+        self.put(state, 0, len(self.data))
+        response = self.client.post(reverse('chunked_upload_complete', args=[state['id']]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_concurrent_chunks_do_not_overwrite_each_other(self):
+        state = self.start()
+        self.put(state, 0, 4000)
+        upload = ChunkedUpload.objects.get(pk=state['id'])
+        path = uploads._part_path(upload)
+
+        # Another request is still writing a chunk of this upload
+        with open(path, 'rb') as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            response = self.put(state, 4000, 8000)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4000))
+
+        # A retry of the same chunk loaded the upload before the first one was stored
+        stale = ChunkedUpload.objects.get(pk=state['id'])
+        self.put(state, 4000, 8000)
+        with self.assertRaises(uploads.OffsetMismatch):
+            uploads.append_chunk(stale, 4000, BytesIO(b'x' * 4000), 4000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data[:8000])
+
+
+class BookImportTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.pdf = make_pdf(['Imported page'])
+        for name, data in [('a.pdf', self.pdf), ('copy-of-a.pdf', self.pdf), ('b.pdf', make_pdf(['Other'])), ('b.png', b'png')]:
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(data)
+        self.manifest = os.path.join(self.source, 'books.csv')
+        with open(self.manifest, 'w') as f:
+            f.write(
+                'title,author,description,category,type,pdf,cover\n'
+                'Imported Atlas,Author,Maps,Science,,a.pdf,\n'
+                'Unknown Category,Author,d,Cooking,free,b.pdf,\n'
+                'Same PDF Again,Author,d,History,paid,copy-of-a.pdf,\n'
+                'Missing File,Author,d,History,free,missing.pdf,\n'
+                'Second Book,Author,d,Fiction,paid,b.pdf,b.png\n'
+            )
+
+    def run_import(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_books', self.manifest, '--batch-size', '2', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_is_batched_and_idempotent(self):
+        stdout, stderr = self.run_import('--dry-run')
+        self.assertIn('Would import 2 books; 1 already present, 2 invalid', stdout)
+        self.assertIn('Line 3: category:', stderr)
+        self.assertIn('Line 5: pdf: missing.pdf not found', stderr)
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'pdfs')))
+
+        stdout, _ = self.run_import('--approve')
+        self.assertIn('Imported 2 books', stdout)
+        atlas, second = Book.objects.order_by('id')
+        self.assertEqual((atlas.title, atlas.type, atlas.is_approved), ('Imported Atlas', 'free', True))
+        self.assertEqual(storage.blob_sha256(atlas.pdf_file.name), hashlib.sha256(self.pdf).hexdigest())
+        with second.cover_image.open('rb') as f:
+            self.assertEqual(f.read(), b'png')
+        self.assertEqual(list(search.search_books(Book.objects.all(), 'atlas')), [atlas])
+        self.assertEqual(sorted(Task.objects.values_list('kwargs__book_id', flat=True)), [atlas.pk, second.pk])
+        # The source files are copied, not moved
+        self.assertTrue(os.path.exists(os.path.join(self.source, 'a.pdf')))
+
+        stdout, _ = self.run_import()
+        self.assertIn('Imported 0 books; 3 already present', stdout)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_jsonl_manifest(self):
+        self.manifest = os.path.join(self.source, 'books.jsonl')
+        with open(self.manifest, 'w') as f:
+            f.write('{"title": "Json Book", "author": "A", "description": "d", "category": "Science", "pdf": "a.pdf", "is_approved": false}\n')
+            f.write('not json\n')
+        stdout, stderr = self.run_import('--approve')
+        self.assertIn('Imported 1 books; 0 already present, 1 invalid', stdout)
+        self.assertIn('Line 2: Invalid JSON', stderr)
+        self.assertFalse(Book.objects.get().is_approved)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('librarian', 'password123', role='admin')
+        self.reader = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(title='Exported, "Quoted"', author='Author', description='d', category='Science')
+        self.review = Review.objects.create(user=self.reader, book=self.book, rating=4, comment='Good')
+        Purchase.objects.create(user=self.reader, book=self.book, stripe_payment_id='pi_1')
+
+    def export(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('export_data', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_command_streams_jsonl_and_csv(self):
+        stdout, stderr = self.export('books', '--chunk-size', '1')
+        [row] = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual((row['id'], row['title'], row['pdf_file']), (self.book.pk, self.book.title, ''))
+        self.assertIn('Exported 1 books rows; next incremental export: --since ', stderr)
+
+        stdout, _ = self.export('reviews', '--format', 'csv')
+        header, row = csv.reader(StringIO(stdout))
+        self.assertEqual(header[:4], ['id', 'user_id', 'book_id', 'rating'])
+        self.assertEqual(row[:5], [str(self.review.pk), str(self.reader.pk), str(self.book.pk), '4', 'Good'])
+
+    def test_incremental_export_since_a_timestamp(self):
+        later = timezone.now() + timedelta(hours=1)
+        Review.objects.filter(pk=self.review.pk).update(updated_at=later + timedelta(minutes=1))
+        stdout, _ = self.export('reviews', '--since', later.isoformat())
+        self.assertEqual(len(stdout.splitlines()), 1)
+        stdout, _ = self.export('purchases', '--since', later.isoformat())
+        self.assertEqual(stdout, '')
+        with self.assertRaises(CommandError):
+            self.export('purchases', '--since', 'yesterday')
+
+    def test_incremental_books_export_leaves_out_the_counters(self):
+        stdout, _ = self.export('books', '--since', (timezone.now() - timedelta(hours=1)).isoformat(), '--format', 'csv')
+        header, row = csv.reader(StringIO(stdout))
+        self.assertEqual(len(header), len(row))
+        self.assertIn('updated_at', header)
+        self.assertFalse(set(header) & exports.INCREMENTAL_EXCLUDED['books'])
+        stdout, _ = self.export('books', '--format', 'csv')
+        self.assertIn('view_count', next(csv.reader(StringIO(stdout))))
+
+    def test_incremental_export_includes_changed_purchases(self):
+        purchase = Purchase.objects.get()
+        since = timezone.now()
+        Purchase.objects.filter(pk=purchase.pk).update(purchased_at=since - timedelta(days=30))
+        stdout, _ = self.export('purchases', '--since', since.isoformat())
+        self.assertEqual(stdout, '')
+
+        # A refund long after the purchase
+        purchase.refresh_from_db()
+        purchase.is_paid = False
+        purchase.save()
+        stdout, _ = self.export('purchases', '--since', since.isoformat())
+        [row] = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual((row['id'], row['is_paid']), (purchase.pk, False))
+
+        self.assertEqual(exports.parse_since('2026-03-01'), timezone.make_aware(datetime(2026, 3, 1)))
+
+    def test_admin_endpoint_streams_for_admins_only(self):
+        url = reverse('admin_export', args=['purchases'])
+        self.client.force_login(self.reader)
+        self.assertRedirects(self.client.get(url), reverse('home'), fetch_redirect_response=False)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'format': 'csv', 'since': '2000-01-01'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="purchases-', response['Content-Disposition'])
+        header, row = csv.reader(StringIO(b''.join(response.streaming_content).decode()))
+        self.assertEqual((header[3], row[3]), ('stripe_payment_id', 'pi_1'))
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('admin_export', args=['users'])).status_code, 404)
+
+
+class PageSliceTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PDF_DELIVERY_MODE='django', BLOB_GC_GRACE_SECONDS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(
+            title='Sliced', author='Author', description='d', category='Science', is_approved=True,
+        )
+        self.book.pdf_file.save('sliced.pdf', ContentFile(make_pdf(['first page', 'second page', 'third page'])))
+
+    def test_reader_fetches_single_pages(self):
+        from pypdf import PdfReader
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('read_book', args=[self.book.pk]))
+        self.assertNotContains(response, 'id="page-viewer"')
+
+        tasks.process_book_upload(self.book.pk)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).page_count, 3)
+        response = self.client.get(reverse('read_book', args=[self.book.pk]), {'page': 2})
+        self.assertContains(response, 'id="page-viewer"')
+        self.assertContains(response, 'readerGoToPage(2)')
+
+        response = self.client.get(reverse('serve_pdf_page', args=[self.book.pk, 2]))
+        pdf = PdfReader(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual([page.extract_text() for page in pdf.pages], ['second page'])
+        self.assertEqual(self.client.get(reverse('serve_pdf_page', args=[self.book.pk, 4])).status_code, 404)
+
+    def test_slices_are_collected_with_the_blob(self):
+        name = self.book.pdf_file.name
+        page_slices.generate_slices(name, self.book.pdf_file.storage)
+        self.assertEqual(list(storage.all_blob_names()), [name])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertFalse(os.path.exists(storage.blob_storage().path(page_slices.slice_dir(name))))
+
+
+class AsyncPdfDeliveryTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PDF_DELIVERY_MODE='django', PDF_ASYNC_READ_AHEAD=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(
+            title='Streamed', author='Author', description='d', category='Science', is_approved=True,
+        )
+        # Several CHUNK_SIZE reads, the last one short
+        self.content = os.urandom(5 * 64 * 1024 + 123)
+        self.book.pdf_file.save('streamed.pdf', ContentFile(self.content))
+
+    def request(self, user=None, **headers):
+        request = AsyncRequestFactory().get('/', headers=headers)
+        request.user = user or self.user
+        return request
+
+    async def consume(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_streams_whole_file_and_ranges(self):
+        response = await async_views.serve_pdf(self.request(), self.book.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache, must-revalidate')
+        self.assertEqual(await self.consume(response), self.content)
+
+        response = await async_views.serve_pdf(self.request(Range='bytes=70000-70099'), self.book.pk)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 70000-70099/{len(self.content)}')
+        self.assertEqual(await self.consume(response), self.content[70000:70100])
+
+        response = await async_views.serve_pdf(self.request(Range='bytes=0-9,-10'), self.book.pk)
+        body = await self.consume(response)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(self.content[:10], body)
+        self.assertIn(self.content[-10:], body)
+
+        etag = response['ETag']
+        response = await async_views.serve_pdf(self.request(**{'If-None-Match': etag}), self.book.pk)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_access_checks(self):
+        response = await async_views.serve_pdf(self.request(user=AnonymousUser()), self.book.pk)
+        self.assertEqual(response.status_code, 302)
+
+        self.book.type = 'paid'
+        await self.book.asave(update_fields=['type'])
+        with self.assertRaises(Http404):
+            await async_views.serve_pdf(self.request(), self.book.pk)
+        await Purchase.objects.acreate(user=self.user, book=self.book, stripe_payment_id='pi_async')
+        await sync_to_async(entitlements.invalidate)(self.user)
+        response = await async_views.serve_pdf(self.request(), self.book.pk)
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.aclose()
+
+        with self.assertRaises(Http404):
+            await async_views.serve_pdf_page(self.request(), self.book.pk, 1)
+
+    @skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc')
+    async def test_abandoned_download_closes_the_file(self):
+        before = len(os.listdir('/proc/self/fd'))
+        response = await async_views.serve_pdf(self.request(), self.book.pk)
+        content = response.streaming_content
+        self.assertEqual(len(await content.__anext__()), 64 * 1024)
+        # As when the client disconnects: the generators are dropped mid-stream
+        del content, response
+        for _ in range(50):
+            if len(os.listdir('/proc/self/fd')) <= before:
+                break
+            await asyncio.sleep(0.01)
+        self.assertLessEqual(len(os.listdir('/proc/self/fd')), before)
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def make_book(self, title, author='Someone', description='A book.', **kwargs):
+        kwargs.setdefault('is_approved', True)
+        return Book.objects.create(title=title, author=author, description=description, category='Science', **kwargs)
+
+    def search(self, text, books=None):
+        return list(search.search_books(books if books is not None else Book.objects.all(), text))
+
+    def test_title_matches_rank_above_author_and_description_matches(self):
+        in_description = self.make_book('Field Notes', description='A history of astronomy in the old world.')
+        in_author = self.make_book('Collected Letters', author='Astronomy Society')
+        in_title = self.make_book('Astronomy for Beginners')
+        self.assertEqual(self.search('astronomy'), [in_title, in_author, in_description])
+        # Terms are prefix-matched and combined with AND
+        self.assertEqual(self.search('astro begin'), [in_title])
+        ranked = search.search_books(Book.objects.all(), 'astronomy')
+        self.assertGreater(ranked[0].search_rank, ranked[1].search_rank)
+
+    def test_query_syntax_is_not_interpreted(self):
+        book = self.make_book('Cats OR Dogs')
+        self.assertEqual(self.search('"cats" OR NOT* ('), [])
+        self.assertEqual(self.search('cats OR'), [book])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        book = self.make_book('Old Title')
+        self.assertEqual(self.search('old'), [book])
+        book.title = 'New Title'
+        book.save()
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), [book])
+
+        book.delete()
+        self.assertEqual(self.search('new'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_book_list_searches_approved_books_only(self):
+        shown = self.make_book('Marine Biology')
+        self.make_book('Marine Engineering', is_approved=False)
+        response = self.client.get(reverse('book_list'), {'search': 'marine'})
+        self.assertEqual(list(response.context['page_obj']), [shown])
+
+
+class PdfRangeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PDF_DELIVERY_MODE='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(
+            title='Ranged', author='Author', description='d', category='Science', is_approved=True,
+        )
+        self.content = os.urandom(3 * 64 * 1024 + 17)
+        self.book.pdf_file.save('ranged.pdf', ContentFile(self.content))
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        return self.client.get(reverse('serve_pdf', args=[self.book.pk]), headers=headers)
+
+    def test_whole_file_advertises_ranges_and_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.get(If_None_Match=response['ETag']).status_code, 304)
+
+    def test_single_range(self):
+        response = self.get(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        # Suffix range: the last 17 bytes
+        response = self.get(Range='bytes=-17')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-17:])
+
+    def test_multiple_ranges_are_sent_as_multipart_byteranges(self):
+        size = len(self.content)
+        response = self.get(Range='bytes=0-9,70000-70009,-5')
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        expected = [(0, 9), (70000, 70009), (size - 5, size - 1)]
+        for part, (start, end) in zip(parts[1:-1], expected):
+            headers, _, data = part.partition(b'\r\n\r\n')
+            self.assertIn(f'Content-Range: bytes {start}-{end}/{size}'.encode(), headers)
+            self.assertEqual(data.removesuffix(b'\r\n'), self.content[start:end + 1])
+
+    def test_if_range_mismatch_sends_the_whole_file(self):
+        etag = self.get()['ETag']
+        response = self.get(Range='bytes=0-9', If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+        # Malformed headers are ignored rather than refused
+        self.assertEqual(self.get(Range='bytes=9-0').status_code, 200)
+
+    def test_parse_range_header(self):
+        self.assertEqual(pdf_delivery.parse_range_header('bytes=0-4,3-9,20-', 30), [(0, 9), (20, 29)])
+        self.assertEqual(pdf_delivery.parse_range_header('bytes=-50', 30), [(0, 29)])
+        self.assertEqual(pdf_delivery.parse_range_header('bytes=40-50', 30), [])
+        self.assertIsNone(pdf_delivery.parse_range_header('items=0-4', 30))
+        self.assertIsNone(pdf_delivery.parse_range_header('bytes=' + ','.join(['0-1'] * 17), 30))
+
+
+class PdfOffloadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # config.test_settings adds the emulation; without it the client sees what the front server would
+        middleware = [name for name in settings.MIDDLEWARE if name != 'books.middleware.SendfileEmulationMiddleware']
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, PDF_DELIVERY_MODE='x-accel-redirect', PDF_ACCEL_REDIRECT_PREFIX='/protected/',
+            MIDDLEWARE=middleware,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(
+            title='Offloaded', author='Author', description='d', category='Science', is_approved=True,
+        )
+        self.content = os.urandom(4096)
+        self.book.pdf_file.save('offloaded.pdf', ContentFile(self.content))
+        self.client.force_login(self.user)
+        self.url = reverse('serve_pdf', args=[self.book.pk])
+
+    def test_x_accel_redirect_names_the_file_under_the_internal_location(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.book.pdf_file.name}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response.content, b'')
+        # The view's own headers still go out with the front server's response
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(pdf_delivery.resolve_offload_path(response), self.book.pdf_file.path)
+
+    def test_x_sendfile_uses_the_absolute_path(self):
+        with self.settings(PDF_DELIVERY_MODE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.abspath(self.book.pdf_file.path))
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+    def test_redirect_paths_stay_inside_media_root(self):
+        with self.assertRaises(ValueError):
+            pdf_delivery.build_offload_response('/etc/passwd', pdf_delivery.DELIVERY_X_ACCEL_REDIRECT)
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = '/protected/../../etc/passwd'
+        self.assertIsNone(pdf_delivery.resolve_offload_path(response))
+        # Special characters are percent-encoded for nginx and decoded back
+        path = os.path.join(settings.MEDIA_ROOT, 'odd name#1.pdf')
+        response = pdf_delivery.build_offload_response(path, pdf_delivery.DELIVERY_X_ACCEL_REDIRECT)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/odd%20name%231.pdf')
+        self.assertEqual(pdf_delivery.resolve_offload_path(response), path)
+
+    def test_emulation_middleware_serves_ranges_like_the_front_server(self):
+        with self.settings(MIDDLEWARE=['books.middleware.SendfileEmulationMiddleware', *settings.MIDDLEWARE]):
+            response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def make_book(self, title, author='Ada', category='Science', type='free', **kwargs):
+        kwargs.setdefault('is_approved', True)
+        return Book.objects.create(title=title, author=author, description='d', category=category, type=type, **kwargs)
+
+    def test_counts_follow_added_and_removed_books(self):
+        self.make_book('One')
+        second = self.make_book('Two', category='History', type='paid')
+        self.make_book('Hidden', is_approved=False)
+        counts = facets.facet_counts({})
+        self.assertEqual(counts['category'], {'Science': 1, 'History': 1})
+        self.assertEqual(counts['type'], {'free': 1, 'paid': 1})
+        self.assertEqual(counts['author'], [('Ada', 2)])
+
+        # Served from the cached cube until a book changes
+        with self.assertNumQueries(0):
+            facets.facet_counts({'category': 'Science'})
+        third = self.make_book('Three', author='Grace')
+        self.assertEqual(facets.facet_counts({})['category'], {'Science': 2, 'History': 1})
+
+        second.delete()
+        third.is_approved = False
+        third.save()
+        counts = facets.facet_counts({})
+        self.assertEqual(counts['category'], {'Science': 1})
+        self.assertEqual(counts['author'], [('Ada', 1)])
+
+    def test_each_facet_ignores_its_own_filter(self):
+        self.make_book('One')
+        self.make_book('Two', category='History', type='paid')
+        self.make_book('Three', author='Grace', type='paid')
+        counts = facets.facet_counts({'category': 'Science', 'type': 'paid'})
+        self.assertEqual(counts['category'], {'Science': 1, 'History': 1})
+        self.assertEqual(counts['type'], {'free': 1, 'paid': 1})
+        self.assertEqual(counts['author'], [('Grace', 1)])
+
+    def test_search_counts_only_matching_books(self):
+        atlas = self.make_book('Atlas of Stars')
+        self.make_book('Garden Birds', category='Nature')
+        counts = facets.facet_counts({}, search_queryset=search.search_books(Book.objects.filter(is_approved=True), 'atlas'))
+        self.assertEqual(counts['category'], {atlas.category: 1})
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries listed by explain_hot_queries are answered from their indexes, without a sort"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'password123')
+        cls.book = Book.objects.create(title='Planned', author='A', description='d', category='Science', is_approved=True)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan.replace('COVERING INDEX', 'INDEX'))
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_catalogue_queries(self):
+        approved = Book.objects.filter(is_approved=True)
+        self.assertUsesIndex(approved.order_by('-view_count')[:6], 'book_approved_views_idx')
+        self.assertUsesIndex(approved.order_by('-created_at')[:6], 'book_approved_created_idx')
+        self.assertUsesIndex(approved.order_by('-created_at', '-id')[:12], 'book_approved_created_idx')
+        self.assertUsesIndex(approved.filter(category='Science').order_by('-created_at', '-id')[:12], 'book_approved_cat_idx')
+        self.assertUsesIndex(approved.filter(type='paid').order_by('-created_at', '-id')[:12], 'book_approved_type_idx')
+
+    def test_per_user_and_review_queries(self):
+        self.assertUsesIndex(
+            Favourite.objects.filter(user=self.user).select_related('book').order_by('-created_at', '-id')[:12],
+            'favourite_user_created_idx',
+        )
+        self.assertUsesIndex(
+            ReadingHistory.objects.filter(user=self.user).select_related('book').order_by('-last_read_at', '-id')[:12],
+            'history_user_read_idx',
+        )
+        self.assertUsesIndex(
+            Purchase.objects.filter(user=self.user, is_paid=True).order_by().values_list('book_id', flat=True),
+            'purchase_user_paid_idx',
+        )
+        self.assertUsesIndex(
+            Review.objects.filter(book=self.book).select_related('user').order_by('-created_at'), 'review_book_created_idx',
+        )
+        self.assertUsesIndex(
+            Review.objects.select_related('book', 'user').order_by('-created_at')[:20], 'review_created_idx',
+        )
+
+    def test_explain_command_prints_each_plan(self):
+        stdout = StringIO()
+        call_command('explain_hot_queries', '--iterations', '1', stdout=stdout)
+        self.assertIn('book_list_view: category', stdout.getvalue())
+        self.assertIn('book_approved_cat_idx', stdout.getvalue())
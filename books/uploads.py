@@ -0,0 +1,171 @@
+"""
+Resumable chunked uploads for large book PDFs.
+
+The client starts an upload with its size (and optionally its SHA-256), then
+sends the bytes in order as chunks. Each chunk is appended straight to a
+partial file under CHUNKED_UPLOAD_DIR inside the blob store; a chunk may carry
+its own SHA-256, and one that doesn't match is discarded. After an
+interruption the client asks for the current offset and carries on from
+there. A chunk is written under an exclusive lock on the partial file, so a
+retried request can't interleave its bytes with one still being written.
+Completing the upload hashes the file once, checks it against the
+expected checksum and renames it into the content-addressed store, so the
+data is written to disk exactly once.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload
+from .page_text import file_sha256
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or completion request that can't be applied"""
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, expected):
+        super().__init__(f'Expected a chunk starting at byte {expected}')
+        self.expected = expected
+
+
+class UploadBusy(UploadError):
+    """Another request is writing a chunk of the same upload"""
+
+    def __init__(self):
+        super().__init__('Another chunk of this upload is being written')
+
+
+def _part_path(upload):
+    directory = getattr(settings, 'CHUNKED_UPLOAD_DIR', 'uploads')
+    return blob_storage().path(f'{directory}/{upload.pk}.part')
+
+
+def start(user, filename, size, sha256=''):
+    max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+    if size <= 0 or size > max_size:
+        raise UploadError(f'Upload size must be between 1 and {max_size} bytes')
+    if not filename.lower().endswith('.pdf'):
+        raise UploadError('Only PDF files can be uploaded')
+    upload = ChunkedUpload.objects.create(user=user, filename=os.path.basename(filename), size=size, sha256=sha256.lower())
+    path = _part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def append_chunk(upload, start_offset, stream, length, chunk_sha256=''):
+    """
+    Append `length` bytes read from `stream` at `start_offset`, which must be
+    the current offset. Returns the new offset.
+    """
+    if upload.status != ChunkedUpload.STATUS_UPLOADING:
+        raise UploadError('Upload is already complete')
+    if start_offset != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    if length <= 0 or start_offset + length > upload.size:
+        raise UploadError('Chunk exceeds the declared upload size')
+
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        f = open(_part_path(upload), 'r+b')
+    except FileNotFoundError:
+        # Completed (and moved) or expired since the request loaded it
+        raise UploadError('Upload is already complete')
+    with f:
+        # Held until the new offset is stored, so the next chunk starts after this one
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+        # A chunk written while this request was waiting has moved the offset
+        upload.refresh_from_db(fields=['status', 'offset'])
+        if upload.status != ChunkedUpload.STATUS_UPLOADING:
+            raise UploadError('Upload is already complete')
+        if start_offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+
+        # Drop bytes from an earlier chunk that failed before it was recorded
+        f.truncate(start_offset)
+        f.seek(start_offset)
+        while received < length:
+            data = stream.read(min(READ_SIZE, length - received))
+            if not data:
+                break
+            f.write(data)
+            digest.update(data)
+            received += len(data)
+        if received != length:
+            raise UploadError(f'Chunk ended after {received} of {length} bytes')
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise UploadError('Chunk checksum mismatch')
+
+        # Conditional update: the lock only covers writers on this host
+        updated = ChunkedUpload.objects.filter(pk=upload.pk, offset=start_offset).update(
+            offset=start_offset + length, updated_at=timezone.now(),
+        )
+        if not updated:
+            upload.refresh_from_db()
+            raise OffsetMismatch(upload.offset)
+    upload.offset = start_offset + length
+    return upload.offset
+
+
+def complete(upload):
+    """Verify the assembled file and move it into the blob store. Returns the blob name."""
+    if upload.status == ChunkedUpload.STATUS_COMPLETE:
+        return upload.file_name
+    if upload.offset != upload.size:
+        raise UploadError(f'Upload is incomplete: {upload.offset} of {upload.size} bytes received')
+
+    path = _part_path(upload)
+    with open(path, 'rb') as f:
+        sha256 = file_sha256(f)
+    if upload.sha256 and sha256 != upload.sha256:
+        # The data is unusable; make the client start over
+        os.remove(path)
+        upload.delete()
+        raise UploadError('Checksum mismatch; the upload has been discarded')
+
+    with transaction.atomic():
+        name = blob_storage().adopt(path, 'pdfs', sha256, os.path.splitext(upload.filename)[1])
+        upload.status = ChunkedUpload.STATUS_COMPLETE
+        upload.file_name = name
+        upload.sha256 = sha256
+        upload.save(update_fields=['status', 'file_name', 'sha256', 'updated_at'])
+    logger.info(f"Chunked upload {upload.pk} completed as {name}")
+    return name
+
+
+def expire(max_age_hours=None):
+    """
+    Delete uploads idle for longer than CHUNKED_UPLOAD_EXPIRY_HOURS: partial
+    files of unfinished ones, and completed ones never attached to a book
+    (their blobs are left to gc_media). Returns the number removed.
+    """
+    if max_age_hours is None:
+        max_age_hours = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    count = 0
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=cutoff):
+        if upload.status == ChunkedUpload.STATUS_UPLOADING:
+            try:
+                os.remove(_part_path(upload))
+            except FileNotFoundError:
+                pass
+        upload.delete()
+        count += 1
+    return count
@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Protected PDF views: async streaming under ASGI, see books/async_views.py
+pdf_views = async_views if getattr(settings, 'PDF_ASYNC_DELIVERY', False) else views
 
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('books/', views.book_list_view, name='book_list'),
     path('books/<int:book_id>/', views.book_detail_view, name='book_detail'),
     path('books/<int:book_id>/read/', views.read_book_view, name='read_book'),
-    path('books/<int:book_id>/pdf/', views.serve_pdf, name='serve_pdf'),
+    path('books/<int:book_id>/pdf/', pdf_views.serve_pdf, name='serve_pdf'),
+    path('books/<int:book_id>/pages/<int:number>/', pdf_views.serve_pdf_page, name='serve_pdf_page'),
+    path('books/<int:book_id>/search/', views.book_page_search, name='book_page_search'),
+    path('search/', views.search_inside_view, name='search_inside'),
+    # Chunked PDF uploads for the admin book form
+    path('uploads/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('uploads/<uuid:upload_id>/', views.chunked_upload, name='chunked_upload'),
+    path('uploads/<uuid:upload_id>/complete/', views.chunked_upload_complete, name='chunked_upload_complete'),
     # Admin URLs
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('admin/books/', views.admin_book_list, name='admin_book_list'),
@@ -16,5 +27,7 @@ urlpatterns = [
     path('admin/books/<int:book_id>/approve/', views.admin_approve_book, name='admin_approve_book'),
     path('admin/reviews/', views.admin_review_list, name='admin_review_list'),
     path('admin/reviews/<int:review_id>/delete/', views.admin_delete_review, name='admin_delete_review'),
+    # Outside admin/, whose unknown paths django.contrib.admin's catch-all view answers
+    path('exports/<str:name>/', views.admin_export, name='admin_export'),
 ]
 
@@ -0,0 +1,189 @@
+"""
+Write-coalescing view counter for book detail pages.
+
+Views are accumulated in the Django cache (VIEW_COUNT_CACHE) instead of
+hitting the database on every request. Pending increments are written back in
+batches with F('view_count') + n once VIEW_COUNT_FLUSH_INTERVAL seconds have
+passed or VIEW_COUNT_FLUSH_THRESHOLD books are pending, whichever comes first,
+checked on each view and at the end of every request, and again when the
+process exits. A flush that hits a database error puts its views back.
+`manage.py flush_view_counts` forces a flush of a shared (redis) buffer; a
+locmem buffer belongs to the worker that holds it. VIEW_COUNT_CACHE must increment
+atomically (locmem, memcached or Redis); the books.E001 system check (see
+checks.py) reports the db and file backends, whose concurrent views would
+overwrite each other.
+"""
+import atexit
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.db.models import F
+
+from config.routers import unpinned_writes
+from config.sqlite.retry import call_with_retry
+from .models import Book
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'book_views'
+# Writers add book IDs to the pending set of the current generation
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+INTERVAL_KEY = f'{KEY_PREFIX}:interval'
+FLUSH_LOCK_KEY = f'{KEY_PREFIX}:flush_lock'
+# Upper bound on a flush; a crashed flusher's lock expires after this
+FLUSH_LOCK_TIMEOUT = 300
+
+
+def _cache():
+    return caches[getattr(settings, 'VIEW_COUNT_CACHE', 'counters')]
+
+
+def _count_key(book_id):
+    return f'{KEY_PREFIX}:{book_id}'
+
+
+def _pending_key(generation):
+    return f'{KEY_PREFIX}:pending:{generation}'
+
+
+def record_view(book_id):
+    """
+    Buffer one view for a book and flush if the interval or threshold is reached.
+    Returns the number of views still pending for this book.
+    """
+    cache = _cache()
+    key = _count_key(book_id)
+    cache.add(key, 0, timeout=None)
+    pending = cache.incr(key)
+
+    # The pending index is a read-modify-write; if a concurrent writer drops
+    # this ID, the next view of the same book puts it back.
+    pending_key = _pending_key(cache.get(GENERATION_KEY, 0))
+    pending_ids = cache.get(pending_key) or set()
+    if book_id not in pending_ids:
+        pending_ids.add(book_id)
+        cache.set(pending_key, pending_ids, timeout=None)
+
+    threshold = getattr(settings, 'VIEW_COUNT_FLUSH_THRESHOLD', 500)
+    if len(pending_ids) >= threshold or _interval_passed(cache):
+        pending -= _flush_logged().get(book_id, 0)
+    return pending
+
+
+def _interval_passed(cache):
+    interval = getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 60)
+    return cache.add(INTERVAL_KEY, True, timeout=interval)
+
+
+def _flush_logged():
+    # Counting views must never fail the request that triggered the flush
+    try:
+        return flush()
+    except DatabaseError:
+        logger.exception("Could not write buffered views; they stay pending")
+        return {}
+
+
+def flush_if_due(**kwargs):
+    """request_finished receiver: flush once the interval has passed, even without new views"""
+    if _interval_passed(_cache()):
+        _flush_logged()
+
+
+def pending_views(book_id):
+    """Number of buffered views not yet written to the database"""
+    return _cache().get(_count_key(book_id)) or 0
+
+
+def flush(wait=0):
+    """
+    Write all buffered views to the database.
+    Only one flush runs at a time, across every process sharing the cache;
+    if another holds the lock, wait up to `wait` seconds for it, then give up.
+    Returns a {book_id: views_flushed} mapping.
+    """
+    cache = _cache()
+    deadline = time.monotonic() + wait
+    while not cache.add(FLUSH_LOCK_KEY, True, timeout=FLUSH_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return {}
+        time.sleep(0.1)
+    try:
+        return _flush(cache)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _flush(cache):
+    # incr() atomically moves writers on to a fresh pending set. A writer that
+    # read the old generation just before may still add to the old set, so
+    # the set before it is read once more here.
+    cache.add(GENERATION_KEY, 0, timeout=None)
+    generation = cache.incr(GENERATION_KEY) - 1
+    drained = [_pending_key(generation - 1), _pending_key(generation)]
+    pending_ids = set().union(*cache.get_many(drained).values())
+    cache.delete(drained[0])
+    if not pending_ids:
+        return {}
+
+    keys = {_count_key(book_id): book_id for book_id in pending_ids}
+    flushed = {}
+    by_amount = defaultdict(list)
+    for key, count in cache.get_many(list(keys)).items():
+        if not count:
+            continue
+        # decr rather than delete so views recorded during the flush are kept
+        try:
+            remaining = cache.decr(key, count)
+        except ValueError:
+            # Evicted since get_many(); those views are gone
+            continue
+        if remaining < 0:
+            # Never write more than was actually taken out of the counter
+            cache.incr(key, -remaining)
+            count += remaining
+            if count <= 0:
+                continue
+        flushed[keys[key]] = count
+        by_amount[count].append(keys[key])
+
+    # One UPDATE per distinct increment keeps the number of statements small
+    written = set()
+    try:
+        with unpinned_writes():
+            for count, book_ids in by_amount.items():
+                call_with_retry(Book.objects.filter(pk__in=book_ids).update, view_count=F('view_count') + count)
+                written.update(book_ids)
+    except DatabaseError:
+        _restore(cache, generation + 1, {book_id: count for book_id, count in flushed.items() if book_id not in written})
+        raise
+    if flushed:
+        page_cache.bump('book_views', *[f'book:{book_id}' for book_id in flushed])
+
+    logger.info(f"Flushed {sum(flushed.values())} buffered views for {len(flushed)} books")
+    return flushed
+
+
+def _restore(cache, generation, counts):
+    """Put views taken out for a failed write back into the buffer for the next flush"""
+    for book_id, count in counts.items():
+        key = _count_key(book_id)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, count)
+    pending_key = _pending_key(generation)
+    cache.set(pending_key, (cache.get(pending_key) or set()) | set(counts), timeout=None)
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write buffered views at exit")
+
+
+atexit.register(_flush_at_exit)
@@ -1,37 +1,53 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q, Count
-from django.core.paginator import Paginator
-from django.http import HttpResponse, Http404, FileResponse
+from django.http import HttpResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from django.contrib import messages
+from django.db import transaction
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 import os
 import logging
-from .models import Book
+from .models import Book, ChunkedUpload
 from .decorators import admin_required
 from .forms import BookForm
+from .pagination import paginate
+from .counters import adjust_counters
+from . import view_counter
+from .pdf_delivery import (
+    DELIVERY_DJANGO, build_file_response, build_offload_response, get_delivery_mode,
+)
+from . import exports, facets, page_cache, page_slices, search, uploads
+from .page_cache import cache_anonymous_page
 from users.models import User
 from reviews.models import Review
 from favourites.models import Favourite
 from history.models import ReadingHistory
-from payments.models import Purchase
+from history import progress
+from payments import entitlements
+from analytics import events, rollup
+from analytics.models import Event
 
 logger = logging.getLogger(__name__)
 
 
+@cache_anonymous_page(['catalogue', 'book_views', 'trending'])
 def home_view(request):
     """Home page with featured books"""
     featured_books = Book.objects.filter(is_approved=True).order_by('-view_count')[:6]
     recent_books = Book.objects.filter(is_approved=True).order_by('-created_at')[:6]
     
     context = {
+        'trending_books': rollup.trending(limit=6),
         'featured_books': featured_books,
         'recent_books': recent_books,
     }
     return render(request, 'home.html', context)
 
 
+@cache_anonymous_page(['catalogue', 'book_views'])
 def book_list_view(request):
     """List all approved books with search and filters"""
     books = Book.objects.filter(is_approved=True)
@@ -39,11 +55,8 @@ def book_list_view(request):
     # Search
     search_query = request.GET.get('search', '')
     if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        books = search.search_books(books, search_query)
+    search_results = books if search_query else None
     
     # Filter by category
     category = request.GET.get('category', '')
@@ -60,14 +73,17 @@ def book_list_view(request):
     if book_type:
         books = books.filter(type=book_type)
     
-    # Pagination
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (relevance-ranked search results can't be keyset-paginated)
+    page_obj = paginate(request, books, 12, keys=None if search_query else ('created_at', 'id'))
     
-    # Get unique authors and categories for filters
-    authors = Book.objects.filter(is_approved=True).values_list('author', flat=True).distinct()
-    categories = Book.CATEGORY_CHOICES
+    # Facet counts for the filter sidebar, served from the cached facet cube
+    facet_filters = {'author': author, 'category': category, 'type': book_type}
+    counts = facets.facet_counts(facet_filters, search_queryset=search_results)
+    authors = counts['author']
+    categories = [
+        (code, name, counts['category'].get(code, 0))
+        for code, name in Book.CATEGORY_CHOICES
+    ]
     
     context = {
         'page_obj': page_obj,
@@ -77,20 +93,27 @@ def book_list_view(request):
         'selected_type': book_type,
         'authors': authors,
         'categories': categories,
+        'type_counts': counts['type'],
     }
     return render(request, 'book_list.html', context)
 
 
+def _record_cached_view(request, book_id):
+    view_counter.record_view(book_id)
+    events.record(Event.VIEW, book_id)
+
+
+@cache_anonymous_page(lambda book_id: [f'book:{book_id}'], on_hit=_record_cached_view)
 def book_detail_view(request, book_id):
     """Book detail page"""
     book = get_object_or_404(Book, id=book_id, is_approved=True)
     
-    # Increment view count
-    book.view_count += 1
-    book.save(update_fields=['view_count'])
+    # Buffer the view; the database is updated in batches by view_counter.flush()
+    book.view_count += view_counter.record_view(book.id)
+    events.record(Event.VIEW, book.id, request.user)
     
     # Get reviews
-    reviews = Review.objects.filter(book=book).order_by('-created_at')
+    reviews = Review.objects.filter(book=book).select_related('user').order_by('-created_at')
     
     # Check if user has favorited this book
     is_favorited = False
@@ -104,7 +127,7 @@ def book_detail_view(request, book_id):
             pass
         # Check if user has purchased this book (for paid books)
         if book.type == 'paid':
-            is_purchased = Purchase.objects.filter(user=request.user, book=book, is_paid=True).exists()
+            is_purchased = entitlements.has_purchased(request.user, book)
     
     context = {
         'book': book,
@@ -113,6 +136,7 @@ def book_detail_view(request, book_id):
         'user_review': user_review,
         'average_rating': book.get_average_rating(),
         'is_purchased': is_purchased,
+        'reviews_version': page_cache.get_version(f'book:{book.id}'),
     }
     return render(request, 'book_detail.html', context)
 
@@ -126,14 +150,11 @@ def read_book_view(request, book_id):
     book = get_object_or_404(Book, id=book_id, is_approved=True)
     
     # Check if book is free OR user has purchased it
-    if book.type == 'paid':
-        # Check if user has purchased this book
-        is_purchased = Purchase.objects.filter(user=request.user, book=book, is_paid=True).exists()
-        if not is_purchased:
-            return render(request, 'reader.html', {
-                'book': book,
-                'error': 'This is a paid book. Reading restricted.'
-            })
+    if not entitlements.can_read(request.user, book):
+        return render(request, 'reader.html', {
+            'book': book,
+            'error': 'This is a paid book. Reading restricted.'
+        })
     
     # Verify PDF file exists
     if not book.pdf_file:
@@ -159,20 +180,111 @@ def read_book_view(request, book_id):
             'error': 'Error loading PDF file.'
         })
     
-    # Track reading history
-    if request.user.is_authenticated:
-        ReadingHistory.objects.update_or_create(
-            user=request.user,
-            book=book,
-            defaults={}
-        )
-    
     # Pass the secure PDF URL to template (not direct media URL)
     pdf_url = reverse('serve_pdf', args=[book.id])
     
+    # Jump to a page, e.g. from a search-inside-books hit, else resume where the user left off
+    try:
+        start_page = max(1, int(request.GET['page']))
+    except (KeyError, ValueError):
+        start_page = progress.last_page(request.user.id, book.id) or 1
+    
+    # Track reading history; buffered and written in batches by history.progress
+    progress.record(request.user.id, book.id)
+    events.record(Event.READ, book.id, request.user)
+    
+    # Page-by-page mode once the worker has sliced the PDF; ?mode=document
+    # embeds the whole file instead
+    page_count = None
+    if request.GET.get('mode') != 'document':
+        page_count = page_slices.page_count(book.pdf_file.name, book.pdf_file.storage)
+    
     return render(request, 'reader.html', {
         'book': book,
-        'pdf_url': pdf_url
+        'pdf_url': pdf_url,
+        'start_page': min(start_page, page_count) if page_count else start_page,
+        'page_count': page_count,
+        # Slices of a given PDF never change, so page URLs can be cached by version
+        'page_version': os.path.basename(book.pdf_file.name)[:12],
+    })
+
+
+@login_required
+def serve_pdf_page(request, book_id, number):
+    """One page of a book as a single-page PDF, with the same access checks as serve_pdf"""
+    book = get_object_or_404(Book, id=book_id, is_approved=True)
+    if not entitlements.can_read(request.user, book):
+        raise Http404("This is a paid book. Purchase required to access.")
+    if not book.pdf_file:
+        raise Http404("PDF file not found.")
+    
+    storage = book.pdf_file.storage
+    path = storage.path(page_slices.slice_name(book.pdf_file.name, number))
+    if not os.path.exists(path):
+        raise Http404("Page not found.")
+    
+    delivery_mode = get_delivery_mode()
+    if delivery_mode == DELIVERY_DJANGO:
+        response = build_file_response(request, path, content_type='application/pdf')
+    else:
+        response = build_offload_response(path, delivery_mode, content_type='application/pdf')
+    return protect_pdf_page_response(response)
+
+
+def protect_pdf_page_response(response):
+    """Headers for a single-page PDF (also used by books.async_views)"""
+    response['Content-Disposition'] = 'inline'
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['X-Frame-Options'] = 'SAMEORIGIN'
+    # The reader versions page URLs by PDF content, so the browser may keep
+    # them; "private" keeps them out of shared caches
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+# Pages shown per book on the search-inside-books results page
+SEARCH_INSIDE_PAGES_PER_BOOK = 3
+
+
+def search_inside_view(request):
+    """Search the text of every approved book, grouped by book with page snippets"""
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        hits = search.search_pages(query, Book.objects.filter(is_approved=True), limit=200)
+        books = Book.objects.in_bulk({hit['book_id'] for hit in hits})
+        by_book = {}
+        # Hits arrive best first, so books are ordered by their best page
+        for hit in hits:
+            entry = by_book.setdefault(hit['book_id'], {'book': books[hit['book_id']], 'pages': [], 'total': 0})
+            entry['total'] += 1
+            if len(entry['pages']) < SEARCH_INSIDE_PAGES_PER_BOOK:
+                entry['pages'].append({'number': hit['page'], 'snippet': search.snippet_html(hit['snippet'])})
+        results = list(by_book.values())
+    
+    context = {
+        'query': query,
+        'results': results,
+    }
+    return render(request, 'search_inside.html', context)
+
+
+@login_required
+def book_page_search(request, book_id):
+    """JSON page hits inside one book, for the reader's search box"""
+    book = get_object_or_404(Book, id=book_id, is_approved=True)
+    if not entitlements.can_read(request.user, book):
+        raise Http404("This is a paid book. Purchase required to access.")
+    
+    query = request.GET.get('q', '').strip()
+    hits = search.search_pages(query, Book.objects.filter(pk=book.pk), limit=100) if query else []
+    hits.sort(key=lambda hit: hit['page'])
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {'page': hit['page'], 'snippet': search.snippet_html(hit['snippet'])}
+            for hit in hits
+        ],
     })
 
 
@@ -191,11 +303,9 @@ def serve_pdf(request, book_id):
             raise Http404("You must be logged in to read this book.")
         
         # Check if book is free OR user has purchased it
-        if book.type == 'paid':
-            is_purchased = Purchase.objects.filter(user=request.user, book=book, is_paid=True).exists()
-            if not is_purchased:
-                logger.warning(f"User {request.user.userId} attempted to access unpaid book {book_id}")
-                raise Http404("This is a paid book. Purchase required to access.")
+        if not entitlements.can_read(request.user, book):
+            logger.warning(f"User {request.user.userId} attempted to access unpaid book {book_id}")
+            raise Http404("This is a paid book. Purchase required to access.")
         
         # Get PDF file path
         if not book.pdf_file:
@@ -209,20 +319,17 @@ def serve_pdf(request, book_id):
             logger.error(f"PDF file not found at path: {pdf_path}")
             raise Http404("PDF file not found.")
         
-        # Open file properly and serve with security headers
-        pdf_file = open(pdf_path, 'rb')
-        response = FileResponse(pdf_file, content_type='application/pdf')
+        # Serve the whole file or the requested byte ranges (206) with ETag validation,
+        # or hand the transfer to the front server when offloading is configured
+        delivery_mode = get_delivery_mode()
+        if delivery_mode == DELIVERY_DJANGO:
+            response = build_file_response(request, pdf_path, content_type='application/pdf')
+        else:
+            response = build_offload_response(pdf_path, delivery_mode, content_type='application/pdf')
         
-        # Set security headers to prevent download and caching
-        safe_filename = book.title.replace('"', "'").replace('\n', ' ').replace('\r', '')
-        response['Content-Disposition'] = f'inline; filename="{safe_filename}.pdf"'
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-Frame-Options'] = 'SAMEORIGIN'  # Allow iframe embedding from same origin
-        response['Cache-Control'] = 'no-store, no-cache, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
+        protect_pdf_response(response, book)
         
-        logger.info(f"PDF served successfully for book {book_id} to user {request.user.userId}")
+        logger.info(f"PDF served ({response.status_code}) for book {book_id} to user {request.user.userId}")
         return response
     
     except Http404:
@@ -232,6 +339,22 @@ def serve_pdf(request, book_id):
         raise Http404("An error occurred while loading the PDF.")
 
 
+def protect_pdf_response(response, book):
+    """
+    Set security headers to prevent download and shared caching.
+    "private, no-cache" still lets the viewer revalidate with If-None-Match/If-Range,
+    and every revalidation goes through the view's access checks.
+    """
+    safe_filename = book.title.replace('"', "'").replace('\n', ' ').replace('\r', '')
+    response['Content-Disposition'] = f'inline; filename="{safe_filename}.pdf"'
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['X-Frame-Options'] = 'SAMEORIGIN'  # Allow iframe embedding from same origin
+    response['Cache-Control'] = 'private, no-cache, must-revalidate'
+    response['Pragma'] = 'no-cache'
+    response['Expires'] = '0'
+    return response
+
+
 # Admin Views
 @admin_required
 def admin_dashboard(request):
@@ -250,6 +373,10 @@ def admin_dashboard(request):
     # Books pending approval
     pending_approval = Book.objects.filter(is_approved=False).order_by('-created_at')
     
+    # Daily activity chart, read from the rolled-up stats rather than the event log
+    activity = rollup.daily_activity(days=14)
+    peak = max([day['views'] + day['reads'] for day in activity] + [1])
+    
     context = {
         'total_books': total_books,
         'approved_books': approved_books,
@@ -260,6 +387,10 @@ def admin_dashboard(request):
         'total_reads': total_reads,
         'recent_books': recent_books,
         'pending_approval': pending_approval,
+        'activity': activity,
+        'activity_peak': peak,
+        'trending_books': rollup.trending(limit=5),
+        'export_names': list(exports.EXPORTS),
     }
     return render(request, 'admin/dashboard.html', context)
 
@@ -285,9 +416,7 @@ def admin_book_list(request):
         books = books.filter(is_approved=False)
     
     # Pagination
-    paginator = Paginator(books, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, books, 20, keys=('created_at', 'id'))
     
     context = {
         'page_obj': page_obj,
@@ -309,7 +438,7 @@ def admin_add_book(request):
     else:
         form = BookForm()
     
-    context = {'form': form}
+    context = {'form': form, 'chunked_upload_threshold': settings.CHUNKED_UPLOAD_CHUNK_SIZE}
     return render(request, 'admin/book_form.html', context)
 
 
@@ -327,7 +456,7 @@ def admin_edit_book(request, book_id):
     else:
         form = BookForm(instance=book)
     
-    context = {'form': form, 'book': book}
+    context = {'form': form, 'book': book, 'chunked_upload_threshold': settings.CHUNKED_UPLOAD_CHUNK_SIZE}
     return render(request, 'admin/book_form.html', context)
 
 
@@ -351,7 +480,8 @@ def admin_approve_book(request, book_id):
     """Approve a book"""
     book = get_object_or_404(Book, id=book_id)
     book.is_approved = True
-    book.save()
+    # The counters are only ever changed with F() updates; don't write back the values read above
+    book.save(update_fields=['is_approved', 'updated_at'])
     messages.success(request, f'Book "{book.title}" approved successfully!')
     return redirect('admin_dashboard')
 
@@ -359,7 +489,7 @@ def admin_approve_book(request, book_id):
 @admin_required
 def admin_review_list(request):
     """List all reviews for admin management"""
-    reviews = Review.objects.all().order_by('-created_at')
+    reviews = Review.objects.select_related('book', 'user').order_by('-created_at')
     
     # Search
     search_query = request.GET.get('search', '')
@@ -371,9 +501,7 @@ def admin_review_list(request):
         )
     
     # Pagination
-    paginator = Paginator(reviews, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, reviews, 20, keys=('created_at', 'id'))
     
     context = {
         'page_obj': page_obj,
@@ -388,9 +516,114 @@ def admin_delete_review(request, review_id):
     review = get_object_or_404(Review, id=review_id)
     
     if request.method == 'POST':
-        review.delete()
+        with transaction.atomic():
+            # Rating as of the delete; a concurrent delete leaves nothing to count
+            rating = Review.objects.select_for_update().filter(pk=review.pk).values_list('rating', flat=True).first()
+            deleted, _ = Review.objects.filter(pk=review.pk).delete()
+            if deleted:
+                adjust_counters(review.book_id, rating_sum=-rating, rating_count=-1)
         messages.success(request, 'Review deleted successfully!')
         return redirect('admin_review_list')
     
     context = {'review': review}
     return render(request, 'admin/review_confirm_delete.html', context)
+
+
+@admin_required
+def admin_export(request, name):
+    """Stream one export (see books/exports.py): ?format=jsonl|csv&since=<ISO date/time>"""
+    if name not in exports.EXPORTS:
+        raise Http404("Unknown export")
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in exports.FORMATS:
+        return HttpResponse(f"format must be one of {', '.join(exports.FORMATS)}", status=400, content_type='text/plain')
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = exports.parse_since(request.GET['since'])
+        except ValueError as e:
+            return HttpResponse(str(e), status=400, content_type='text/plain')
+
+    started = timezone.now()
+    rows = exports.queryset(name, since)
+    # Rows are read while the response streams, after the request has left
+    # the replica router's middleware; pick the database now
+    rows = rows.using(rows.db)
+    response = StreamingHttpResponse(
+        exports.render(name, fmt, rows, since=since), content_type=f'{exports.FORMATS[fmt]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}-{started:%Y%m%dT%H%M%S}.{fmt}"'
+    # Pass as ?since= for the next incremental export
+    response['X-Export-Started'] = started.isoformat()
+    return response
+
+
+def _upload_state(upload):
+    return {
+        'id': str(upload.pk),
+        'offset': upload.offset,
+        'size': upload.size,
+        'status': upload.status,
+        'chunk_size': getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+        'url': reverse('chunked_upload', args=[upload.pk]),
+    }
+
+
+@admin_required
+@require_POST
+def chunked_upload_start(request):
+    """Start a resumable PDF upload: POST filename, size and optionally sha256"""
+    try:
+        upload = uploads.start(
+            request.user,
+            request.POST.get('filename', ''),
+            int(request.POST.get('size', 0)),
+            request.POST.get('sha256', ''),
+        )
+    except (ValueError, uploads.UploadError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@admin_required
+def chunked_upload(request, upload_id):
+    """
+    GET: current offset, to resume after an interruption.
+    PUT: append the request body at the offset given by
+    "Content-Range: bytes <start>-<end>/<size>", optionally with X-Chunk-SHA256.
+    """
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(_upload_state(upload))
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        unit, _, byte_range = request.headers.get('Content-Range', '').partition(' ')
+        first, last = byte_range.split('/')[0].split('-')
+        start, length = int(first), int(last) - int(first) + 1
+        if unit != 'bytes':
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'A "Content-Range: bytes start-end/size" header is required'}, status=400)
+    
+    try:
+        # Streamed from the socket to the partial file; never buffered whole
+        uploads.append_chunk(upload, start, request, length, request.headers.get('X-Chunk-SHA256', ''))
+    except (uploads.OffsetMismatch, uploads.UploadBusy) as e:
+        return JsonResponse(dict(_upload_state(upload), error=str(e)), status=409)
+    except uploads.UploadError as e:
+        return JsonResponse(dict(_upload_state(upload), error=str(e)), status=400)
+    return JsonResponse(_upload_state(upload))
+
+
+@admin_required
+@require_POST
+def chunked_upload_complete(request, upload_id):
+    """Verify the checksum and store the file; the returned id goes into BookForm.pdf_upload"""
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    try:
+        uploads.complete(upload)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(dict(_upload_state(upload), sha256=upload.sha256))
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Set PDF_ASYNC_DELIVERY=1 when serving this application so protected PDFs are
+streamed by the async views in books/async_views.py.
 """
 
 import os
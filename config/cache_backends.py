@@ -0,0 +1,175 @@
+"""
+Cache backends that record hits, misses and evictions.
+
+Each process keeps its own counters and periodically writes them to
+CACHE_STATS_DIR/<pid>.json; `manage.py cache_stats` adds up every process's
+file, so the numbers cover all workers whatever the backend.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+
+STATS_FIELDS = ('hits', 'misses', 'evictions')
+# Seconds between writes of this process's counters
+PUBLISH_INTERVAL = 5
+
+_stats = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+_backends = {}
+_lock = threading.Lock()
+_local = threading.local()
+_last_publish = 0.0
+
+
+def stats_dir():
+    from django.conf import settings
+    return str(getattr(settings, 'CACHE_STATS_DIR', os.path.join(tempfile.gettempdir(), 'digital_library_cache_stats')))
+
+
+def publish_stats():
+    """Write this process's counters to its stats file"""
+    global _last_publish
+    with _lock:
+        snapshot = {
+            name: dict(counts, backend=_backends.get(name, '?'))
+            for name, counts in _stats.items()
+        }
+        _last_publish = time.monotonic()
+    if not snapshot:
+        return
+    directory = stats_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'pid': os.getpid(), 'updated': time.time(), 'caches': snapshot}, f)
+    os.replace(tmp_path, path)
+
+
+def record(name, **deltas):
+    with _lock:
+        counts = _stats[name]
+        for field, delta in deltas.items():
+            counts[field] += delta
+        due = time.monotonic() - _last_publish >= PUBLISH_INTERVAL
+    if due:
+        try:
+            publish_stats()
+        except OSError:
+            pass
+
+
+def has_atomic_incr(cache):
+    """
+    Whether incr()/decr() on `cache` are atomic. LocMemCache holds a lock and
+    memcached and Redis increment server side; DatabaseCache and
+    FileBasedCache inherit BaseCache.incr(), a get() followed by a set().
+    """
+    return isinstance(cache, (LocMemCache, BaseMemcachedCache, RedisCache))
+
+
+def read_all_stats():
+    """Per-process stats dicts from every stats file"""
+    directory = stats_dir()
+    if not os.path.isdir(directory):
+        return []
+    results = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                results.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return results
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+    directory = stats_dir()
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(directory, filename))
+
+
+atexit.register(lambda: publish_stats() if _stats else None)
+
+
+class CacheStatsMixin:
+    """Counts hits and misses on get()/get_many() and evictions on _cull()"""
+    _MISSING = object()
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.stats_name = params.get('STATS_NAME', location or self.__class__.__name__)
+        _backends[self.stats_name] = self.__class__.__name__
+
+    def _outermost(self):
+        # BaseCache.get_many() calls get() per key; only count the outer call
+        depth = getattr(_local, 'depth', 0)
+        return depth == 0
+
+    def get(self, key, default=None, version=None):
+        outer = self._outermost()
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        try:
+            value = super().get(key, self._MISSING, version)
+        finally:
+            _local.depth -= 1
+        if outer:
+            record(self.stats_name, **({'hits': 1} if value is not self._MISSING else {'misses': 1}))
+        return default if value is self._MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        outer = self._outermost()
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            _local.depth -= 1
+        if outer and keys:
+            record(self.stats_name, hits=len(found), misses=len(keys) - len(found))
+        return found
+
+
+class LocMemStatsCache(CacheStatsMixin, LocMemCache):
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        record(self.stats_name, evictions=before - len(self._cache))
+
+
+class FileBasedStatsCache(CacheStatsMixin, FileBasedCache):
+    def _cull(self):
+        # Called on every set(), so avoid listing the directory a second time
+        num_entries = len(self._list_cache_files())
+        if num_entries < self._max_entries:
+            return
+        super()._cull()
+        evicted = num_entries if self._cull_frequency == 0 else int(num_entries / self._cull_frequency)
+        record(self.stats_name, evictions=evicted)
+
+
+class DatabaseStatsCache(CacheStatsMixin, DatabaseCache):
+    def _cull(self, db, cursor, now, num):
+        super()._cull(db, cursor, now, num)
+        # rowcount of the last DELETE: culled rows, or expired rows if no cull was needed
+        if cursor.rowcount and cursor.rowcount > 0:
+            record(self.stats_name, evictions=cursor.rowcount)
+
+
+class RedisStatsCache(CacheStatsMixin, RedisCache):
+    """Redis evicts on its own, so only hits and misses are counted"""
@@ -0,0 +1,92 @@
+"""
+Named cache configuration, selected with environment variables.
+
+    CACHE_BACKEND=locmem|file|db|redis   backend for every named cache (default: locmem)
+    CACHE_<NAME>_BACKEND=...             override for one cache, e.g. CACHE_SESSIONS_BACKEND=db
+    CACHE_DIR=/path                      root directory for file caches
+    CACHE_REDIS_URL=redis://host:6379/0  server for redis caches (needs the redis package)
+
+locmem is per process. Multi-worker deployments should use file (a shared
+directory), db (a table in the project database; run `manage.py
+createcachetable` once) or redis so workers see the same entries and
+invalidations.
+
+The `counters` cache holds the view-count buffer, which needs an atomic
+incr(). file and db don't have one, so it ignores CACHE_BACKEND and stays on
+locmem (one buffer per worker) unless CACHE_COUNTERS_BACKEND is set, e.g. to
+redis for one buffer shared by every worker.
+"""
+import os
+
+# Named caches and what they hold
+CACHE_NAMES = {
+    'default': 'general purpose',
+    'counters': 'the view-count buffer',
+    'catalogue': 'hot catalogue data: facets and anonymous pages',
+    'entitlements': "users' paid book IDs",
+    'template_fragments': 'rendered {% cache %} fragments',
+    'sessions': 'session data (cached_db session engine)',
+}
+
+BACKENDS = {
+    'locmem': 'config.cache_backends.LocMemStatsCache',
+    'file': 'config.cache_backends.FileBasedStatsCache',
+    'db': 'config.cache_backends.DatabaseStatsCache',
+    'redis': 'config.cache_backends.RedisStatsCache',
+}
+# Caches that only leave locmem through their own CACHE_<NAME>_BACKEND
+LOCAL_BY_DEFAULT = {'counters'}
+
+TIMEOUTS = {
+    'default': 300,
+    'counters': 300,
+    'catalogue': 3600,
+    'entitlements': 3600,
+    'template_fragments': 600,
+    'sessions': 60 * 60 * 24 * 14,
+}
+
+MAX_ENTRIES = {
+    'default': 10000,
+    'counters': 10000,
+    'catalogue': 5000,
+    'entitlements': 20000,
+    'template_fragments': 20000,
+    'sessions': 50000,
+}
+
+
+def build_caches(base_dir, environ=os.environ):
+    """Build the CACHES setting from the environment"""
+    default_backend = environ.get('CACHE_BACKEND', 'locmem')
+    cache_dir = environ.get('CACHE_DIR', os.path.join(str(base_dir), 'var', 'cache'))
+    redis_url = environ.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+    caches = {}
+    for name in CACHE_NAMES:
+        fallback = 'locmem' if name in LOCAL_BY_DEFAULT else default_backend
+        backend = environ.get(f'CACHE_{name.upper()}_BACKEND', fallback)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown cache backend {backend!r} for {name}; use one of {', '.join(BACKENDS)}")
+        options = {'MAX_ENTRIES': MAX_ENTRIES[name]}
+        key_prefix = 'dl'
+        if backend == 'locmem':
+            location = f'digital-library-{name}'
+        elif backend == 'file':
+            location = os.path.join(cache_dir, name)
+        elif backend == 'redis':
+            location = redis_url
+            # Redis evicts by its own maxmemory policy; every cache shares one keyspace
+            options = {}
+            key_prefix = f'dl:{name}'
+        else:
+            location = f'cache_{name}'
+        caches[name] = {
+            'BACKEND': BACKENDS[backend],
+            'LOCATION': location,
+            'TIMEOUT': TIMEOUTS[name],
+            'KEY_PREFIX': key_prefix,
+            'STATS_NAME': name,
+            'OPTIONS': options,
+        }
+    return caches
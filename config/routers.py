@@ -0,0 +1,100 @@
+"""
+Primary/replica database routing with read-your-writes stickiness.
+
+DATABASE_REPLICAS lists the aliases that receive read-only ORM queries made
+while serving a request. Everything else goes to `default`: writes; reads
+inside a transaction; reads of PRIMARY_ONLY_APPS; reads made after the request
+has written anything; and all queries from management commands and workers.
+
+After a request writes, ReplicaPinningMiddleware sets a short-lived cookie
+so the same client keeps reading from the primary for
+REPLICA_PIN_SECONDS. That covers the replica's replication lag, so users see
+their own reviews, favourites and purchases straight away.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+# Apps whose rows must never be read stale: sessions would log users out, and
+# the task queue claims rows it has just read
+PRIMARY_ONLY_APPS = {'sessions', 'taskqueue'}
+
+# None outside a request, else {'pinned': bool, 'wrote': bool} for the current request
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+@contextmanager
+def unpinned_writes():
+    """
+    Run shared bookkeeping writes (view counts, analytics) flushed by whichever
+    request comes along on the primary without pinning that request's client
+    """
+    token = _request_state.set(None)
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        pool = replicas()
+        if (
+            state is None
+            or state['pinned']
+            or not pool
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(pool)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            # Later reads in this request, and the client's next requests, see the write
+            state['pinned'] = state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        return obj1._state.db in pool and obj2._state.db in pool
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated directly
+        return db not in replicas()
+
+
+class ReplicaPinningMiddleware:
+    """Tracks writes per request and pins clients that wrote to the primary"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = {'pinned': pinned_until > time.time(), 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state['wrote']:
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
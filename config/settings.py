@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .caches import build_caches
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,10 +46,14 @@ INSTALLED_APPS = [
     'favourites',
     'history',
     'payments',
+    'taskqueue',
+    'analytics',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Before SessionMiddleware so session saves count as writes
+    'config.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +86,56 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# config.sqlite is django.db.backends.sqlite3 plus WAL and other pragmas on every
+# connection and BEGIN IMMEDIATE transactions (see config/sqlite/__init__.py)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'config.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            # Overrides for config.sqlite.base.DEFAULT_PRAGMAS
+            'pragmas': {},
+        },
+        # Reuse connections across requests (seconds); set 0 under ASGI, where
+        # requests run on short-lived threads and connections can't be reused
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (config/routers.py): request-time reads go to a random replica
+# until the request, or the same client within REPLICA_PIN_SECONDS, writes.
+# Locally each replica is a SQLite copy of the primary refreshed by
+# `manage.py sync_replica`, e.g. DATABASE_REPLICA_PATHS=var/replica1.sqlite3
+DATABASE_REPLICAS = []
+for _number, _path in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_PATHS', '').split(',')), 1):
+    DATABASES[f'replica{_number}'] = {
+        **DATABASES['default'],
+        'NAME': _path.strip(),
+        # Tests read and write the primary's test database through every alias
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_ROUTERS = ['config.routers.PrimaryReplicaRouter']
+# Covers replication lag after a client's own write
+REPLICA_PIN_SECONDS = 10
+
+# Writes that still hit "database is locked" are retried (config/sqlite/retry.py)
+SQLITE_LOCK_RETRY_ATTEMPTS = 5
+SQLITE_LOCK_RETRY_DELAY = 0.05  # seconds, doubled after each attempt
+
+
+# Caches
+# Named caches (default, catalogue, entitlements, template_fragments, sessions);
+# backend chosen with CACHE_BACKEND / CACHE_<NAME>_BACKEND, see config/caches.py
+
+CACHES = build_caches(BASE_DIR)
+CACHE_STATS_DIR = BASE_DIR / 'var' / 'cache_stats'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -131,6 +181,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Book PDFs and covers, stored under their SHA-256 (see books/storage.py)
+    'blobs': {'BACKEND': 'books.storage.ContentAddressedStorage'},
+}
+# Blobs written or reused this recently are never garbage collected: the book
+# that is about to reference them may not be committed yet
+BLOB_GC_GRACE_SECONDS = 3600
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
@@ -144,6 +204,71 @@ LOGOUT_REDIRECT_URL = 'home'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Protected PDF delivery (see books/pdf_delivery.py):
+# 'django' streams through the worker, 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd) let the front server stream the file.
+PDF_DELIVERY_MODE = os.environ.get('PDF_DELIVERY_MODE', 'django')
+# nginx `internal` location aliased to MEDIA_ROOT, used by x-accel-redirect
+PDF_ACCEL_REDIRECT_PREFIX = '/protected/'
+# Under ASGI, serve PDFs from async views that stream with non-blocking reads
+# (see books/async_views.py). Leave off under WSGI.
+PDF_ASYNC_DELIVERY = os.environ.get('PDF_ASYNC_DELIVERY', '') == '1'
+PDF_ASYNC_READ_AHEAD = 4  # chunks of 64 KB buffered ahead of each client
+PDF_ASYNC_IO_THREADS = 8  # threads shared by all async PDF reads in a process
+
+# List pagination (see books/pagination.py): 'offset' uses numbered pages,
+# 'keyset' seeks by (timestamp, id) cursors and skips the COUNT(*) query
+PAGINATION_MODE = os.environ.get('PAGINATION_MODE', 'offset')
+# With keyset pagination, show an estimated page count ("Page 2 of ~40")
+PAGINATION_APPROXIMATE_COUNT = False
+
+# Catalogue filter facets (see books/facets.py)
+FACET_CACHE = 'catalogue'
+FACET_CACHE_TIMEOUT = 3600  # seconds; Book saves and deletes invalidate explicitly
+
+# Anonymous page cache (see books/page_cache.py)
+PAGE_CACHE = 'catalogue'
+PAGE_CACHE_TIMEOUT = 300  # seconds; model signals bump version keys to invalidate
+
+# Book view counter buffering (see books/view_counter.py)
+# Needs atomic incr()/decr(): the counters cache stays on locmem (per-process
+# buffers) unless CACHE_COUNTERS_BACKEND=redis. The db and file backends'
+# incr() is a get then set; the books.E001 system check reports them.
+VIEW_COUNT_CACHE = 'counters'
+VIEW_COUNT_FLUSH_INTERVAL = 60  # seconds
+VIEW_COUNT_FLUSH_THRESHOLD = 500  # pending books
+
+# Reading progress buffering (see history/progress.py)
+READING_PROGRESS_CACHE = 'default'
+READING_PROGRESS_FLUSH_INTERVAL = 30  # seconds
+READING_PROGRESS_FLUSH_THRESHOLD = 200  # users with pending reports
+
+# Event log and per-book rollups (see analytics/events.py, analytics/rollup.py)
+ANALYTICS_EVENT_BUFFER_SIZE = 500  # events per bulk insert
+ANALYTICS_EVENT_FLUSH_INTERVAL = 10  # seconds an event may wait in a worker's buffer
+ANALYTICS_ROLLUP_BATCH_SIZE = 50000  # event IDs per rollup transaction
+# Seconds before a newly seen event ID is rolled up, longer than any transaction
+# inserting events; 0 rolls up to the latest ID, which is only safe on SQLite
+ANALYTICS_ROLLUP_LAG = 60
+ANALYTICS_EVENT_RETENTION_DAYS = 90  # `rollup_events --purge` deletes older raw events
+ANALYTICS_TRENDING_DAYS = 7
+
+# Per-user purchase entitlements cache (see payments/entitlements.py)
+ENTITLEMENTS_CACHE = 'entitlements'
+ENTITLEMENTS_CACHE_TIMEOUT = 3600  # seconds; purchases bump User.entitlements_version instead of waiting
+
+# Resumable chunked PDF uploads (see books/uploads.py)
+CHUNKED_UPLOAD_DIR = 'uploads'  # partial files, inside MEDIA_ROOT so completion is a rename
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # bytes per request, suggested to the client
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3  # bytes
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24  # gc_media removes uploads idle for longer
+
+# Background task queue (see taskqueue/queue.py, `manage.py run_worker`)
+TASK_QUEUE_VISIBILITY_TIMEOUT = 300  # seconds before a claimed task is retried elsewhere
+TASK_QUEUE_MAX_ATTEMPTS = 5
+TASK_QUEUE_RETRY_DELAY = 30  # seconds, doubled after each failed attempt
+TASK_QUEUE_EAGER = False  # run tasks inline on commit, for development without a worker
+
 # Stripe Configuration (Sandbox/Test Mode)
 # Get these from: https://dashboard.stripe.com/test/apikeys
 STRIPE_SECRET_KEY = 'sk_test_51SbP8n20MBenQYGXdw37DFzrV48I1IXDbXaXfLd9AelNfYT0KuADinvvPvnepRa5mBLLPEQTYAK5cSHS5BhXjiGy00DkFgYc25'
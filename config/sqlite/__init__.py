@@ -0,0 +1,18 @@
+"""
+SQLite backend tuned for a multi-worker web app.
+
+    DATABASES = {'default': {'ENGINE': 'config.sqlite', ...}}
+
+Extra OPTIONS understood on top of django.db.backends.sqlite3:
+
+    'pragmas': {...}               merged over DEFAULT_PRAGMAS, applied to every new connection
+    'transaction_mode': 'IMMEDIATE' start atomic() blocks with BEGIN IMMEDIATE
+
+WAL lets readers keep going while one writer commits; synchronous=NORMAL is
+durable across application crashes in WAL mode and only risks the last
+transactions on power loss. BEGIN IMMEDIATE takes the write lock when a
+transaction starts, so a transaction that reads and then writes waits in
+busy_timeout instead of failing with "database is locked" when another
+writer got there first. retry.retry_on_locked() covers the writes that can
+still hit the error outside a transaction.
+"""
@@ -0,0 +1,47 @@
+"""
+Retry writes that fail with SQLite's "database is locked".
+
+busy_timeout already makes a writer wait for the lock, so this only matters
+under heavy contention or for a deferred transaction that tried to upgrade
+to a write lock. A failed statement inside atomic() leaves the transaction
+unusable, so retries only happen at the outermost level; inside a
+transaction the error is re-raised for the outer caller to retry.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+
+def is_locked_error(error):
+    message = str(error).lower()
+    return isinstance(error, OperationalError) and ('database is locked' in message or 'database table is locked' in message)
+
+
+def call_with_retry(func, *args, using=DEFAULT_DB_ALIAS, attempts=None, **kwargs):
+    """func(*args, **kwargs), retried with jittered exponential backoff while the database is locked"""
+    attempts = attempts or getattr(settings, 'SQLITE_LOCK_RETRY_ATTEMPTS', 5)
+    delay = getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not is_locked_error(e) or attempt == attempts or connections[using].in_atomic_block:
+                raise
+            logger.warning(f"Database locked in {getattr(func, '__qualname__', func)}, retry {attempt}/{attempts - 1}")
+            time.sleep(delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+def retry_on_locked(func=None, *, using=DEFAULT_DB_ALIAS, attempts=None):
+    """Decorator form of call_with_retry(); the function should open its own transaction if it needs one"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return call_with_retry(func, *args, using=using, attempts=attempts, **kwargs)
+        return wrapper
+    return decorator(func) if func is not None else decorator
@@ -0,0 +1,12 @@
+"""
+Settings for exercising PDF_DELIVERY_MODE without a front-end proxy.
+
+    python manage.py runserver --settings=config.test_settings
+    python manage.py test --settings=config.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+PDF_DELIVERY_MODE = 'x-accel-redirect'
+
+# Serve X-Accel-Redirect/X-Sendfile responses the way nginx/Apache would
+MIDDLEWARE = ['books.middleware.SendfileEmulationMiddleware'] + MIDDLEWARE  # noqa: F405
@@ -0,0 +1,188 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.db import OperationalError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from analytics.models import Event
+from books.management.commands.sync_replica import copy_database
+from taskqueue.models import Task
+from .caches import build_caches
+from .routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware, unpinned_writes
+from .sqlite.base import DatabaseWrapper
+from .sqlite.retry import call_with_retry, retry_on_locked
+
+
+class TunedSQLiteTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'tuned.sqlite3')
+
+    def connect(self, **options):
+        settings_dict = {
+            **connections['default'].settings_dict,
+            'NAME': self.path,
+            'OPTIONS': options,
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias='tuned')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_new_connections(self):
+        wrapper = self.connect(pragmas={'busy_timeout': 1234})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -64 * 1024)
+
+    def test_immediate_transactions_take_the_write_lock_up_front(self):
+        writer = self.connect(transaction_mode='IMMEDIATE')
+        other = self.connect(pragmas={'busy_timeout': 0})
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+
+        writer.set_autocommit(False)
+        writer._start_transaction_under_autocommit()
+        # A read-only transaction still blocks other writers until it ends
+        with writer.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            with other.cursor() as cursor:
+                cursor.execute('INSERT INTO t VALUES (1)')
+        # WAL: readers are not blocked by the writer
+        self.assertEqual(self.pragma(other, 'user_version'), 0)
+        writer.rollback()
+        writer.set_autocommit(True)
+
+
+@override_settings(SQLITE_LOCK_RETRY_ATTEMPTS=3, SQLITE_LOCK_RETRY_DELAY=0)
+class LockRetryTests(SimpleTestCase):
+    def test_retries_only_locked_errors(self):
+        calls = mock.Mock(side_effect=[OperationalError('database is locked'), OperationalError('database is locked'), 'ok'])
+        self.assertEqual(call_with_retry(calls, 1, key='value'), 'ok')
+        self.assertEqual(calls.call_count, 3)
+        calls.assert_called_with(1, key='value')
+
+        calls = mock.Mock(side_effect=OperationalError('no such table: t'))
+        with self.assertRaises(OperationalError):
+            call_with_retry(calls)
+        self.assertEqual(calls.call_count, 1)
+
+    def test_gives_up_after_the_last_attempt(self):
+        @retry_on_locked
+        def write():
+            write.calls += 1
+            raise OperationalError('database is locked')
+        write.calls = 0
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(write.calls, 3)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_PIN_SECONDS=30)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def serve(self, view, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return ReplicaPinningMiddleware(view)(request)
+
+    def test_request_reads_use_replicas_until_the_request_writes(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Event))
+            seen.append(self.router.db_for_read(Task))
+            self.assertEqual(self.router.db_for_write(Event), 'default')
+            seen.append(self.router.db_for_read(Event))
+            return HttpResponse()
+
+        response = self.serve(view)
+        self.assertIn(seen[0], {'replica1', 'replica2'})
+        self.assertEqual(seen[1:], ['default', 'default'])
+        pinned_until = float(response.cookies[PIN_COOKIE].value)
+        self.assertAlmostEqual(pinned_until, time.time() + 30, delta=2)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+
+    def test_pin_cookie_sends_the_next_requests_to_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Event))
+            return HttpResponse()
+
+        response = self.serve(view, **{PIN_COOKIE: str(time.time() + 5)})
+        self.serve(view, **{PIN_COOKIE: str(time.time() - 5)})
+        self.serve(view, **{PIN_COOKIE: 'garbage'})
+        self.assertEqual(seen[0], 'default')
+        self.assertIn(seen[1], {'replica1', 'replica2'})
+        self.assertIn(seen[2], {'replica1', 'replica2'})
+        # Reads alone don't extend the pin
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_bookkeeping_writes_do_not_pin_the_client(self):
+        def view(request):
+            with unpinned_writes():
+                self.router.db_for_write(Event)
+            return HttpResponse(self.router.db_for_read(Event))
+
+        response = self.serve(view)
+        self.assertIn(response.content, {b'replica1', b'replica2'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_primary_outside_requests_and_inside_transactions(self):
+        self.assertEqual(self.router.db_for_read(Event), 'default')
+
+        def view(request):
+            with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                return HttpResponse(self.router.db_for_read(Event))
+
+        self.assertEqual(self.serve(view).content, b'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'books'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'books'))
+
+
+class SyncReplicaTests(SimpleTestCase):
+    def test_copies_the_primary_into_the_replica_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary, replica = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+        with sqlite3.connect(primary) as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('CREATE TABLE t (x INTEGER)')
+            connection.execute('INSERT INTO t VALUES (1), (2)')
+        connection.close()
+
+        copy_database(primary, replica)
+        connection = sqlite3.connect(replica)
+        self.addCleanup(connection.close)
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM t').fetchone()[0], 2)
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+
+class BuildCachesTests(SimpleTestCase):
+    def test_counters_stay_local_unless_overridden(self):
+        caches = build_caches('/srv', {'CACHE_BACKEND': 'db'})
+        self.assertEqual(caches['default']['BACKEND'], 'config.cache_backends.DatabaseStatsCache')
+        self.assertEqual(caches['counters']['BACKEND'], 'config.cache_backends.LocMemStatsCache')
+
+        caches = build_caches('/srv', {'CACHE_COUNTERS_BACKEND': 'redis', 'CACHE_REDIS_URL': 'redis://cache:6379/1'})
+        counters = caches['counters']
+        self.assertEqual(counters['BACKEND'], 'config.cache_backends.RedisStatsCache')
+        self.assertEqual((counters['LOCATION'], counters['KEY_PREFIX'], counters['OPTIONS']), ('redis://cache:6379/1', 'dl:counters', {}))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('favourites', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favourite',
+            index=models.Index(fields=['user', '-created_at', 'book'], name='favourite_user_created_idx'),
+        ),
+    ]
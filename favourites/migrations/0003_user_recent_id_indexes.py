@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('favourites', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='favourite',
+            name='favourite_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='favourite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='favourite_user_created_idx'),
+        ),
+    ]
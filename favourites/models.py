@@ -11,6 +11,10 @@ class Favourite(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'book']  # One favorite per user per book
+        indexes = [
+            # A user's favourites newest first, ties broken by id as the keyset paginator pages them
+            models.Index(fields=['user', '-created_at', '-id'], name='favourite_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.userId} - {self.book.title}"
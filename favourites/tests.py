@@ -1,3 +1,37 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from books.models import Book
+from users.models import User
+from .models import Favourite
+
+
+class FavouriteCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(title='Liked', author='A', description='d', category='Science', is_approved=True)
+        self.client.force_login(self.user)
+        self.url = reverse('toggle_favourite', args=[self.book.pk])
+
+    def favourite_count(self):
+        self.book.refresh_from_db()
+        return self.book.favourite_count
+
+    def test_toggle_adds_and_removes(self):
+        self.client.post(self.url)
+        self.assertEqual(self.favourite_count(), 1)
+        self.client.post(self.url)
+        self.assertEqual(self.favourite_count(), 0)
+        self.assertFalse(Favourite.objects.exists())
+
+    def test_concurrent_removals_decrement_once(self):
+        self.client.post(self.url)
+        favourite = Favourite.objects.get()
 
-# Create your tests here.
+        # Both requests found the favourite before either deleted it
+        with mock.patch.object(Favourite.objects, 'get_or_create', return_value=(favourite, False)):
+            self.client.post(self.url)
+            self.client.post(self.url)
+        self.assertEqual(self.favourite_count(), 0)
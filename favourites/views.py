@@ -1,8 +1,12 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.db import transaction
 from books.models import Book
+from books.counters import adjust_counters
+from books.pagination import paginate
+from analytics import events
+from analytics.models import Event
 from .models import Favourite
 
 
@@ -10,10 +14,19 @@ from .models import Favourite
 def toggle_favourite(request, book_id):
     """Add or remove book from favorites"""
     book = get_object_or_404(Book, id=book_id, is_approved=True)
-    favourite, created = Favourite.objects.get_or_create(user=request.user, book=book)
+    with transaction.atomic():
+        favourite, created = Favourite.objects.get_or_create(user=request.user, book=book)
+        if created:
+            adjust_counters(book.id, favourite_count=1)
+        else:
+            # A concurrent toggle may have removed it already; only count our delete
+            deleted, _ = Favourite.objects.filter(pk=favourite.pk).delete()
+            if deleted:
+                adjust_counters(book.id, favourite_count=-1)
+        if created:
+            events.record(Event.FAVOURITE, book.id, request.user)
     
     if not created:
-        favourite.delete()
         messages.info(request, f'Removed "{book.title}" from favorites.')
     else:
         messages.success(request, f'Added "{book.title}" to favorites.')
@@ -24,12 +37,10 @@ def toggle_favourite(request, book_id):
 @login_required
 def favourites_list(request):
     """List all user's favorite books"""
-    favourites = Favourite.objects.filter(user=request.user).order_by('-created_at')
+    favourites = Favourite.objects.filter(user=request.user).select_related('book').order_by('-created_at', '-id')
     
     # Pagination
-    paginator = Paginator(favourites, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, favourites, 12, keys=('created_at', 'id'))
     
     context = {
         'page_obj': page_obj,
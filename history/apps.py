@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class HistoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'history'
+
+    def ready(self):
+        from . import progress
+        # Idle workers still write their buffered reports once the interval passes
+        request_finished.connect(progress.flush_if_due, dispatch_uid='history_flush_reading_progress')
@@ -0,0 +1,14 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from history import progress
+
+
+class Command(BaseCommand):
+    help = 'Write buffered reading progress to the database'
+
+    def handle(self, *args, **options):
+        if isinstance(progress._cache(), LocMemCache):
+            # This process's buffer is empty; each worker flushes its own after requests and at exit
+            raise CommandError('READING_PROGRESS_CACHE is local to each worker process; only a shared cache can be flushed from here')
+        written = progress.flush()
+        self.stdout.write(self.style.SUCCESS(f'Wrote reading progress for {written} books.'))
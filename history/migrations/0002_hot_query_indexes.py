@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='readinghistory',
+            index=models.Index(fields=['user', '-last_read_at', 'book'], name='history_user_read_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='readinghistory',
+            name='last_page',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='readinghistory',
+            name='seconds_read',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0003_reading_progress'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='readinghistory',
+            name='history_user_read_idx',
+        ),
+        migrations.AddIndex(
+            model_name='readinghistory',
+            index=models.Index(fields=['user', '-last_read_at', '-id'], name='history_user_read_idx'),
+        ),
+    ]
@@ -8,11 +8,18 @@ class ReadingHistory(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     last_read_at = models.DateTimeField(auto_now=True)
     first_read_at = models.DateTimeField(auto_now_add=True)
+    # Maintained in batches by history.progress
+    last_page = models.PositiveIntegerField(default=1)
+    seconds_read = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-last_read_at']
         unique_together = ['user', 'book']  # One history entry per user per book
         verbose_name_plural = 'Reading Histories'
+        indexes = [
+            # A user's history most recently read first, ties broken by id as the keyset paginator pages them
+            models.Index(fields=['user', '-last_read_at', '-id'], name='history_user_read_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.userId} - {self.book.title} - {self.last_read_at}"
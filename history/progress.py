@@ -0,0 +1,198 @@
+"""
+Buffered reading-progress tracking.
+
+The reader reports its current page and the seconds spent since the last
+report. Reports are merged per user in the cache (READING_PROGRESS_CACHE) and
+written back as one ReadingHistory upsert, bulk_create(update_conflicts=True),
+once READING_PROGRESS_FLUSH_INTERVAL seconds have passed or
+READING_PROGRESS_FLUSH_THRESHOLD users have pending reports, checked on each
+report and at the end of every request, and again when the process exits. A
+user's own pending reports are flushed before their history page is shown.
+With a locmem cache every worker buffers its own reports, so only a shared
+cache can be flushed from `manage.py flush_reading_progress`.
+"""
+import atexit
+import logging
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+
+from books import page_cache
+from books.counters import adjust_counters
+from books.models import Book
+from config.routers import unpinned_writes
+from config.sqlite.retry import retry_on_locked
+from .models import ReadingHistory
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'reading_progress'
+PENDING_KEY = f'{KEY_PREFIX}:pending'
+FLUSH_LOCK_KEY = f'{KEY_PREFIX}:flush_lock'
+# Longest gap between two reports that still counts as reading time
+MAX_SECONDS_PER_REPORT = 600
+
+
+def _cache():
+    return caches[getattr(settings, 'READING_PROGRESS_CACHE', 'default')]
+
+
+def _user_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def record(user_id, book_id, page=None, seconds=0):
+    """
+    Buffer a progress report. `page` None only marks the book as opened.
+    Returns True if the report triggered a flush.
+    """
+    cache = _cache()
+    key = _user_key(user_id)
+    # Read-modify-write per user: reports from one user's tabs rarely race,
+    # and a lost report is superseded by the next one
+    reports = cache.get(key) or {}
+    last_page, total_seconds = reports.get(book_id, (None, 0))
+    reports[book_id] = (page or last_page, total_seconds + max(0, min(int(seconds), MAX_SECONDS_PER_REPORT)))
+    cache.set(key, reports, timeout=None)
+
+    pending_ids = cache.get(PENDING_KEY) or set()
+    if user_id not in pending_ids:
+        pending_ids.add(user_id)
+        cache.set(PENDING_KEY, pending_ids, timeout=None)
+
+    threshold = getattr(settings, 'READING_PROGRESS_FLUSH_THRESHOLD', 200)
+    if len(pending_ids) >= threshold or _interval_passed(cache):
+        _flush_logged()
+        return True
+    return False
+
+
+def _interval_passed(cache):
+    interval = getattr(settings, 'READING_PROGRESS_FLUSH_INTERVAL', 30)
+    return cache.add(FLUSH_LOCK_KEY, True, timeout=interval)
+
+
+def _flush_logged():
+    # Never fail the request that happened to trigger the flush; its reports
+    # were already taken out of the cache, and the reader sends the page again
+    try:
+        flush()
+    except DatabaseError:
+        logger.exception("Dropped buffered reading progress")
+
+
+def flush_if_due(**kwargs):
+    """request_finished receiver: flush once the interval has passed, even without new reports"""
+    if _interval_passed(_cache()):
+        _flush_logged()
+
+
+def last_page(user_id, book_id):
+    """Page to resume at: the latest buffered report, else the stored one"""
+    pending = (_cache().get(_user_key(user_id)) or {}).get(book_id)
+    if pending and pending[0]:
+        return pending[0]
+    return (
+        ReadingHistory.objects.filter(user_id=user_id, book_id=book_id)
+        .values_list('last_page', flat=True).first()
+    )
+
+
+@retry_on_locked
+def _write_reports(reports, pairs):
+    """Upsert ReadingHistory rows; returns a Counter of first reads per book"""
+    with transaction.atomic():
+        # bulk_create(update_conflicts) can only set columns, not add to them,
+        # so read the current totals in the same transaction
+        existing = {
+            (user_id, book_id): (page, seconds)
+            for user_id, book_id, page, seconds in ReadingHistory.objects.filter(pairs).order_by()
+            .values_list('user_id', 'book_id', 'last_page', 'seconds_read')
+        }
+        rows = []
+        for (user_id, book_id), (page, seconds) in reports.items():
+            stored_page, stored_seconds = existing.get((user_id, book_id), (1, 0))
+            rows.append(ReadingHistory(
+                user_id=user_id,
+                book_id=book_id,
+                last_page=page or stored_page,
+                seconds_read=stored_seconds + seconds,
+            ))
+        ReadingHistory.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'book'],
+            update_fields=['last_page', 'seconds_read', 'last_read_at'],
+        )
+        # bulk_create sends no post_save, so count first reads here
+        first_reads = Counter(book_id for user_id, book_id in reports if (user_id, book_id) not in existing)
+        for book_id, readers in first_reads.items():
+            adjust_counters(book_id, read_count=readers)
+    return first_reads
+
+
+def flush(user_ids=None):
+    """
+    Write buffered reports to ReadingHistory, for every pending user or only
+    `user_ids`. Returns the number of (user, book) rows written.
+    """
+    # Flushing every user is bookkeeping that mustn't pin the client whose
+    # report triggered it to the primary; a user's own flush before their
+    # history page does pin them, so the page reads the rows back
+    writes = unpinned_writes() if user_ids is None else nullcontext()
+    cache = _cache()
+    pending_ids = cache.get(PENDING_KEY) or set()
+    if user_ids is None:
+        user_ids = pending_ids
+        cache.delete(PENDING_KEY)
+    else:
+        user_ids = set(user_ids) & pending_ids
+        if user_ids:
+            cache.set(PENDING_KEY, pending_ids - user_ids, timeout=None)
+    if not user_ids:
+        return 0
+
+    keys = {_user_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(list(keys))
+    # A report landing between get_many() and delete_many() loses at most
+    # one interval of reading time; its page is re-sent with the next report
+    cache.delete_many(list(found))
+    reports = {
+        (keys[key], book_id): report
+        for key, book_reports in found.items()
+        for book_id, report in book_reports.items()
+    }
+    # Skip books deleted since the report was buffered
+    live_books = set(Book.objects.filter(pk__in={book_id for _, book_id in reports}).order_by().values_list('pk', flat=True))
+    reports = {pair: report for pair, report in reports.items() if pair[1] in live_books}
+    if not reports:
+        return 0
+
+    by_user = defaultdict(list)
+    for user_id, book_id in reports:
+        by_user[user_id].append(book_id)
+    pairs = Q()
+    for user_id, book_ids in by_user.items():
+        pairs |= Q(user_id=user_id, book_id__in=book_ids)
+
+    with writes:
+        first_reads = _write_reports(reports, pairs)
+    if first_reads:
+        page_cache.bump(*[f'book:{book_id}' for book_id in first_reads])
+
+    logger.info(f"Flushed reading progress for {len(reports)} books of {len(user_ids)} users")
+    return len(reports)
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write reading progress at exit")
+
+
+atexit.register(_flush_at_exit)
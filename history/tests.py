@@ -1,3 +1,107 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from books.models import Book
+from config.routers import PIN_COOKIE
+from users.models import User
+from .models import ReadingHistory
+from . import progress
+
+
+@override_settings(READING_PROGRESS_FLUSH_INTERVAL=3600)
+class ReadingProgressTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'password123')
+        cls.book = Book.objects.create(
+            title='Long Read', author='Author', description='d', category='History',
+            pdf_file='pdfs/long.pdf', is_approved=True, page_count=200,
+        )
+        cls.paid_book = Book.objects.create(
+            title='Paid Read', author='Author', description='d', category='History',
+            type='paid', pdf_file='pdfs/paid.pdf', is_approved=True,
+        )
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        # Hold the interval lock so reports stay buffered until flushed explicitly
+        progress._cache().add(progress.FLUSH_LOCK_KEY, True, timeout=3600)
+        self.client.force_login(self.user)
+
+    def report(self, *reports):
+        return self.client.post(reverse('report_progress'), {'reports': json.dumps(list(reports))})
+
+    def test_reports_are_merged_into_one_upsert(self):
+        self.assertEqual(self.report({'book': self.book.pk, 'page': 5, 'seconds': 30}).status_code, 204)
+        self.report({'book': self.book.pk, 'page': 9, 'seconds': 20})
+        self.assertFalse(ReadingHistory.objects.exists())
+
+        with self.assertNumQueries(6):
+            # live books, then existing rows, upsert and read counter inside a savepoint
+            self.assertEqual(progress.flush(), 1)
+        history = ReadingHistory.objects.get(user=self.user, book=self.book)
+        self.assertEqual((history.last_page, history.seconds_read), (9, 50))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).read_count, 1)
+
+        self.report({'book': self.book.pk, 'page': 12, 'seconds': 10})
+        progress.flush()
+        history.refresh_from_db()
+        self.assertEqual((history.last_page, history.seconds_read), (12, 60))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).read_count, 1)
+
+    def test_triggered_flush_does_not_pin_the_reporter(self):
+        with self.settings(READING_PROGRESS_FLUSH_THRESHOLD=1):
+            response = self.report({'book': self.book.pk, 'page': 5, 'seconds': 30})
+        self.assertTrue(ReadingHistory.objects.filter(user=self.user, book=self.book).exists())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        self.report({'book': self.book.pk, 'page': 6, 'seconds': 30})
+        # The history page flushes the user's own reports and reads them back
+        self.assertIn(PIN_COOKIE, self.client.get(reverse('reading_history')).cookies)
+
+    def test_out_of_range_reports_are_clamped_or_rejected(self):
+        for bad in ({'page': -1}, {'seconds': -5}, {'page': 'ten'}):
+            self.assertEqual(self.report({'book': self.book.pk, **bad}).status_code, 400)
+        self.report({'book': self.book.pk, 'page': 10 ** 30, 'seconds': 10 ** 30})
+        progress.flush()
+        history = ReadingHistory.objects.get(user=self.user, book=self.book)
+        self.assertEqual((history.last_page, history.seconds_read), (200, progress.MAX_SECONDS_PER_REPORT))
+
+    def test_failed_triggered_flush_does_not_fail_the_report(self):
+        with self.settings(READING_PROGRESS_FLUSH_THRESHOLD=1):
+            with mock.patch.object(progress, '_write_reports', side_effect=OperationalError('disk I/O error')):
+                with self.assertLogs('history.progress', 'ERROR'):
+                    response = self.report({'book': self.book.pk, 'page': 5, 'seconds': 30})
+        self.assertEqual(response.status_code, 204)
+
+    def test_idle_worker_flushes_at_the_end_of_a_request(self):
+        progress.record(self.user.pk, self.book.pk, page=4, seconds=10)
+        progress._cache().delete(progress.FLUSH_LOCK_KEY)
+        progress.flush_if_due()
+        self.assertTrue(ReadingHistory.objects.filter(user=self.user, book=self.book, last_page=4).exists())
+
+    def test_command_refuses_a_per_process_buffer(self):
+        with self.assertRaisesMessage(CommandError, 'local to each worker process'):
+            call_command('flush_reading_progress')
+
+    def test_unpurchased_books_are_ignored(self):
+        self.report({'book': self.paid_book.pk, 'page': 3, 'seconds': 10})
+        self.assertEqual(progress.flush(), 0)
+
+    def test_reader_resumes_and_history_shows_progress(self):
+        self.report({'book': self.book.pk, 'page': 42, 'seconds': 120})
+        self.assertEqual(progress.last_page(self.user.pk, self.book.pk), 42)
+
+        response = self.client.get(reverse('reading_history'))
+        self.assertContains(response, 'Page 42 of 200')
+        self.assertContains(response, '2 min read')
+        # Flushed before rendering; the buffered page now comes from the database
+        self.assertEqual(progress.last_page(self.user.pk, self.book.pk), 42)
+        self.assertFalse(progress._cache().get(progress._user_key(self.user.pk)))
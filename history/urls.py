@@ -3,5 +3,5 @@ from . import views
 
 urlpatterns = [
     path('', views.reading_history, name='reading_history'),
+    path('progress/', views.report_progress, name='report_progress'),
 ]
-
@@ -1,20 +1,64 @@
+import json
+
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from books.models import Book
+from books.pagination import paginate
+from payments import entitlements
 from .models import ReadingHistory
+from . import progress
+
+# Reports accepted per request; the reader sends one per open book
+MAX_REPORTS = 20
+# Upper bound for pages of books whose page count isn't known yet
+MAX_PAGE = 100000
 
 
 @login_required
 def reading_history(request):
     """List user's reading history"""
-    history = ReadingHistory.objects.filter(user=request.user).order_by('-last_read_at')
+    # Show progress reported since the last batch write
+    progress.flush(user_ids=[request.user.id])
+    history = ReadingHistory.objects.filter(user=request.user).select_related('book').order_by('-last_read_at', '-id')
     
     # Pagination
-    paginator = Paginator(history, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, history, 12, keys=('last_read_at', 'id'))
     
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'reading_history.html', context)
+
+
+@login_required
+@require_POST
+def report_progress(request):
+    """
+    Reading progress from the reader, as a JSON list in the `reports` field:
+    [{"book": id, "page": n, "seconds": s}, ...]. Sent as a form field so
+    navigator.sendBeacon() can include the CSRF token.
+    """
+    try:
+        reports = json.loads(request.POST.get('reports', ''))[:MAX_REPORTS]
+        reports = [(int(r['book']), int(r.get('page') or 0), int(r.get('seconds') or 0)) for r in reports]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Invalid progress reports'}, status=400)
+    if any(page < 0 or seconds < 0 for _, page, seconds in reports):
+        return JsonResponse({'error': 'Invalid progress reports'}, status=400)
+    
+    books = {
+        pk: (book_type, page_count)
+        for pk, book_type, page_count in Book.objects.filter(pk__in=[book_id for book_id, _, _ in reports], is_approved=True)
+        .values_list('pk', 'type', 'page_count')
+    }
+    paid = entitlements.paid_book_ids(request.user)
+    for book_id, page, seconds in reports:
+        if book_id not in books or (books[book_id][0] == 'paid' and book_id not in paid):
+            continue
+        # Page 0 only marks the book as opened
+        page = min(page, books[book_id][1] or MAX_PAGE) or None
+        seconds = min(seconds, progress.MAX_SECONDS_PER_REPORT)
+        progress.record(request.user.id, book_id, page=page, seconds=seconds)
+    return HttpResponse(status=204)
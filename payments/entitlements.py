@@ -0,0 +1,103 @@
+"""
+Entitlements: which books a user may read.
+
+A user's paid book IDs are loaded with one query, cached per user in
+ENTITLEMENTS_CACHE and memoised on the user object for the rest of the
+request. The cache key includes User.entitlements_version, which a signal
+bumps whenever a Purchase is saved or deleted. The user row is loaded on
+every request anyway, so each worker sees the new version on its next
+request and ignores its old entry, even with a per-process cache. A reader
+that loaded the set before the purchase can only write it under the old key.
+Code that changes purchases through update() or bulk operations must call
+bump() itself. The a-prefixed functions are the same checks for async views.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import Purchase
+
+KEY_PREFIX = 'entitlements'
+_MEMO_ATTR = '_paid_book_ids'
+
+
+def _cache():
+    return caches[getattr(settings, 'ENTITLEMENTS_CACHE', 'default')]
+
+
+def _key(user):
+    return f'{KEY_PREFIX}:{user.pk}:{user.entitlements_version}'
+
+
+def paid_book_ids(user):
+    """Frozen set of IDs of books the user has paid for"""
+    if not user.is_authenticated:
+        return frozenset()
+    memo = getattr(user, _MEMO_ATTR, None)
+    if memo is not None:
+        return memo
+
+    cache = _cache()
+    book_ids = cache.get(_key(user))
+    if book_ids is None:
+        book_ids = frozenset(
+            Purchase.objects.filter(user=user, is_paid=True).order_by().values_list('book_id', flat=True)
+        )
+        cache.set(_key(user), book_ids, getattr(settings, 'ENTITLEMENTS_CACHE_TIMEOUT', 3600))
+    setattr(user, _MEMO_ATTR, book_ids)
+    return book_ids
+
+
+def has_purchased(user, book):
+    """Check if user has a paid purchase for this book"""
+    return book.pk in paid_book_ids(user)
+
+
+def can_read(user, book):
+    """Free books are readable by any logged-in user; paid books need a purchase"""
+    if not user.is_authenticated:
+        return False
+    if book.type != 'paid':
+        return True
+    return has_purchased(user, book)
+
+
+async def apaid_book_ids(user):
+    """paid_book_ids() using the async cache and ORM APIs; `user` must already be loaded"""
+    if not user.is_authenticated:
+        return frozenset()
+    memo = getattr(user, _MEMO_ATTR, None)
+    if memo is not None:
+        return memo
+
+    cache = _cache()
+    book_ids = await cache.aget(_key(user))
+    if book_ids is None:
+        book_ids = frozenset([
+            book_id async for book_id in
+            Purchase.objects.filter(user=user, is_paid=True).order_by().values_list('book_id', flat=True)
+        ])
+        await cache.aset(_key(user), book_ids, getattr(settings, 'ENTITLEMENTS_CACHE_TIMEOUT', 3600))
+    setattr(user, _MEMO_ATTR, book_ids)
+    return book_ids
+
+
+async def acan_read(user, book):
+    if not user.is_authenticated:
+        return False
+    if book.type != 'paid':
+        return True
+    return book.pk in await apaid_book_ids(user)
+
+
+def bump(user_id):
+    """Retire the user's cached entitlements in every process"""
+    get_user_model().objects.filter(pk=user_id).update(entitlements_version=F('entitlements_version') + 1)
+
+
+def invalidate(user):
+    """Make `user` (an object loaded before the purchase changed) read its new entitlements"""
+    user.refresh_from_db(fields=['entitlements_version'])
+    if hasattr(user, _MEMO_ATTR):
+        delattr(user, _MEMO_ATTR)
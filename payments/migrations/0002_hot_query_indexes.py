@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', 'is_paid', 'book'], name='purchase_user_paid_idx'),
+        ),
+    ]
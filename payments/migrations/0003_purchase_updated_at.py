@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def copy_purchased_at(apps, schema_editor):
+    Purchase = apps.get_model('payments', 'Purchase')
+    Purchase.objects.update(updated_at=models.F('purchased_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_purchased_at, migrations.RunPython.noop),
+    ]
@@ -10,10 +10,16 @@ class Purchase(models.Model):
     stripe_payment_id = models.CharField(max_length=255, unique=True)
     is_paid = models.BooleanField(default=True)
     purchased_at = models.DateTimeField(auto_now_add=True)
+    # Incremental exports (books/exports.py) pick up refunds and re-payments by this
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-purchased_at']
         unique_together = ['user', 'book']  # User can only purchase a book once
+        indexes = [
+            # Entitlement lookups: paid book IDs for one user
+            models.Index(fields=['user', 'is_paid', 'book'], name='purchase_user_paid_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.userId} - {self.book.title}"
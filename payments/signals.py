@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Purchase
+from . import entitlements
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def bump_entitlements(sender, instance, raw=False, **kwargs):
+    """Any change to a purchase retires the user's cached entitlements in every process"""
+    if not raw:
+        entitlements.bump(instance.user_id)
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from django.core.cache import caches
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from books.models import Book
+from users.models import User
+from . import entitlements
+from .models import Purchase
+
+
+@override_settings(ENTITLEMENTS_CACHE='entitlements')
+class EntitlementTests(TestCase):
+    def setUp(self):
+        caches['entitlements'].clear()
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(title='Paid Book', author='A', description='d', category='Science', type='paid')
+
+    def fresh_user(self):
+        # What another worker loads for the user's next request
+        return User.objects.get(pk=self.user.pk)
+
+    def test_purchase_is_visible_through_a_cache_filled_earlier(self):
+        # Another worker cached the empty set before the purchase
+        stale = self.fresh_user()
+        self.assertFalse(entitlements.can_read(stale, self.book))
+
+        Purchase.objects.create(user=self.user, book=self.book, stripe_payment_id='pi_1')
+        # A reader that loaded the set before the purchase writes it back afterwards
+        caches['entitlements'].set(entitlements._key(stale), frozenset())
+        self.assertTrue(entitlements.can_read(self.fresh_user(), self.book))
+
+        # The request that handled the purchase refreshes its own user object
+        entitlements.invalidate(stale)
+        self.assertTrue(entitlements.can_read(stale, self.book))
+
+    def test_refund_revokes_access(self):
+        purchase = Purchase.objects.create(user=self.user, book=self.book, stripe_payment_id='pi_1')
+        self.assertTrue(entitlements.can_read(self.fresh_user(), self.book))
+        purchase.is_paid = False
+        purchase.save()
+        self.assertFalse(entitlements.can_read(self.fresh_user(), self.book))
+        purchase.delete()
+        self.assertEqual(self.fresh_user().entitlements_version, 3)
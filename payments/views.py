@@ -7,7 +7,10 @@ import stripe
 import logging
 import os
 from books.models import Book
+from analytics import events
+from analytics.models import Event
 from .models import Purchase
+from . import entitlements
 
 logger = logging.getLogger(__name__)
 
@@ -47,7 +50,7 @@ def create_checkout_session(request, book_id):
         return redirect('book_detail', book_id=book_id)
     
     # Check if user already purchased this book
-    if Purchase.objects.filter(user=request.user, book=book, is_paid=True).exists():
+    if entitlements.has_purchased(request.user, book):
         messages.info(request, 'You have already purchased this book.')
         return redirect('book_detail', book_id=book_id)
     
@@ -141,11 +144,18 @@ def payment_success(request):
             }
         )
         
+        newly_paid = created
         if not created:
             # Update existing purchase
+            newly_paid = not purchase.is_paid
             purchase.stripe_payment_id = checkout_session.payment_intent if checkout_session.payment_intent else session_id
             purchase.is_paid = True
             purchase.save()
+        if newly_paid:
+            # Reloading the success page must not count the purchase twice
+            events.record(Event.PURCHASE, book.id, request.user)
+        
+        entitlements.invalidate(request.user)
         
         messages.success(request, f'Payment successful! You can now read "{book.title}".')
         
@@ -184,7 +194,7 @@ def payment_cancelled(request):
 @login_required
 def purchased_books(request):
     """Show all books purchased by the user"""
-    purchases = Purchase.objects.filter(user=request.user, is_paid=True).order_by('-purchased_at')
+    purchases = Purchase.objects.filter(user=request.user, is_paid=True).select_related('book').order_by('-purchased_at')
     
     context = {
         'purchases': purchases,
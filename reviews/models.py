@@ -22,6 +22,13 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'book']  # One review per user per book
+        indexes = [
+            # Reviews on a book's detail page, newest first
+            models.Index(fields=['book', '-created_at'], name='review_book_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='review_user_created_idx'),
+            # Admin review list
+            models.Index(fields=['-created_at'], name='review_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.userId} - {self.book.title} - {self.rating} stars"
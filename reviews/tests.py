@@ -1,3 +1,71 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from books import views as book_views
+from books.models import Book
+from users.models import User
+from . import views
+from .models import Review
+
+
+class ReviewCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'password123')
+        self.book = Book.objects.create(title='Rated', author='A', description='d', category='Science', is_approved=True)
+        self.client.force_login(self.user)
+
+    def counters(self):
+        self.book.refresh_from_db()
+        return self.book.rating_sum, self.book.rating_count
+
+    def test_add_update_edit_and_delete(self):
+        self.client.post(reverse('add_review', args=[self.book.pk]), {'rating': 4, 'comment': 'Good'})
+        self.assertEqual(self.counters(), (4, 1))
+        self.client.post(reverse('add_review', args=[self.book.pk]), {'rating': 2, 'comment': 'Meh'})
+        self.assertEqual(self.counters(), (2, 1))
+        review = Review.objects.get()
+        self.client.post(reverse('edit_review', args=[review.pk]), {'rating': 5, 'comment': 'Great'})
+        self.assertEqual(self.counters(), (5, 1))
+        self.client.get(reverse('delete_review', args=[review.pk]))
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_edit_uses_the_rating_at_the_time_of_the_update(self):
+        review = Review.objects.create(user=self.user, book=self.book, rating=1, comment='Bad')
+        self.book.rating_sum, self.book.rating_count = 1, 1
+        self.book.save()
+        # A concurrent edit changed the rating after this request loaded the review
+        Review.objects.filter(pk=review.pk).update(rating=3)
+        self.book.rating_sum = 3
+        self.book.save()
+
+        with mock.patch.object(views, 'get_object_or_404', side_effect=[review, Review.objects.get(pk=review.pk)]):
+            self.client.post(reverse('edit_review', args=[review.pk]), {'rating': 5, 'comment': 'Great'})
+        self.assertEqual(self.counters(), (5, 1))
+
+    def test_concurrent_deletes_decrement_once(self):
+        review = Review.objects.create(user=self.user, book=self.book, rating=4, comment='Good')
+        self.book.rating_sum, self.book.rating_count = 4, 1
+        self.book.save()
+
+        # Both requests loaded the review before either deleted it
+        with mock.patch.object(views, 'get_object_or_404', return_value=review):
+            self.client.get(reverse('delete_review', args=[review.pk]))
+            self.client.get(reverse('delete_review', args=[review.pk]))
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_admin_delete_after_owner_delete_leaves_counters_alone(self):
+        admin = User.objects.create_user('librarian', 'password123', role='admin')
+        review = Review.objects.create(user=self.user, book=self.book, rating=4, comment='Good')
+        self.book.rating_sum, self.book.rating_count = 4, 1
+        self.book.save()
+
+        request = RequestFactory().post(reverse('admin_delete_review', args=[review.pk]))
+        request.user = admin
+        request._messages = CookieStorage(request)
+        with mock.patch.object(book_views, 'get_object_or_404', return_value=review):
+            self.client.get(reverse('delete_review', args=[review.pk]))
+            book_views.admin_delete_review(request, review.pk)
+        self.assertEqual(self.counters(), (0, 0))
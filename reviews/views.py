@@ -1,7 +1,11 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from books.models import Book
+from books.counters import adjust_counters
+from analytics import events
+from analytics.models import Event
 from .models import Review
 
 
@@ -18,21 +22,30 @@ def add_review(request, book_id):
             messages.error(request, 'Please provide both rating and comment.')
             return redirect('book_detail', book_id=book_id)
         
-        # Check if user already reviewed this book
-        review, created = Review.objects.get_or_create(
-            user=request.user,
-            book=book,
-            defaults={'rating': int(rating), 'comment': comment}
-        )
+        with transaction.atomic():
+            # Check if user already reviewed this book
+            review, created = Review.objects.get_or_create(
+                user=request.user,
+                book=book,
+                defaults={'rating': int(rating), 'comment': comment}
+            )
+            
+            if not created:
+                # Update existing review, locked so concurrent edits see each other's rating
+                review = Review.objects.select_for_update().get(pk=review.pk)
+                old_rating = review.rating
+                review.rating = int(rating)
+                review.comment = comment
+                review.save()
+                adjust_counters(book.id, rating_sum=review.rating - old_rating)
+            else:
+                adjust_counters(book.id, rating_sum=review.rating, rating_count=1)
+                events.record(Event.REVIEW, book.id, request.user)
         
-        if not created:
-            # Update existing review
-            review.rating = int(rating)
-            review.comment = comment
-            review.save()
-            messages.success(request, 'Review updated successfully!')
-        else:
+        if created:
             messages.success(request, 'Review added successfully!')
+        else:
+            messages.success(request, 'Review updated successfully!')
     
     return redirect('book_detail', book_id=book_id)
 
@@ -47,9 +60,14 @@ def edit_review(request, review_id):
         comment = request.POST.get('comment')
         
         if rating and comment:
-            review.rating = int(rating)
-            review.comment = comment
-            review.save()
+            with transaction.atomic():
+                # Re-read under lock: the row fetched above may predate a concurrent edit
+                review = get_object_or_404(Review.objects.select_for_update(), id=review_id, user=request.user)
+                old_rating = review.rating
+                review.rating = int(rating)
+                review.comment = comment
+                review.save()
+                adjust_counters(review.book_id, rating_sum=review.rating - old_rating)
             messages.success(request, 'Review updated successfully!')
             return redirect('book_detail', book_id=review.book.id)
         else:
@@ -67,6 +85,11 @@ def delete_review(request, review_id):
     """Delete a review"""
     review = get_object_or_404(Review, id=review_id, user=request.user)
     book_id = review.book.id
-    review.delete()
+    with transaction.atomic():
+        # Rating as of the delete; a concurrent delete leaves nothing to count
+        rating = Review.objects.select_for_update().filter(pk=review.pk).values_list('rating', flat=True).first()
+        deleted, _ = Review.objects.filter(pk=review.pk).delete()
+        if deleted:
+            adjust_counters(book_id, rating_sum=-rating, rating_count=-1)
     messages.success(request, 'Review deleted successfully!')
     return redirect('book_detail', book_id=book_id)
@@ -0,0 +1,80 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+
+from taskqueue import queue
+
+logger = logging.getLogger(__name__)
+
+
+def _work(batch, poll_interval, once):
+    """Claim and run tasks until told to stop"""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    while not stopping:
+        close_old_connections()
+        try:
+            claimed = queue.claim(worker_id, limit=batch)
+        except OperationalError as e:
+            # e.g. SQLite busy under write contention; try again next poll
+            logger.warning(f"Worker {worker_id} could not claim tasks: {e}")
+            time.sleep(poll_interval)
+            continue
+        for task_obj in claimed:
+            # Tasks already claimed are finished before honouring a stop request
+            queue.execute(task_obj)
+        if not claimed:
+            if once:
+                break
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--batch', type=int, default=1, help='Tasks claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when no tasks are due')
+        parser.add_argument('--purge-done', type=int, metavar='DAYS', help='Delete finished tasks older than DAYS and exit')
+
+    def handle(self, *args, **options):
+        if options['purge_done'] is not None:
+            deleted = queue.purge(options['purge_done'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished tasks.'))
+            return
+
+        work_args = (options['batch'], options['poll_interval'], options['once'])
+        if options['processes'] <= 1:
+            _work(*work_args)
+            return
+
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+        workers = [multiprocessing.Process(target=_work, args=work_args) for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        # Forward SIGTERM so every child finishes its current task and exits
+        signal.signal(signal.SIGTERM, lambda signum, frame: [worker.terminate() for worker in workers])
+        self.stdout.write(f'Started {len(workers)} workers.')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # Children received the same SIGINT and finish their current task
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,163 @@
+"""
+Database-backed background task queue.
+
+Functions decorated with @task (in any app's tasks.py) can be queued with
+`func.enqueue(**kwargs)`, or in bulk with `func.enqueue_many(kwargs_list)`;
+`manage.py run_worker` picks them up. A claimed task
+is invisible to other workers until its visibility timeout
+(TASK_QUEUE_VISIBILITY_TIMEOUT) expires, so a worker that dies mid-task
+doesn't lose it. Failed tasks are retried with exponential backoff up to
+max_attempts times. Keyword arguments must be JSON-serialisable.
+"""
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def _setting(name, default):
+    return getattr(settings, f'TASK_QUEUE_{name}', default)
+
+
+def task(func=None, *, max_attempts=None):
+    """Register a function as a background task: @task or @task(max_attempts=3)"""
+    if func is None:
+        return partial(task, max_attempts=max_attempts)
+    name = f'{func.__module__}.{func.__name__}'
+    _registry[name] = func
+    func.task_name = name
+    func.max_attempts = max_attempts
+    func.enqueue = partial(enqueue, func)
+    func.enqueue_many = partial(enqueue_many, func)
+    return func
+
+
+def enqueue(func, delay=0, **kwargs):
+    """
+    Queue a registered task once the current transaction commits, so the
+    worker never sees rows that aren't visible yet. With TASK_QUEUE_EAGER the
+    task runs inline instead, for development without a worker.
+    """
+    enqueue_many(func, [kwargs], delay=delay)
+
+
+def enqueue_many(func, kwargs_list, delay=0):
+    """enqueue() once per kwargs dict, inserting all the tasks with one bulk_create()"""
+    name = func if isinstance(func, str) else func.task_name
+    if name not in _registry:
+        raise ValueError(f"Unknown task '{name}'")
+    kwargs_list = list(kwargs_list)
+    if _setting('EAGER', False):
+        transaction.on_commit(lambda: [_registry[name](**kwargs) for kwargs in kwargs_list])
+        return
+
+    max_attempts = getattr(_registry[name], 'max_attempts', None) or _setting('MAX_ATTEMPTS', 5)
+
+    def create():
+        run_at = timezone.now() + timedelta(seconds=delay)
+        Task.objects.bulk_create([
+            Task(name=name, kwargs=kwargs, max_attempts=max_attempts, run_at=run_at)
+            for kwargs in kwargs_list
+        ])
+    transaction.on_commit(create)
+
+
+def _available(now):
+    # Queued and due, or claimed by a worker whose visibility timeout ran out
+    return (
+        Q(status=Task.STATUS_QUEUED, run_at__lte=now)
+        | Q(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(worker_id, limit=1):
+    """Lease up to `limit` due tasks to this worker"""
+    now = timezone.now()
+    token = f'{worker_id}:{uuid.uuid4().hex[:8]}'
+    lease = {
+        'status': Task.STATUS_RUNNING,
+        'locked_by': token,
+        'locked_until': now + timedelta(seconds=_setting('VISIBILITY_TIMEOUT', 300)),
+        'attempts': F('attempts') + 1,
+    }
+    candidates = Task.objects.filter(_available(now)).order_by('run_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            if ids:
+                Task.objects.filter(id__in=ids).update(**lease)
+    else:
+        # SQLite: a single UPDATE ... WHERE id IN (SELECT ... LIMIT n) is atomic,
+        # and avoids upgrading a read transaction to a write lock, which fails
+        # immediately with "database is locked" when workers race.
+        Task.objects.filter(_available(now), id__in=candidates.values('id')[:limit]).update(**lease)
+    return list(Task.objects.filter(locked_by=token, status=Task.STATUS_RUNNING))
+
+
+def _finish(task_obj, **fields):
+    # Only the current lease holder may record the outcome
+    return Task.objects.filter(pk=task_obj.pk, locked_by=task_obj.locked_by).update(
+        locked_until=None, **fields
+    )
+
+
+def execute(task_obj):
+    """Run a claimed task and record the outcome. Returns True on success."""
+    func = _registry.get(task_obj.name)
+    if func is None:
+        _finish(task_obj, status=Task.STATUS_FAILED, last_error=f"Unknown task '{task_obj.name}'")
+        return False
+    if task_obj.attempts > task_obj.max_attempts:
+        # The last attempt's worker died or overran the visibility timeout
+        _finish(task_obj, status=Task.STATUS_FAILED, finished_at=timezone.now(),
+                last_error=task_obj.last_error or 'Visibility timeout expired on the final attempt')
+        return False
+
+    try:
+        func(**task_obj.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if task_obj.attempts >= task_obj.max_attempts:
+            logger.error(f"Task {task_obj.pk} {task_obj.name} failed permanently:\n{error}")
+            _finish(task_obj, status=Task.STATUS_FAILED, last_error=error, finished_at=timezone.now())
+        else:
+            backoff = _setting('RETRY_DELAY', 30) * 2 ** (task_obj.attempts - 1)
+            logger.warning(f"Task {task_obj.pk} {task_obj.name} failed, retrying in {backoff}s")
+            _finish(task_obj, status=Task.STATUS_QUEUED, last_error=error,
+                    run_at=timezone.now() + timedelta(seconds=backoff))
+        return False
+
+    _finish(task_obj, status=Task.STATUS_DONE, finished_at=timezone.now())
+    return True
+
+
+def run_pending(worker_id='inline', limit=None):
+    """Execute due tasks in this process until none are left. Returns the number run."""
+    count = 0
+    while limit is None or count < limit:
+        claimed = claim(worker_id)
+        if not claimed:
+            break
+        for task_obj in claimed:
+            execute(task_obj)
+            count += 1
+    return count
+
+
+def purge(older_than_days):
+    """Delete finished tasks older than the given number of days"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Task.objects.filter(status=Task.STATUS_DONE, finished_at__lt=cutoff).delete()
+    return deleted
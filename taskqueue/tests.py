@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from books.models import Book
+from .models import Task
+from . import queue
+
+calls = []
+
+
+@queue.task(max_attempts=2)
+def record_call(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+
+
+@override_settings(TASK_QUEUE_RETRY_DELAY=10, TASK_QUEUE_VISIBILITY_TIMEOUT=60)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def enqueue(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue(**kwargs)
+        return Task.objects.latest('id')
+
+    def test_task_runs_once_and_is_marked_done(self):
+        task_obj = self.enqueue(value=1)
+        self.assertEqual(task_obj.max_attempts, 2)
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(queue.run_pending(), 0)
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.STATUS_DONE)
+        self.assertEqual(calls, [1])
+
+    def test_failed_task_is_retried_with_backoff_then_fails(self):
+        task_obj = self.enqueue(value=1, fail=True)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            queue.run_pending()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.STATUS_QUEUED)
+        self.assertIn('boom', task_obj.last_error)
+        self.assertGreater(task_obj.run_at, timezone.now() + timedelta(seconds=5))
+
+        # Not due yet
+        self.assertEqual(queue.run_pending(), 0)
+        Task.objects.filter(pk=task_obj.pk).update(run_at=timezone.now())
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            queue.run_pending()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.STATUS_FAILED)
+        self.assertEqual(task_obj.attempts, 2)
+        self.assertEqual(calls, [1, 1])
+
+    def test_claimed_task_is_invisible_until_timeout_expires(self):
+        task_obj = self.enqueue(value=1)
+        [claimed] = queue.claim('worker-a')
+        self.assertEqual(queue.claim('worker-b'), [])
+
+        # worker-a died; once its lease runs out another worker takes over
+        Task.objects.filter(pk=task_obj.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [reclaimed] = queue.claim('worker-b')
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertTrue(queue.execute(reclaimed))
+        # The stale lease holder can no longer record an outcome
+        Task.objects.filter(pk=task_obj.pk).update(status=Task.STATUS_RUNNING)
+        queue.execute(claimed)
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.locked_by, reclaimed.locked_by)
+        self.assertEqual(task_obj.status, Task.STATUS_RUNNING)
+
+    def test_book_upload_queues_processing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Queued', author='A', description='d', category='Science', pdf_file='pdfs/q.pdf')
+        self.assertEqual(Task.objects.filter(name='books.tasks.process_book_upload', kwargs={'book_id': book.pk}).count(), 1)
+
+        # Saving without touching the files doesn't queue more work
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(pk=book.pk).save()
+        self.assertEqual(Task.objects.count(), 1)
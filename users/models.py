@@ -43,6 +43,9 @@ class User(AbstractBaseUser):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the user's purchases change; part of the entitlements
+    # cache key, so every process stops using its cached copy (payments/entitlements.py)
+    entitlements_version = models.PositiveIntegerField(default=0, editable=False)
     
     USERNAME_FIELD = 'userId'
     REQUIRED_FIELDS = []